@@ -0,0 +1,543 @@
+# benchmark.py
+"""
+Đo hiệu năng toàn bộ quy trình parse → embed → retrieve → rerank mà không gọi
+API thật: Gemini, OpenAI embedding và OpenAI chat được thay bằng các bản giả
+lập cục bộ, cho kết quả xác định (cùng đầu vào → cùng đầu ra).
+
+Ví dụ:
+    python benchmark.py --sizes 10,1000,100000 --e2e-max 200 --output bench.json
+
+Kết quả in ra (hoặc ghi vào --output) dạng JSON: với mỗi kích thước corpus là
+độ trễ p50/p95 (ms), throughput (đơn vị/giây) của từng bước và peak RSS.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+import numpy as np
+
+import reranker
+import resumeParser
+from cv_record_store import CVRecordStore
+from cv_serializer import estimate_tokens, section_token_estimates, serialize_cv
+from dedup import DuplicateIndex, text_signature
+from embedding_cache import CachedEmbedding, EmbeddingCache
+from local_scorer import LocalScorer
+from pipeline import EMBED_MODEL, Pipeline, create_embedding_chunks_from_json, create_embedding_content_from_json
+from resumeParser import (extract_text, extract_with_gemini, extract_with_gemini_batch, pack_batches, validate_json,
+                          validate_json_batch)
+from rerank_cache import RerankCache
+from search_engine import ExactSearchEngine, MultiVectorSearchEngine, chunk_id
+from skill_index import SkillIndex
+from vector_store import VectorStore
+
+SAMPLE_CV_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cv_folder")
+
+SKILL_VOCAB = [
+    "Python", "Java", "JavaScript", "TypeScript", "Go", "C++", "Django", "Flask",
+    "FastAPI", "Node.js", "Express.js", "React.js", "Next.js", "PostgreSQL", "MySQL",
+    "MongoDB", "Redis", "Docker", "Kubernetes", "AWS", "GCP", "Git", "Linux",
+    "RESTful API", "GraphQL", "Kafka", "TensorFlow", "PyTorch", "OpenCV", "Spark",
+]
+ROLES = ["Backend Developer", "Frontend Developer", "Data Engineer", "DevOps Engineer",
+         "Software Engineer", "ML Engineer", "QA Engineer", "Fullstack Developer"]
+ORGS = ["FPT Software", "Viettel", "VNG", "Tiki", "Shopee", "MoMo", "VinAI", "Grab"]
+FAMILY_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Vũ", "Đặng", "Bùi"]
+GIVEN_NAMES = ["An", "Bình", "Dũng", "Hà", "Hiếu", "Lan", "Minh", "Nam", "Quân", "Trang"]
+
+SAMPLE_JDS = [
+    "Tuyển dụng Senior Python Backend Developer. Ít nhất 4 năm kinh nghiệm Python, "
+    "Django hoặc Flask, RESTful API, PostgreSQL, Docker, AWS.",
+    "Frontend Developer: React.js, Next.js, TypeScript, 2 năm kinh nghiệm.",
+    "Data Engineer: Spark, Kafka, Python, AWS, 3 năm kinh nghiệm.",
+]
+
+EXPERIENCE_LINE = re.compile(r"^(.+?) at (.+?) \((\d{4}-\d{2}) - (\d{4}-\d{2}|Present)\)$")
+
+
+# ==============================================================================
+# DỮ LIỆU GIẢ LẬP
+# ==============================================================================
+def synthetic_resume_text(rng: random.Random, index: int) -> str:
+    """Sinh một CV dạng text (giống text trích xuất từ PDF) một cách xác định."""
+    name = f"{rng.choice(FAMILY_NAMES)} {rng.choice(GIVEN_NAMES)} {index}"
+    skills = rng.sample(SKILL_VOCAB, rng.randint(4, 12))
+    lines = [name, "Summary: Software engineer focused on building reliable systems.", "", "EXPERIENCE"]
+    year = 2024
+    for _ in range(rng.randint(0, 4)):
+        start = year - rng.randint(1, 3)
+        end = "Present" if year == 2024 else f"{year}-{rng.randint(1, 12):02d}"
+        lines.append(f"{rng.choice(ROLES)} at {rng.choice(ORGS)} ({start}-{rng.randint(1, 12):02d} - {end})")
+        for _ in range(rng.randint(1, 4)):
+            lines.append(f"- Developed {rng.choice(skills)} services and improved {rng.choice(skills)} pipelines for production workloads")
+        year = start
+    lines += ["", "SKILLS", ", ".join(skills), "", "LANGUAGES", "English - B2"]
+    return "\n".join(lines)
+
+
+def write_synthetic_pdf(path: str, text: str):
+    doc = resumeParser.fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 60), text, fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def build_cv_folder(folder: str, size: int, seed: int = 0):
+    """Thư mục CV gồm các CV mẫu trong cv_folder và các PDF sinh thêm cho đủ size file."""
+    os.makedirs(folder, exist_ok=True)
+    samples = sorted(f for f in os.listdir(SAMPLE_CV_FOLDER) if f.lower().endswith(".pdf"))
+    for filename in samples[:size]:
+        shutil.copy(os.path.join(SAMPLE_CV_FOLDER, filename), os.path.join(folder, filename))
+    rng = random.Random(seed)
+    for i in range(len(samples), size):
+        write_synthetic_pdf(os.path.join(folder, f"synthetic_{i:06d}.pdf"), synthetic_resume_text(rng, i))
+    backdate_files(folder)
+
+
+def backdate_files(folder: str, seconds: float = 60.0):
+    """Lùi mtime để cv_watcher coi các file là đã chép xong (không chờ settle_seconds)."""
+    past = time.time() - seconds
+    for filename in os.listdir(folder):
+        os.utime(os.path.join(folder, filename), (past, past))
+
+
+# ==============================================================================
+# BẢN GIẢ LẬP CỦA GEMINI, OPENAI EMBEDDING VÀ OPENAI CHAT
+# ==============================================================================
+BATCH_RESUME_BLOCK = re.compile(r"### RESUME (\S+)\n(.*?)\n### END RESUME \1", re.DOTALL)
+
+
+def fake_parse_resume_text(prompt: str) -> dict:
+    """Gemini giả: đọc lại các trường từ text do synthetic_resume_text sinh ra."""
+    resume_text = prompt.split("Resume text:", 1)[-1]
+    experiences = []
+    for line in resume_text.splitlines():
+        match = EXPERIENCE_LINE.match(line.strip())
+        if match:
+            experiences.append({
+                "role": match.group(1), "organization": match.group(2),
+                "start_date": match.group(3), "end_date": match.group(4),
+                "years": 0.0, "location": "", "highlights": [],
+            })
+    lowered = resume_text.lower()
+    name = next((line.strip() for line in resume_text.splitlines() if line.strip()), "")
+    return {
+        "name": name,
+        "summary": "",
+        "education": [],
+        "experiences": experiences,
+        "projects": [],
+        "skills": [s for s in SKILL_VOCAB if s.lower() in lowered],
+        "languages": ["English - B2"] if "english" in lowered else [],
+        "certifications": [], "awards": [], "activities": [], "publications": [], "licenses": [],
+    }
+
+
+class FakeGeminiModel:
+    latency = 0.0
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def generate_content(self, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        batch = BATCH_RESUME_BLOCK.findall(prompt.split("Resumes:", 1)[-1])
+        if batch:
+            parsed = [dict(fake_parse_resume_text(text), id=rid) for rid, text in batch]
+        else:
+            parsed = fake_parse_resume_text(prompt)
+        payload = json.dumps(parsed, ensure_ascii=False)
+        part = types.SimpleNamespace(text=payload)
+        candidate = types.SimpleNamespace(content=types.SimpleNamespace(parts=[part]))
+        return types.SimpleNamespace(candidates=[candidate], text=payload)
+
+
+def hashed_embedding(text: str, dim: int = 256) -> list:
+    """Embedding giả: bag-of-words băm vào dim chiều, đủ để similarity có ý nghĩa."""
+    vec = np.zeros(dim, dtype=np.float32)
+    for token in re.findall(r"\w[\w.+#]*", text.lower()):
+        h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+        vec[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    return vec.tolist()
+
+
+class FakeEmbedding:
+    latency = 0.0
+
+    def __init__(self, model=None, **kwargs):
+        self.model_name = model
+
+    def get_text_embedding_batch(self, texts, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return [hashed_embedding(t) for t in texts]
+
+    def get_query_embedding(self, query):
+        if self.latency:
+            time.sleep(self.latency)
+        return hashed_embedding(query)
+
+
+class _FakeChatCompletions:
+    latency = 0.0
+
+    async def create(self, model, messages, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        prompt = messages[-1]["content"]
+        jd_part, _, cv_part = prompt.partition("--- CV ---")
+        jd_lower, cv_lower = jd_part.lower(), cv_part.lower()
+        required = [s for s in SKILL_VOCAB if s.lower() in jd_lower]
+        matched = [s for s in required if s.lower() in cv_lower]
+        score = round(100 * len(matched) / len(required)) if required else 50
+        content = json.dumps({
+            "score": score,
+            "skills_checklist": {"matched_skills": matched,
+                                 "missing_skills": [s for s in required if s not in matched]},
+            "experience_match": "Phù hợp" if score >= 50 else "Không đủ kinh nghiệm",
+            "risk_points": [],
+            "rationale": "Đánh giá giả lập dựa trên số kỹ năng khớp với JD.",
+        }, ensure_ascii=False)
+        message = types.SimpleNamespace(content=content)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+class FakeAsyncOpenAI:
+    def __init__(self, **kwargs):
+        self.chat = types.SimpleNamespace(completions=_FakeChatCompletions())
+
+    async def close(self):
+        pass
+
+
+def install_stubs(llm_latency: float = 0.0, embed_latency: float = 0.0):
+    """Thay các client API thật bằng bản giả lập (chỉ trong tiến trình benchmark)."""
+    FakeGeminiModel.latency = llm_latency
+    _FakeChatCompletions.latency = llm_latency
+    FakeEmbedding.latency = embed_latency
+    resumeParser.gemini = types.SimpleNamespace(GenerativeModel=FakeGeminiModel)
+    reranker.AsyncOpenAI = FakeAsyncOpenAI
+
+
+# ==============================================================================
+# ĐO ĐẠC
+# ==============================================================================
+def summarize(samples_s: list, units: int = None) -> dict:
+    """samples_s: danh sách thời gian (giây) của từng lần gọi."""
+    if not samples_s:
+        return {"count": 0}
+    arr = np.asarray(samples_s) * 1000.0
+    total_s = float(np.sum(samples_s))
+    units = units if units is not None else len(samples_s)
+    return {
+        "count": len(samples_s),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "mean_ms": round(float(arr.mean()), 3),
+        "total_s": round(total_s, 4),
+        "throughput_per_s": round(units / total_s, 2) if total_s > 0 else None,
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def traced_alloc(fn):
+    """(kết quả, số byte còn được cấp phát sau khi fn chạy xong) đo bằng tracemalloc."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss tính bằng KB trên Linux, bằng byte trên macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 2)
+
+
+def bench_corpus(size: int, workdir: str, args) -> dict:
+    rng = random.Random(args.seed)
+    stages = {}
+
+    # --- Trích xuất text từ PDF (CV mẫu, lặp lại) ---
+    samples = sorted(os.path.join(SAMPLE_CV_FOLDER, f) for f in os.listdir(SAMPLE_CV_FOLDER)
+                     if f.lower().endswith(".pdf"))
+    times = [timed(extract_text, samples[i % len(samples)])[1] for i in range(min(size, args.extract_max))]
+    stages["extract_text_pdf"] = summarize(times)
+
+    # --- Gemini (giả lập) + validate_json ---
+    texts = [synthetic_resume_text(rng, i) for i in range(size)]
+    llm_times, validate_times, cv_database = [], [], []
+    for i, text in enumerate(texts):
+        raw, t_llm = timed(extract_with_gemini, text)
+        cv, t_val = timed(validate_json, raw)
+        cv["id"] = f"cv_{i:06d}"
+        llm_times.append(t_llm)
+        validate_times.append(t_val)
+        cv_database.append(cv)
+    stages["extract_with_gemini_stub"] = summarize(llm_times)
+    stages["validate_json"] = summarize(validate_times)
+    raw_outputs = [extract_with_gemini(text) for text in texts]
+    _, t_batch = timed(validate_json_batch, raw_outputs)
+    stages["validate_json_batch"] = summarize([t_batch], units=size)
+
+    # --- Chữ ký phát hiện CV trùng (SimHash + khoá liên hệ) và tra cứu bản trùng ---
+    signatures, times = [], []
+    for text in texts:
+        signature, t = timed(text_signature, text)
+        signatures.append(signature)
+        times.append(t)
+    stages["dedup_signature"] = summarize(times)
+    duplicate_index = DuplicateIndex(os.path.join(workdir, f"duplicates_{size}.json"))
+    for i, signature in enumerate(signatures):
+        duplicate_index.add(f"h{i}", signature)
+    stages["dedup_neighbours"] = summarize([timed(duplicate_index.neighbours, sig)[1] for sig in signatures[:500]])
+
+    # --- Gemini theo lô: nhiều CV trong một lệnh gọi (đã gồm validate_json) ---
+    batches = pack_batches(texts[:args.batch_max])
+    times = [timed(extract_with_gemini_batch, [texts[i] for i in batch])[1] for batch in batches]
+    stages["extract_with_gemini_batch_stub"] = summarize(times, units=min(size, args.batch_max))
+    stages["extract_with_gemini_batch_stub"]["calls"] = len(batches)
+
+    # --- Kho CV dạng cột: bộ nhớ, nạp lại từ đĩa, đọc theo id, duyệt toàn bộ ---
+    payloads = [json.dumps(cv, ensure_ascii=False) for cv in cv_database]
+    dicts, dict_bytes = traced_alloc(lambda: [json.loads(p) for p in payloads])
+    records_path = os.path.join(workdir, f"cv_records_{size}.npz")
+    record_store = CVRecordStore(records_path)
+    record_store.clear()
+    _, t_put = timed(record_store.put_many, [(cv["id"], cv) for cv in cv_database])
+    _, t_save = timed(record_store.save)
+    _, t_json = timed(lambda: [json.loads(p) for p in payloads])
+    reopened, t_open = timed(CVRecordStore, records_path)
+    _, reopened_bytes = traced_alloc(lambda: CVRecordStore(records_path))
+    sample_ids = [cv["id"] for cv in cv_database[:200]]
+    stages["cv_record_store_put"] = summarize([t_put], units=size)
+    stages["cv_record_store_save"] = summarize([t_save], units=size)
+    stages["cv_record_store_open"] = summarize([t_open], units=size)
+    stages["cv_json_reload"] = summarize([t_json], units=size)
+    stages["cv_record_store_load_by_id"] = summarize([timed(reopened.load, cv_id)[1] for cv_id in sample_ids])
+    _, t_scan = timed(lambda: list(reopened.scan(("skills", "languages", "experiences"))))
+    stages["cv_record_store_scan"] = summarize([t_scan], units=size)
+    stages["cv_record_store_open"]["memory_mb"] = round(reopened_bytes / 2**20, 2)
+    stages["cv_json_reload"]["memory_mb"] = round(dict_bytes / 2**20, 2)
+    stages["cv_record_store_open"]["file_mb"] = round(os.path.getsize(records_path) / 2**20, 2)
+    del dicts, reopened
+
+    # --- Nội dung embedding ---
+    contents, times = [], []
+    for cv in cv_database:
+        content, t = timed(create_embedding_content_from_json, cv)
+        contents.append(content)
+        times.append(t)
+    stages["create_embedding_content_from_json"] = summarize(times)
+
+    # --- Đồng bộ chỉ mục vector (lần đầu: embed tất cả; lần sau: không đổi gì) ---
+    embed_model = FakeEmbedding(model=EMBED_MODEL)
+    store = VectorStore(os.path.join(workdir, f"index_{size}"), model=EMBED_MODEL)
+    items = [(cv["id"], content) for cv, content in zip(cv_database, contents)]
+    _, t_cold = timed(store.sync, items, embed_model.get_text_embedding_batch)
+    _, t_warm = timed(store.sync, items, embed_model.get_text_embedding_batch)
+    stages["index_sync_cold"] = summarize([t_cold], units=size)
+    stages["index_sync_warm"] = summarize([t_warm], units=size)
+
+    # --- Cache embedding (lần đầu: embed tất cả; lần sau: đọc từ SQLite) ---
+    cached_model = CachedEmbedding(embed_model, EmbeddingCache(os.path.join(workdir, f"embeddings_{size}.sqlite3")),
+                                   EMBED_MODEL)
+    _, t_cold = timed(cached_model.get_text_embedding_batch, contents)
+    _, t_warm = timed(cached_model.get_text_embedding_batch, contents)
+    stages["embedding_cache_cold"] = summarize([t_cold], units=size)
+    stages["embedding_cache_warm"] = summarize([t_warm], units=size)
+    jds = [f"{SAMPLE_JDS[i % len(SAMPLE_JDS)]} #{i}" for i in range(args.queries)]
+    calls_before = cached_model.backend_calls["query"]
+    _, t_queries = timed(cached_model.get_query_embedding_batch, jds)
+    # N JD chưa có trong cache phải đi chung một lệnh gọi xuống model
+    assert cached_model.backend_calls["query"] - calls_before == 1, cached_model.backend_calls
+    stages["embedding_cache_query_batch"] = summarize([t_queries], units=len(jds))
+
+    # --- Truy xuất top-k ---
+    queries = [embed_model.get_query_embedding(SAMPLE_JDS[i % len(SAMPLE_JDS)]) for i in range(args.queries)]
+    stages["retrieve_top_k"] = summarize([timed(store.query, q, args.top_k)[1] for q in queries])
+    fp16_engine = ExactSearchEngine(store, dtype=np.float16)
+    stages["retrieve_top_k_fp16"] = summarize([timed(fp16_engine.search, q, args.top_k)[1] for q in queries])
+    _, t_batch = timed(ExactSearchEngine(store).search_batch, queries, args.top_k)
+    stages["retrieve_top_k_batch"] = summarize([t_batch], units=len(queries))
+
+    # --- Chỉ mục nhiều vector: mỗi mục của CV một vector, điểm gộp theo ứng viên ---
+    chunk_items, times = [], []
+    for cv in cv_database:
+        chunks, t = timed(create_embedding_chunks_from_json, cv)
+        chunk_items += [(chunk_id(cv["id"], i), text) for i, text in enumerate(chunks)]
+        times.append(t)
+    stages["create_embedding_chunks_from_json"] = summarize(times)
+    stages["create_embedding_chunks_from_json"]["chunks_per_cv"] = round(len(chunk_items) / size, 2)
+    chunk_store = VectorStore(os.path.join(workdir, f"chunk_index_{size}"), model=EMBED_MODEL)
+    _, t_cold = timed(chunk_store.sync, chunk_items, embed_model.get_text_embedding_batch)
+    stages["chunk_index_sync_cold"] = summarize([t_cold], units=size)
+    for aggregate in ("max", "mean_top"):
+        engine = MultiVectorSearchEngine(chunk_store, aggregate=aggregate)
+        engine.search(queries[0], args.top_k)  # dựng bảng đoạn theo CV trước khi đo
+        stages[f"retrieve_top_k_multivector_{aggregate}"] = summarize(
+            [timed(engine.search, q, args.top_k)[1] for q in queries])
+
+    # --- Tầng sàng lọc cục bộ: chấm điểm pool 200 ứng viên, chỉ top-k được gửi tới LLM ---
+    cv_by_id = {cv["id"]: cv for cv in cv_database}
+    skill_index = SkillIndex(cv_database)
+    scorer = LocalScorer(pool_size=200)
+    times, survivors = [], []
+    for i, q in enumerate(queries):
+        pool = [(cv_by_id[cv_id], score) for cv_id, score in store.query(q, scorer.pool(args.top_k))]
+        selected, t = timed(scorer.select, skill_index, SAMPLE_JDS[i % len(SAMPLE_JDS)], pool, args.top_k)
+        times.append(t)
+        survivors.append(len(selected))
+    stages["local_scorer_select"] = summarize(times)
+    stages["local_scorer_select"]["pool"] = min(scorer.pool_size, size)
+    stages["local_scorer_select"]["mean_survivors"] = round(float(np.mean(survivors)), 2)
+
+    # --- Kích thước CV trong prompt re-rank: json.dumps(indent=2) so với bản gọn ---
+    sample = cv_database[:200]
+    prompt_tokens = {
+        "cv_json_indent": round(float(np.mean([estimate_tokens(json.dumps(cv, indent=2, ensure_ascii=False))
+                                               for cv in sample])), 1),
+        "cv_compact": round(float(np.mean([estimate_tokens(serialize_cv(cv)) for cv in sample])), 1),
+    }
+    sections = {}
+    for cv in sample:
+        for key, tokens in section_token_estimates(cv).items():
+            sections[key] = sections.get(key, 0) + tokens
+    prompt_tokens["cv_compact_sections"] = {k: round(v / len(sample), 1) for k, v in sections.items()}
+
+    # --- Re-rank bằng LLM (giả lập) ---
+    times = []
+    for i, q in enumerate(queries[:args.rerank_queries]):
+        retrieved = [(cv_by_id[cv_id], score) for cv_id, score in store.query(q, args.top_k)]
+        times.append(timed(reranker.rerank_candidates, SAMPLE_JDS[i % len(SAMPLE_JDS)], retrieved)[1])
+    stages["rerank"] = summarize(times)
+
+    # --- Re-rank với cache kết quả: lượt đầu gọi LLM, lượt sau đọc từ SQLite ---
+    rerank_cache = RerankCache(os.path.join(workdir, f"rerank_{size}.sqlite3"))
+    times = {False: [], True: []}
+    for warm in (False, True):
+        for i, q in enumerate(queries[:args.rerank_queries]):
+            retrieved = [(cv_by_id[cv_id], score) for cv_id, score in store.query(q, args.top_k)]
+            times[warm].append(timed(reranker.rerank_candidates, SAMPLE_JDS[i % len(SAMPLE_JDS)], retrieved,
+                                     cache=rerank_cache)[1])
+    stages["rerank_cache_cold"] = summarize(times[False])
+    stages["rerank_cache_warm"] = summarize(times[True])
+
+    # --- Toàn bộ find_best_candidates trên thư mục PDF ---
+    e2e_size = min(size, args.e2e_max)
+    if e2e_size:
+        folder = os.path.join(workdir, f"cv_folder_{e2e_size}")
+        if not os.path.isdir(folder):
+            build_cv_folder(folder, e2e_size, seed=args.seed)
+        cache_dir = os.path.join(workdir, f"e2e_cache_{e2e_size}")
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        matcher = Pipeline(folder, cache_dir=cache_dir,
+                           embed_model=FakeEmbedding(model=EMBED_MODEL), chat_client=FakeAsyncOpenAI())
+        _, t_warm_up = timed(matcher.warm_up)
+        stages["pipeline_warm_up"] = summarize([t_warm_up], units=1)
+        # CV tổng hợp không nhắm tới JD mẫu nên tắt lọc yêu cầu cứng: mỗi lượt phải
+        # thực sự đi qua retrieval, sàng lọc cục bộ và re-rank
+        def find(jd):
+            results = matcher.find_best_candidates(jd, args.top_k, prefilter=False)
+            if not results:
+                raise RuntimeError(f"find_best_candidates không trả về ứng viên nào (corpus {e2e_size} CV)")
+            return results
+
+        results, t_cold = timed(find, SAMPLE_JDS[0])
+        warm = [timed(find, SAMPLE_JDS[i % len(SAMPLE_JDS)])[1] for i in range(args.e2e_repeats)]
+
+        # --- Cập nhật tăng dần: quét khi thư mục không đổi, và khi có một CV mới ---
+        noop = [timed(matcher.refresh)[1] for _ in range(args.e2e_repeats)]
+        new_file = os.path.join(folder, "incoming_cv.pdf")
+        write_synthetic_pdf(new_file, synthetic_resume_text(random.Random(args.seed + 1), e2e_size))
+        backdate_files(folder)
+        _, t_added = timed(matcher.refresh)
+        os.remove(new_file)
+        _, t_deleted = timed(matcher.refresh)
+        matcher.close()
+        stages["refresh_unchanged"] = summarize(noop)
+        stages["refresh_unchanged"]["corpus_files"] = e2e_size
+        stages["refresh_one_added"] = summarize([t_added], units=1)
+        stages["refresh_one_deleted"] = summarize([t_deleted], units=1)
+        stages["find_best_candidates_cold"] = summarize([t_cold], units=1)
+        stages["find_best_candidates_warm"] = summarize(warm)
+        stages["find_best_candidates_cold"]["corpus_files"] = e2e_size
+        stages["find_best_candidates_cold"]["candidates"] = len(results)
+
+    return {"corpus_size": size, "stages": stages, "prompt_tokens_est": prompt_tokens, "peak_rss_mb": peak_rss_mb()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parse → embed → retrieve → rerank (offline stubs)")
+    parser.add_argument("--sizes", default="10,100,1000", help="Các kích thước corpus, cách nhau bởi dấu phẩy")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=50, help="Số truy vấn retrieval mỗi corpus")
+    parser.add_argument("--rerank-queries", type=int, default=5)
+    parser.add_argument("--extract-max", type=int, default=30, help="Số lần trích xuất PDF tối đa mỗi corpus")
+    parser.add_argument("--batch-max", type=int, default=2000, help="Số CV tối đa cho bước Gemini theo lô")
+    parser.add_argument("--e2e-max", type=int, default=100, help="Số file PDF tối đa cho find_best_candidates")
+    parser.add_argument("--e2e-repeats", type=int, default=3)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Độ trễ giả lập của mỗi lần gọi LLM")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Độ trễ giả lập của mỗi lần gọi embedding")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Ghi kết quả JSON vào file thay vì in ra stdout")
+    args = parser.parse_args(argv)
+
+    install_stubs(args.llm_latency_ms / 1000.0, args.embed_latency_ms / 1000.0)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    workdir = tempfile.mkdtemp(prefix="resume_bench_")
+    cwd = os.getcwd()
+    runs = []
+    try:
+        # Cache parse dùng đường dẫn tương đối: chạy trong thư mục tạm để không đụng cache thật
+        os.chdir(workdir)
+        for size in sizes:
+            # Log của pipeline in ra stderr để stdout chỉ còn JSON kết quả
+            stdout, sys.stdout = sys.stdout, sys.stderr
+            try:
+                runs.append(bench_corpus(size, workdir, args))
+            finally:
+                sys.stdout = stdout
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "runs": runs,
+    }
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+# cv_record_store.py
+
+import json
+import os
+import threading
+import zlib
+from array import array
+
+import numpy as np
+
+from cv_serializer import compact_json
+
+DEFAULT_PATH = os.path.join(".cache", "cv_records.npz")
+# Bump khi bố cục file thay đổi (file cũ bị bỏ qua, CV được nạp lại từ cache parse)
+FORMAT_VERSION = 1
+# save() dồn lại các cột khi số dòng đã xoá/thay thế vượt tỉ lệ này
+COMPACT_RATIO = 0.25
+
+# Thứ tự khoá của validate_json, giữ nguyên khi dựng lại CV
+CV_KEYS = ("name", "summary", "education", "experiences", "projects", "skills", "languages",
+           "certifications", "awards", "activities", "publications", "licenses")
+EXPERIENCE_KEYS = ("role", "organization", "years", "location", "highlights")
+PROJECT_KEYS = ("role", "highlights")
+ACTIVITY_KEYS = ("role", "organization", "years", "highlights")
+# Các mục có highlights, theo thứ tự lưu trong blob highlights
+HIGHLIGHT_SECTIONS = ("experiences", "projects", "activities")
+# Các mục ít dùng khi tìm kiếm, lưu chung một blob JSON nén
+EXTRA_KEYS = ("education", "certifications", "awards", "publications", "licenses")
+
+# Tên cột → kiểu phần tử của array. Cột *_off là offset (CSR): phần tử của dòng i
+# nằm trong [off[i], off[i+1]) của cột tương ứng.
+COLUMNS = {
+    "alive": "B", "raw": "B", "id": "I", "name": "I", "summary": "I",
+    "skill_off": "I", "skill": "I",
+    "lang_off": "I", "lang": "I",
+    "exp_off": "I", "exp_role": "I", "exp_org": "I", "exp_loc": "I", "exp_years": "d",
+    "proj_off": "I", "proj_role": "I",
+    "act_off": "I", "act_role": "I", "act_org": "I", "act_years": "d",
+    "hl_off": "Q", "hl": "B",
+    "extra_off": "Q", "extra": "B",
+}
+
+
+def _pack(obj) -> bytes:
+    return zlib.compress(compact_json(obj).encode("utf-8"))
+
+
+def _unpack(blob: bytes):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def _is_str_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+def _entries_match(entries, keys) -> bool:
+    """Mọi mục có đúng các khoá của validate_json, chuỗi là str và years là float."""
+    if not isinstance(entries, list):
+        return False
+    for entry in entries:
+        if not isinstance(entry, dict) or tuple(entry) != keys:
+            return False
+        for key in keys:
+            value = entry[key]
+            if key == "years":
+                if type(value) is not float:
+                    return False
+            elif key == "highlights":
+                if not _is_str_list(value):
+                    return False
+            elif not isinstance(value, str):
+                return False
+    return True
+
+
+def _is_columnar(cv: dict) -> bool:
+    """CV có đúng dạng đầu ra của validate_json (ngược lại được lưu nguyên dạng JSON)."""
+    return (tuple(cv) == CV_KEYS
+            and isinstance(cv["name"], str) and isinstance(cv["summary"], str)
+            and _is_str_list(cv["skills"]) and _is_str_list(cv["languages"])
+            and _entries_match(cv["experiences"], EXPERIENCE_KEYS)
+            and _entries_match(cv["projects"], PROJECT_KEYS)
+            and _entries_match(cv["activities"], ACTIVITY_KEYS))
+
+
+# ==============================================================================
+# BẢNG CHUỖI DÙNG CHUNG (INTERNING)
+# ==============================================================================
+class StringPool:
+    """Mỗi chuỗi khác nhau (kỹ năng, tên công ty, vai trò...) chỉ lưu một lần, tham chiếu bằng số nguyên."""
+
+    def __init__(self, strings=()):
+        self.strings = list(strings)
+        self._index = {s: i for i, s in enumerate(self.strings)}
+
+    def intern(self, s: str) -> int:
+        i = self._index.get(s)
+        if i is None:
+            i = len(self.strings)
+            self.strings.append(s)
+            self._index[s] = i
+        return i
+
+    def __len__(self):
+        return len(self.strings)
+
+    def to_arrays(self):
+        encoded = [s.encode("utf-8") for s in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+    @classmethod
+    def from_arrays(cls, data, offsets):
+        blob = data.tobytes()
+        bounds = offsets.tolist()
+        return cls(blob[start:end].decode("utf-8") for start, end in zip(bounds[:-1], bounds[1:]))
+
+
+# ==============================================================================
+# KHO CV ĐÃ PARSE DẠNG CỘT (LƯU TRÊN ĐĨA, NẠP NHANH)
+# ==============================================================================
+class CVRecordStore:
+    """
+    Lưu đầu ra của validate_json theo cột thay vì list các dict lồng nhau:
+    - tên, tóm tắt, kỹ năng, ngôn ngữ, vai trò, tổ chức, địa điểm: số nguyên trỏ
+      vào StringPool (kỹ năng/công ty lặp lại giữa hàng nghìn CV chỉ lưu một lần)
+    - số năm kinh nghiệm: array float64, danh sách theo dòng dùng offset (CSR)
+    - highlights: một blob JSON nén mỗi CV, chỉ giải nén khi cần (load)
+    - education, certifications, awards, publications, licenses: blob JSON nén
+    CV không đúng dạng chuẩn (ví dụ LLM trả về kiểu lạ) được lưu nguyên dạng
+    JSON để load() luôn trả về đúng dữ liệu đã put().
+    Xoá/thay thế chỉ đánh dấu dòng cũ; save() dồn lại khi có nhiều dòng chết.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.strings = StringPool()
+        self._cols = {name: array(typecode) for name, typecode in COLUMNS.items()}
+        for name, column in self._cols.items():
+            if name.endswith("_off"):
+                column.append(0)
+        self._ids = []
+        self._row_of = {}
+        self._dead = 0
+
+    # --------------------------------------------------------------------------
+    # Đọc / ghi file
+    # --------------------------------------------------------------------------
+    def _load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as npz:
+                if int(npz["format_version"][0]) != FORMAT_VERSION:
+                    return
+                strings = StringPool.from_arrays(npz["strings"], npz["strings_off"])
+                cols = {}
+                for name, typecode in COLUMNS.items():
+                    column = array(typecode)
+                    column.frombytes(npz[name].tobytes())
+                    cols[name] = column
+        except (OSError, ValueError, KeyError):
+            return
+        self.strings, self._cols = strings, cols
+        self._ids = [strings.strings[ref] for ref in cols["id"]]
+        self._row_of = {cv_id: row for row, cv_id in enumerate(self._ids) if cols["alive"][row]}
+        self._dead = len(self._ids) - len(self._row_of)
+
+    def save(self):
+        with self._lock:
+            if self._dead > COMPACT_RATIO * max(1, len(self._ids)):
+                self.compact()
+            strings, strings_off = self.strings.to_arrays()
+            arrays = {name: np.frombuffer(column, dtype=column.typecode) if len(column) else
+                      np.zeros(0, dtype=column.typecode) for name, column in self._cols.items()}
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, format_version=np.array([FORMAT_VERSION]), strings=strings,
+                         strings_off=strings_off, **arrays)
+            os.replace(tmp_path, self.path)
+
+    def compact(self):
+        """Dựng lại các cột chỉ với dòng còn sống (bỏ luôn chuỗi không còn được dùng)."""
+        with self._lock:
+            records = [(cv_id, self._decode(row)) for cv_id, row in self._row_of.items()]
+            self._reset()
+            for cv_id, cv_data in records:
+                self._append(cv_id, cv_data)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    # --------------------------------------------------------------------------
+    # Thêm / xoá
+    # --------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._row_of)
+
+    def __contains__(self, cv_id):
+        return cv_id in self._row_of
+
+    def ids(self) -> list:
+        return list(self._row_of)
+
+    def put(self, cv_id: str, cv_data: dict):
+        """Thêm hoặc thay thế CV (khoá "id" trong cv_data, nếu có, được bỏ qua)."""
+        with self._lock:
+            self.delete(cv_id)
+            self._append(cv_id, {k: v for k, v in cv_data.items() if k != "id"})
+
+    def put_many(self, items):
+        """items: danh sách (cv_id, cv_data)."""
+        with self._lock:
+            for cv_id, cv_data in items:
+                self.put(cv_id, cv_data)
+
+    def delete(self, cv_id: str) -> bool:
+        with self._lock:
+            row = self._row_of.pop(cv_id, None)
+            if row is None:
+                return False
+            self._cols["alive"][row] = 0
+            self._dead += 1
+            return True
+
+    def _append(self, cv_id: str, cv: dict):
+        c, intern = self._cols, self.strings.intern
+        columnar = _is_columnar(cv)
+        self._row_of[cv_id] = len(self._ids)
+        self._ids.append(cv_id)
+        c["id"].append(intern(cv_id))
+        c["alive"].append(1)
+        c["raw"].append(0 if columnar else 1)
+        if columnar:
+            c["name"].append(intern(cv["name"]))
+            c["summary"].append(intern(cv["summary"]))
+            c["skill"].extend(intern(s) for s in cv["skills"])
+            c["lang"].extend(intern(s) for s in cv["languages"])
+            for exp in cv["experiences"]:
+                c["exp_role"].append(intern(exp["role"]))
+                c["exp_org"].append(intern(exp["organization"]))
+                c["exp_loc"].append(intern(exp["location"]))
+                c["exp_years"].append(exp["years"])
+            for proj in cv["projects"]:
+                c["proj_role"].append(intern(proj["role"]))
+            for act in cv["activities"]:
+                c["act_role"].append(intern(act["role"]))
+                c["act_org"].append(intern(act["organization"]))
+                c["act_years"].append(act["years"])
+            highlights = [[entry["highlights"] for entry in cv[section]] for section in HIGHLIGHT_SECTIONS]
+            if any(h for section in highlights for h in section):
+                c["hl"].frombytes(_pack(highlights))
+            c["extra"].frombytes(_pack([cv[key] for key in EXTRA_KEYS]))
+        else:
+            c["name"].append(intern(""))
+            c["summary"].append(intern(""))
+            c["extra"].frombytes(_pack(cv))
+        for prefix, column in (("skill", "skill"), ("lang", "lang"), ("exp", "exp_role"),
+                               ("proj", "proj_role"), ("act", "act_role"), ("hl", "hl"), ("extra", "extra")):
+            c[prefix + "_off"].append(len(c[column]))
+
+    # --------------------------------------------------------------------------
+    # Đọc
+    # --------------------------------------------------------------------------
+    def _span(self, prefix: str, row: int):
+        offsets = self._cols[prefix + "_off"]
+        return offsets[row], offsets[row + 1]
+
+    def _blob(self, name: str, row: int) -> bytes:
+        start, end = self._span(name, row)
+        return self._cols[name][start:end].tobytes()
+
+    def _decode(self, row: int, fields=None, highlights: bool = True) -> dict:
+        c, s = self._cols, self.strings.strings
+        wanted = CV_KEYS if fields is None else [key for key in CV_KEYS if key in fields]
+        if c["raw"][row]:
+            cv = _unpack(self._blob("extra", row))
+            return {key: cv[key] for key in cv if fields is None or key in fields}
+
+        hl = None
+        if highlights and any(section in wanted for section in HIGHLIGHT_SECTIONS):
+            blob = self._blob("hl", row)
+            hl = _unpack(blob) if blob else None
+        extras = None
+        if any(key in wanted for key in EXTRA_KEYS):
+            extras = dict(zip(EXTRA_KEYS, _unpack(self._blob("extra", row))))
+
+        def entries(section, prefix, build):
+            start, end = self._span(prefix, row)
+            items = []
+            for i, j in enumerate(range(start, end)):
+                item = build(j)
+                if highlights:
+                    item["highlights"] = hl[HIGHLIGHT_SECTIONS.index(section)][i] if hl else []
+                items.append(item)
+            return items
+
+        cv = {}
+        for key in wanted:
+            if key == "name":
+                cv[key] = s[c["name"][row]]
+            elif key == "summary":
+                cv[key] = s[c["summary"][row]]
+            elif key == "skills":
+                start, end = self._span("skill", row)
+                cv[key] = [s[ref] for ref in c["skill"][start:end]]
+            elif key == "languages":
+                start, end = self._span("lang", row)
+                cv[key] = [s[ref] for ref in c["lang"][start:end]]
+            elif key == "experiences":
+                cv[key] = entries(key, "exp", lambda j: {
+                    "role": s[c["exp_role"][j]], "organization": s[c["exp_org"][j]],
+                    "years": c["exp_years"][j], "location": s[c["exp_loc"][j]]})
+            elif key == "projects":
+                cv[key] = entries(key, "proj", lambda j: {"role": s[c["proj_role"][j]]})
+            elif key == "activities":
+                cv[key] = entries(key, "act", lambda j: {
+                    "role": s[c["act_role"][j]], "organization": s[c["act_org"][j]],
+                    "years": c["act_years"][j]})
+            else:
+                cv[key] = extras[key]
+        return cv
+
+    def load(self, cv_id: str, highlights: bool = True):
+        """CV đầy đủ (kèm "id") như lúc put(), hoặc None nếu không có.
+        highlights=False: bỏ qua giải nén highlights (các mục không có khoá "highlights")."""
+        with self._lock:
+            row = self._row_of.get(cv_id)
+            if row is None:
+                return None
+            cv = self._decode(row, highlights=highlights)
+        cv["id"] = cv_id
+        return cv
+
+    def load_many(self, cv_ids, highlights: bool = True) -> list:
+        """Danh sách CV theo đúng thứ tự cv_ids (None cho id không có)."""
+        return [self.load(cv_id, highlights) for cv_id in cv_ids]
+
+    def scan(self, fields=None, highlights: bool = False):
+        """
+        Duyệt mọi CV, chỉ dựng các trường trong fields (mặc định tất cả), kèm "id".
+        Mặc định không giải nén highlights, ví dụ để dựng SkillIndex:
+        store.scan(("skills", "languages", "experiences")).
+        """
+        for cv_id in self.ids():
+            with self._lock:
+                # Tra lại dòng mỗi lần: CV có thể vừa bị xoá hoặc các cột vừa được dồn lại
+                row = self._row_of.get(cv_id)
+                if row is None:
+                    continue
+                cv = self._decode(row, fields, highlights)
+            cv["id"] = cv_id
+            yield cv
+
+    def nbytes(self) -> int:
+        """Kích thước ước lượng của dữ liệu (cột + bảng chuỗi), không tính overhead của Python."""
+        columns = sum(column.itemsize * len(column) for column in self._cols.values())
+        return columns + sum(len(s.encode("utf-8")) for s in self.strings.strings)
+
+    def stats(self) -> dict:
+        return {"records": len(self), "rows": len(self._ids), "strings": len(self.strings),
+                "bytes": self.nbytes()}
@@ -0,0 +1,121 @@
+# cv_serializer.py
+
+import json
+import math
+import os
+import re
+
+# Ngân sách token cho toàn bộ highlights của một CV khi gửi cho LLM
+DEFAULT_HIGHLIGHT_TOKENS = int(os.getenv("CV_HIGHLIGHT_TOKENS", "600"))
+# Ước lượng thô: khoảng 4 ký tự một token với văn bản tiếng Anh
+CHARS_PER_TOKEN = 4
+# Các trường nội bộ, không có ý nghĩa với LLM
+INTERNAL_KEYS = ("id",)
+HIGHLIGHT_SECTIONS = ("experiences", "projects", "activities")
+# Bump khi cách serialize thay đổi (đi vào phiên bản prompt của reranker)
+SERIALIZER_VERSION = 1
+
+_SPACES = re.compile(r"[ \t\u00a0]+")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def compact_json(obj) -> str:
+    """JSON không thụt lề, không khoảng trắng thừa."""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def compact_text(text: str) -> str:
+    """Gộp khoảng trắng liên tiếp và dòng trống thừa (text trích từ PDF có rất nhiều)."""
+    lines = (_SPACES.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n", "\n".join(lines)).strip()
+
+
+def _is_empty(value) -> bool:
+    return value is None or value == "" or value == [] or value == {} or (
+        isinstance(value, (int, float)) and not isinstance(value, bool) and value == 0)
+
+
+def _prune(value):
+    """Bỏ đệ quy các giá trị rỗng ("" / [] / {} / 0.0) và phần tử trùng lặp trong list."""
+    if isinstance(value, dict):
+        pruned = {}
+        for k, v in value.items():
+            v = _prune(v)
+            if not _is_empty(v):
+                pruned[k] = v
+        return pruned
+    if isinstance(value, list):
+        items, seen = [], set()
+        for item in value:
+            item = _prune(item)
+            if _is_empty(item):
+                continue
+            key = item.strip().lower() if isinstance(item, str) else compact_json(item)
+            if key in seen:
+                continue
+            seen.add(key)
+            items.append(item)
+        return items
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def _trim_highlights(cv: dict, budget: int):
+    """
+    Giữ highlights trong ngân sách token, chọn xoay vòng: highlight đầu tiên của
+    mọi mục trước, rồi đến highlight thứ hai... để mục nào cũng còn nội dung.
+    """
+    entries = [entry for section in HIGHLIGHT_SECTIONS for entry in cv.get(section, [])
+               if entry.get("highlights")]
+    kept = [[] for _ in entries]
+    used, depth = 0, 0
+    while True:
+        progressed = False
+        for i, entry in enumerate(entries):
+            if depth >= len(entry["highlights"]):
+                continue
+            progressed = True
+            cost = estimate_tokens(entry["highlights"][depth])
+            if used + cost > budget:
+                continue
+            kept[i].append(entry["highlights"][depth])
+            used += cost
+        if not progressed:
+            break
+        depth += 1
+    for entry, highlights in zip(entries, kept):
+        if highlights:
+            entry["highlights"] = highlights
+        else:
+            del entry["highlights"]
+
+
+def compact_cv(cv_data: dict, highlight_tokens: int = DEFAULT_HIGHLIGHT_TOKENS) -> dict:
+    """
+    Bản rút gọn của CV (đầu ra validate_json) để đưa vào prompt:
+    - bỏ trường nội bộ (id) và mọi giá trị rỗng, ví dụ mục education mặc định
+    - bỏ phần tử trùng lặp (không phân biệt hoa thường với chuỗi)
+    - cắt highlights cho vừa highlight_tokens token (None: không cắt)
+    """
+    cv = _prune({k: v for k, v in cv_data.items() if k not in INTERNAL_KEYS})
+    if highlight_tokens is not None:
+        _trim_highlights(cv, highlight_tokens)
+    return cv
+
+
+def serialize_cv(cv_data: dict, highlight_tokens: int = DEFAULT_HIGHLIGHT_TOKENS) -> str:
+    """Chuỗi JSON gọn của CV để gửi cho LLM (thay cho json.dumps(indent=2))."""
+    return compact_json(compact_cv(cv_data, highlight_tokens))
+
+
+def section_token_estimates(cv_data: dict, highlight_tokens: int = DEFAULT_HIGHLIGHT_TOKENS) -> dict:
+    """Ước lượng số token của từng mục trong bản serialize gọn, kèm "total"."""
+    cv = compact_cv(cv_data, highlight_tokens)
+    estimates = {key: estimate_tokens(compact_json({key: value})) for key, value in cv.items()}
+    estimates["total"] = estimate_tokens(compact_json(cv))
+    return estimates
@@ -0,0 +1,159 @@
+# cv_watcher.py
+
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+from parse_cache import file_content_hash
+
+# Khoảng thời gian (giây) giữa hai lần quét thư mục CV của FolderWatcher
+DEFAULT_POLL_INTERVAL = float(os.getenv("CV_WATCH_INTERVAL", "2"))
+# File vừa được ghi trong khoảng này (giây) coi như đang copy dở, để lần quét sau
+DEFAULT_SETTLE_SECONDS = float(os.getenv("CV_WATCH_SETTLE_SECONDS", "1"))
+
+# Trạng thái của một file ở lần xử lý trước
+FileState = namedtuple("FileState", ["size", "mtime_ns", "content_hash"])
+# Các file đã thay đổi kể từ lần xử lý trước (danh sách tên file, đã sắp xếp)
+FolderChanges = namedtuple("FolderChanges", ["added", "modified", "deleted"])
+# Trạng thái hiện tại của một thư mục: tập id CV, kho CV (CVRecordStore) và SkillIndex
+CatalogSnapshot = namedtuple("CatalogSnapshot", ["ids", "records", "skill_index"])
+
+
+# ==============================================================================
+# MANIFEST: ẢNH CHỤP THƯ MỤC CV (TÊN FILE → KÍCH THƯỚC, MTIME, HASH NỘI DUNG)
+# ==============================================================================
+class Manifest:
+    """
+    Trạng thái thư mục CV ở lần xử lý trước, lưu trong một file JSON.
+    scan() chỉ gọi stat cho từng file; nội dung chỉ được băm lại khi kích thước
+    hoặc mtime khác đi. File bị "touch" mà nội dung không đổi không được coi là
+    đã sửa. files chỉ được ghi đè sau khi thay đổi đã xử lý xong, nên nếu tiến
+    trình dừng giữa chừng thì lần quét sau sẽ phát hiện lại các thay đổi đó.
+    """
+
+    def __init__(self, path: str, settle_seconds: float = DEFAULT_SETTLE_SECONDS):
+        self.path = path
+        self.settle_seconds = settle_seconds
+        self.files = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.files = {name: FileState(*state) for name, state in data.get("files", {}).items()}
+
+    def save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": {name: list(state) for name, state in self.files.items()}}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def scan(self, folder_path: str):
+        """
+        So sánh thư mục với manifest. Trả về (FolderChanges, states) với states là
+        trạng thái mới của mọi file (filename → FileState) để ghi vào files sau khi
+        xử lý xong. File vừa ghi chưa đủ settle_seconds giây được để lần quét sau.
+        """
+        states = {}
+        fresh_after = time.time_ns() - int(self.settle_seconds * 1e9)
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                name = entry.name
+                previous = self.files.get(name)
+                try:
+                    st = entry.stat()
+                    if previous is not None and (previous.size, previous.mtime_ns) == (st.st_size, st.st_mtime_ns):
+                        states[name] = previous
+                        continue
+                    if st.st_mtime_ns > fresh_after:
+                        # Có thể đang được copy vào: giữ trạng thái cũ (nếu có) cho tới khi ổn định
+                        if previous is not None:
+                            states[name] = previous
+                        continue
+                    states[name] = FileState(st.st_size, st.st_mtime_ns, file_content_hash(entry.path))
+                except OSError:
+                    # File biến mất giữa lúc quét
+                    continue
+        added = sorted(name for name in states if name not in self.files)
+        modified = sorted(name for name, state in states.items()
+                          if name in self.files and state.content_hash != self.files[name].content_hash)
+        deleted = sorted(name for name in self.files if name not in states)
+        return FolderChanges(added, modified, deleted), states
+
+
+# ==============================================================================
+# DANH MỤC CV ĐÃ PARSE CỦA MỘT THƯ MỤC (CẬP NHẬT TĂNG DẦN THEO MANIFEST)
+# ==============================================================================
+class CVCatalog:
+    """
+    Các CV đã parse của một thư mục: records (CVRecordStore, lưu trên đĩa cạnh
+    manifest) và snapshot (tập id, SkillIndex) dựng lại chỉ khi có thay đổi.
+    Pipeline.refresh cập nhật catalog; các truy vấn chỉ đọc snapshot, nên khi
+    thư mục được FolderWatcher theo dõi, một truy vấn không phải quét gì cả.
+    duplicates: dedup.DuplicateIndex của thư mục, hoặc None nếu tắt phát hiện CV trùng.
+    """
+
+    def __init__(self, folder_path: str, manifest: Manifest, records, duplicates=None):
+        self.folder_path = folder_path
+        self.manifest = manifest
+        self.records = records
+        self.duplicates = duplicates
+        self.loaded = False
+        self.watcher = None
+        self.snapshot = CatalogSnapshot(frozenset(), records, None)
+        # Chỉ một lần refresh được chạy tại một thời điểm cho mỗi thư mục
+        self.lock = threading.Lock()
+
+    def rebuild(self):
+        from skill_index import SkillIndex
+
+        # SkillIndex chỉ cần các trường có cấu trúc, không giải nén highlights
+        skill_index = SkillIndex(self.records.scan(("skills", "languages", "experiences")))
+        self.snapshot = CatalogSnapshot(frozenset(self.records.ids()), self.records, skill_index)
+        return self.snapshot
+
+
+# ==============================================================================
+# LUỒNG NỀN QUÉT THƯ MỤC ĐỊNH KỲ
+# ==============================================================================
+class FolderWatcher:
+    """
+    Gọi refresh() mỗi interval giây trên một luồng nền. Dùng polling (os.scandir
+    + stat) để chạy được ở mọi hệ điều hành và cả thư mục mạng; với vài chục
+    nghìn file, một lần quét không đổi chỉ tốn vài chục mili giây.
+    """
+
+    def __init__(self, refresh, interval: float = DEFAULT_POLL_INTERVAL, name: str = "cv-watcher"):
+        self.refresh = refresh
+        self.interval = interval
+        self.name = name
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Lỗi khi cập nhật thư mục CV: {e}")
@@ -0,0 +1,303 @@
+# dedup.py
+
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+# Bật/tắt phát hiện CV trùng lặp khi nạp thư mục
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+# Hai văn bản có SimHash lệch nhau không quá bấy nhiêu bit được coi là gần trùng
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "3"))
+# Văn bản ít từ hơn (ví dụ OCR thất bại) không đủ tin cậy để so SimHash
+DEDUP_MIN_TOKENS = int(os.getenv("DEDUP_MIN_TOKENS", "30"))
+SHINGLE_SIZE = 3
+FORMAT_VERSION = 3
+
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+# Số điện thoại bắt đầu bằng "+" hoặc "0" (không khớp khoảng thời gian như "2019-05 - 2021-07")
+PHONE_PATTERN = re.compile(r"(?<![\w+])(?:\(?\+\d{1,3}\)?|0)[\d\s.()-]{7,16}\d(?!\d)")
+LINKEDIN_PATTERN = re.compile(r"linkedin\.com/in/([\w-]+)", re.IGNORECASE)
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Chữ ký của một CV:
+# - simhash: SimHash 64 bit trên các shingle 3 từ của text trích xuất (None nếu text quá ngắn)
+# - keys: khoá liên hệ chính xác ("email:...", "phone:...", "linkedin:...")
+# - name: tên ứng viên đã chuẩn hoá, chỉ có sau khi parse (dùng để chặn gộp nhầm)
+# - header: khoá email đầu tiên trong CV (email của chính ứng viên, không phải của người tham chiếu)
+# - text_hash: hash của text đã chuẩn hoá (chữ thường, bỏ dấu câu/khoảng trắng thừa)
+Signature = namedtuple("Signature", ["simhash", "keys", "name", "header", "text_hash"])
+# Chưa biết tên thì cần ít nhất bấy nhiêu khoá liên hệ chung (gồm cả email đầu CV) mới coi là trùng
+MIN_SHARED_KEYS = 2
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(TOKEN_PATTERN.findall(str(name or "").lower()))
+
+
+def contact_keys(raw_text: str) -> frozenset:
+    """Email, số điện thoại (9 số cuối) và LinkedIn xuất hiện trong text CV."""
+    keys = {f"email:{email.lower().rstrip('.')}" for email in EMAIL_PATTERN.findall(raw_text)}
+    for match in PHONE_PATTERN.findall(raw_text):
+        digits = re.sub(r"\D", "", match)
+        if 9 <= len(digits) <= 13:
+            keys.add(f"phone:{digits[-9:]}")
+    keys.update(f"linkedin:{slug.lower()}" for slug in LINKEDIN_PATTERN.findall(raw_text))
+    return frozenset(keys)
+
+
+def simhash(raw_text: str):
+    """SimHash 64 bit trên các shingle SHINGLE_SIZE từ, hoặc None nếu text có ít hơn DEDUP_MIN_TOKENS từ."""
+    tokens = TOKEN_PATTERN.findall(raw_text.lower())
+    if len(tokens) < DEDUP_MIN_TOKENS:
+        return None
+    shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(shingles), 64)
+    # Mỗi bit của kết quả là "biểu quyết" của mọi shingle
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority).tobytes(), "big")
+
+
+def header_email(raw_text: str) -> str:
+    match = EMAIL_PATTERN.search(raw_text)
+    return f"email:{match.group(0).lower().rstrip('.')}" if match else ""
+
+
+def normalized_text_hash(raw_text: str) -> str:
+    tokens = TOKEN_PATTERN.findall(raw_text.lower())
+    return hashlib.blake2b(" ".join(tokens).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def text_signature(raw_text: str) -> Signature:
+    return Signature(simhash(raw_text), contact_keys(raw_text), "", header_email(raw_text),
+                     normalized_text_hash(raw_text))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _emails(keys) -> set:
+    return {key for key in keys if key.startswith("email:")}
+
+
+# ==============================================================================
+# CHỈ MỤC CHỮ KÝ CV (LƯU THEO HASH NỘI DUNG FILE) ĐỂ PHÁT HIỆN BẢN TRÙNG
+# ==============================================================================
+class DuplicateIndex:
+    """
+    Chữ ký (Signature) của các CV đã trích xuất text, theo hash nội dung file,
+    lưu trong một file JSON cạnh manifest. Hai CV không có tên (sau khi parse)
+    khác nhau là bản trùng khi:
+    - text gần như giống hệt: SimHash lệch không quá max_distance bit, trừ khi
+      cả hai có email và không chung email nào; hoặc
+    - có chung khoá liên hệ (email, số điện thoại, LinkedIn) và cùng tên; khi
+      chưa biết tên thì cần chung ít nhất MIN_SHARED_KEYS khoá và cùng email đầu
+      CV, vì một khoá chung có thể chỉ là email/số điện thoại của người tham chiếu.
+    Tìm ứng viên gần trùng bằng cách
+    chia SimHash thành max_distance + 1 dải bit: hai giá trị lệch không quá
+    max_distance bit chắc chắn trùng nhau ở ít nhất một dải.
+    collapsed: các file đang bị gộp vào bản mới hơn (không có trong kho CV).
+    """
+
+    def __init__(self, path: str, max_distance: int = DEDUP_MAX_DISTANCE):
+        self.path = path
+        self.max_distance = max_distance
+        self.signatures = {}
+        self.collapsed = set()
+        self._bands = {}
+        self._keys = {}
+        self._load()
+
+    # --------------------------------------------------------------------------
+    # Đọc / ghi
+    # --------------------------------------------------------------------------
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != FORMAT_VERSION:
+            return
+        for content_hash, (value, keys, name, header, text_hash) in data.get("signatures", {}).items():
+            self.add(content_hash, Signature(None if value is None else int(value, 16), frozenset(keys), name,
+                                             header, text_hash))
+        self.collapsed = set(data.get("collapsed", []))
+
+    def save(self, live_hashes=None):
+        """Ghi ra đĩa; live_hashes: chỉ giữ chữ ký của các file còn trong thư mục."""
+        if live_hashes is not None:
+            for content_hash in [h for h in self.signatures if h not in live_hashes]:
+                self.remove(content_hash)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        signatures = {
+            content_hash: [None if sig.simhash is None else f"{sig.simhash:016x}", sorted(sig.keys), sig.name,
+                           sig.header, sig.text_hash]
+            for content_hash, sig in self.signatures.items()
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "signatures": signatures, "collapsed": sorted(self.collapsed)},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    # --------------------------------------------------------------------------
+    # Thêm / xoá / tra cứu
+    # --------------------------------------------------------------------------
+    def _band_keys(self, value: int):
+        bands = self.max_distance + 1
+        width = 64 // bands
+        for band in range(bands):
+            shift = band * width
+            bits = 64 - shift if band == bands - 1 else width
+            yield band, (value >> shift) & ((1 << bits) - 1)
+
+    def add(self, content_hash: str, signature: Signature):
+        self.remove(content_hash)
+        self.signatures[content_hash] = signature
+        if signature.simhash is not None:
+            for band_key in self._band_keys(signature.simhash):
+                self._bands.setdefault(band_key, set()).add(content_hash)
+        for key in signature.keys:
+            self._keys.setdefault(key, set()).add(content_hash)
+
+    def remove(self, content_hash: str):
+        signature = self.signatures.pop(content_hash, None)
+        if signature is None:
+            return
+        if signature.simhash is not None:
+            for band_key in self._band_keys(signature.simhash):
+                self._bands.get(band_key, set()).discard(content_hash)
+        for key in signature.keys:
+            self._keys.get(key, set()).discard(content_hash)
+
+    def set_name(self, content_hash: str, name: str):
+        signature = self.signatures.get(content_hash)
+        if signature is not None:
+            self.signatures[content_hash] = signature._replace(name=normalize_name(name))
+
+    def near_text(self, a: Signature, b: Signature) -> bool:
+        """Hai CV có text gần như giống hệt (bản cũ hơn không cần parse)."""
+        if a.name and b.name and a.name != b.name:
+            return False
+        if a.simhash is None or b.simhash is None or hamming(a.simhash, b.simhash) > self.max_distance:
+            return False
+        emails_a, emails_b = _emails(a.keys), _emails(b.keys)
+        return not (emails_a and emails_b and not emails_a & emails_b)
+
+    def is_duplicate(self, a: Signature, b: Signature) -> bool:
+        if a.name and b.name and a.name != b.name:
+            return False
+        if self.near_text(a, b):
+            return True
+        shared = a.keys & b.keys
+        if not shared:
+            return False
+        if a.name and b.name:
+            return True
+        return len(shared) >= MIN_SHARED_KEYS and bool(a.header) and a.header == b.header
+
+    def neighbours(self, signature: Signature) -> set:
+        """Hash nội dung của các CV trùng với signature."""
+        candidates = set()
+        if signature.simhash is not None:
+            for band_key in self._band_keys(signature.simhash):
+                candidates |= self._bands.get(band_key, set())
+        for key in signature.keys:
+            candidates |= self._keys.get(key, set())
+        return {h for h in candidates if self.is_duplicate(signature, self.signatures[h])}
+
+    def view(self, files: dict):
+        """Các bản trùng trong một thư mục. files: filename → (content_hash, mtime_ns)."""
+        return FolderDuplicates(self, files)
+
+
+# ==============================================================================
+# BẢN TRÙNG TRONG MỘT THƯ MỤC: MỖI NHÓM CHỈ GIỮ FILE MỚI NHẤT
+# ==============================================================================
+class FolderDuplicates:
+    """
+    Nhóm các file trùng nhau (bắc cầu) của một thư mục và chọn đại diện là file
+    mới nhất (mtime lớn nhất, cùng mtime thì tên lớn hơn). Dùng trong khi nạp CV:
+    file đã có bản mới hơn trong thư mục không cần trích xuất hay gọi Gemini.
+    """
+
+    def __init__(self, index: DuplicateIndex, files: dict):
+        self.index = index
+        self.files = files
+        self._by_hash = {}
+        for filename, (content_hash, _) in files.items():
+            self._by_hash.setdefault(content_hash, []).append(filename)
+
+    def age(self, filename):
+        return self.files[filename][1], filename
+
+    def signature(self, filename: str):
+        return self.index.signatures.get(self.files[filename][0])
+
+    def add(self, filename: str, signature: Signature):
+        self.index.add(self.files[filename][0], signature)
+
+    def _duplicate_files(self, filename: str, signature: Signature, near_text_only: bool = False):
+        own_hash = self.files[filename][0]
+        for content_hash in self.index.neighbours(signature) | {own_hash}:
+            if (near_text_only and content_hash != own_hash
+                    and not self.index.near_text(signature, self.index.signatures[content_hash])):
+                continue
+            for other in self._by_hash.get(content_hash, ()):
+                if other != filename:
+                    yield other
+
+    def newer_duplicate(self, filename: str):
+        """
+        File mới hơn trong thư mục có text gần như giống hệt filename (None nếu không
+        có hoặc chưa biết chữ ký). Chỉ khoá liên hệ trùng thì không đủ để bỏ qua
+        parse: bản trùng theo liên hệ chỉ được gộp sau khi parse (representatives).
+        """
+        signature = self.signature(filename)
+        if signature is None:
+            return None
+        newer = [other for other in self._duplicate_files(filename, signature, near_text_only=True)
+                 if self.age(other) > self.age(filename)]
+        return max(newer, key=self.age) if newer else None
+
+    def same_text_hashes(self, filename: str) -> list:
+        """
+        Hash nội dung của các file có text (đã chuẩn hoá) giống hệt filename, ví dụ
+        cùng CV xuất lại PDF: dùng lại được kết quả parse. Text chỉ gần giống thì
+        phải parse lại, vì phần khác nhau có thể là thông tin mới.
+        """
+        signature = self.signature(filename)
+        if signature is None:
+            return []
+        return [h for h in self.index.neighbours(signature)
+                if h != self.files[filename][0] and self.index.signatures[h].text_hash == signature.text_hash]
+
+    def representatives(self) -> dict:
+        """filename → file đại diện (mới nhất) của nhóm trùng chứa nó."""
+        parent = {filename: filename for filename in self.files}
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for filename in self.files:
+            signature = self.signature(filename)
+            if signature is None:
+                continue
+            for other in self._duplicate_files(filename, signature):
+                a, b = find(filename), find(other)
+                if a != b:
+                    # Gốc của nhóm luôn là file mới nhất
+                    if self.age(a) < self.age(b):
+                        a, b = b, a
+                    parent[b] = a
+        return {filename: find(filename) for filename in self.files}
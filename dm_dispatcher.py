@@ -0,0 +1,293 @@
+# dm_dispatcher.py
+
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+
+from mastodon import MastodonNetworkError, MastodonRatelimitError, MastodonServerError
+
+from instrumentation import count, span
+
+# Giới hạn ký tự dự phòng khi không đọc được cấu hình của instance
+DEFAULT_MAX_CHARS = 500
+# Ghi đè giới hạn ký tự của instance (0 = đọc từ instance)
+BOT_DM_MAX_CHARS = int(os.getenv("BOT_DM_MAX_CHARS", "0"))
+# Tin nhắn được giữ lại tối đa bấy nhiêu giây để gộp với các tin tiếp theo cùng người nhận
+BOT_DM_LINGER = float(os.getenv("BOT_DM_LINGER", "2"))
+BOT_DM_MAX_RETRIES = int(os.getenv("BOT_DM_MAX_RETRIES", "4"))
+
+# Lỗi tạm thời đáng để thử lại (mất mạng, lỗi 5xx, vượt giới hạn tốc độ)
+TRANSIENT_ERRORS = (MastodonNetworkError, MastodonServerError, MastodonRatelimitError)
+
+BLOCK_SEPARATOR = "\n\n"
+
+
+def split_block(text: str, limit: int) -> list:
+    """Cắt một đoạn dài hơn limit ký tự tại ranh giới dòng, rồi khoảng trắng, cuối cùng là cắt cứng."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+def pack_blocks(prefix: str, blocks: list, max_chars: int) -> list:
+    """
+    Gộp các đoạn (theo đúng thứ tự) thành ít status nhất có thể, mỗi status bắt
+    đầu bằng prefix và không dài quá max_chars ký tự.
+    """
+    limit = max(1, max_chars - len(prefix))
+    return _pack(prefix, [split_block(block, limit) for block in blocks], limit)[0]
+
+
+def _pack(prefix: str, block_parts: list, limit: int):
+    """
+    Như pack_blocks nhưng nhận các đoạn đã cắt sẵn, trả về thêm owners: với mỗi
+    status, danh sách chỉ số đoạn của từng phần nằm trong status đó.
+    """
+    statuses, owners = [], []
+    current, current_owners = "", []
+    for index, parts in enumerate(block_parts):
+        for part in parts:
+            if current and len(current) + len(BLOCK_SEPARATOR) + len(part) <= limit:
+                current += BLOCK_SEPARATOR + part
+                current_owners.append(index)
+            else:
+                if current:
+                    statuses.append(prefix + current)
+                    owners.append(current_owners)
+                current, current_owners = part, [index]
+    if current:
+        statuses.append(prefix + current)
+        owners.append(current_owners)
+    return statuses, owners
+
+
+class _Message:
+    __slots__ = ("key", "text", "future", "created", "sent_parts", "posted", "attempts")
+
+    def __init__(self, key, text):
+        self.key = key
+        self.text = text
+        self.future = Future()
+        self.created = time.monotonic()
+        # Số phần của text đã đăng thành công và các status chứa chúng (khi gửi dở dang)
+        self.sent_parts = 0
+        self.posted = []
+        self.attempts = 0
+
+
+# ==============================================================================
+# GỬI TIN NHẮN QUA HÀNG ĐỢI NỀN: GỘP TIN, TUÂN THỦ GIỚI HẠN TỐC ĐỘ, THỬ LẠI
+# ==============================================================================
+class DMDispatcher:
+    """
+    Gửi tin nhắn Mastodon trên một luồng nền để worker không phải chờ.
+    - send() chỉ xếp tin vào hàng đợi và trả về Future (kết quả là danh sách
+      status đã đăng chứa tin đó).
+    - Các tin cùng người nhận, cùng visibility và cùng in_reply_to_id được gộp
+      vào ít status nhất có thể theo giới hạn ký tự của instance; tin của mỗi
+      người nhận được gửi đúng thứ tự đã xếp.
+    - Tin được giữ lại tối đa linger giây để gom thêm các tin tiếp theo (ví dụ
+      các ứng viên được đánh giá xong liên tiếp ở chế độ luồng).
+    - Trước mỗi request, đọc giới hạn tốc độ từ header của response trước
+      (ratelimit_remaining / ratelimit_reset): gần hết lượt thì chờ tới lúc
+      reset, còn ít lượt thì dàn đều các request còn lại thay vì chờ cố định.
+    - Lỗi tạm thời được thử lại với thời gian chờ tăng theo cấp số nhân (kèm
+      jitter), cùng idempotency key nên server không đăng trùng status.
+    - Nếu vẫn lỗi giữa chừng một lô, tin đã đăng đủ được trả kết quả ngay; chỉ
+      phần chưa đăng của các tin còn lại được xếp lại đầu hàng đợi để gửi sau,
+      nên người nhận không bị nhận trùng tin.
+    """
+
+    def __init__(self, client, max_chars: int = BOT_DM_MAX_CHARS, linger: float = BOT_DM_LINGER,
+                 max_retries: int = BOT_DM_MAX_RETRIES, base_delay: float = 1.0,
+                 reserve: int = 1, pace_below: int = 10):
+        self.client = client
+        self.max_chars = max_chars or None
+        self.linger = linger
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.reserve = reserve
+        self.pace_below = pace_below
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    # --------------------------------------------------------------------------
+    # Phía xếp tin
+    # --------------------------------------------------------------------------
+    def send(self, acct: str, text: str, visibility: str = "direct", in_reply_to_id=None) -> Future:
+        """Xếp một tin nhắn gửi tới @acct (không kèm mention, dispatcher tự thêm)."""
+        message = _Message((acct, visibility, in_reply_to_id), text)
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError("DMDispatcher đã dừng")
+            self._queue.append(message)
+            self._cond.notify()
+        return message.future
+
+    def pending(self) -> int:
+        """Số tin đang chờ gửi."""
+        with self._cond:
+            return len(self._queue)
+
+    def start(self):
+        with self._cond:
+            self._stopping = False
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="dm-dispatcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        """Gửi nốt các tin đang chờ (bỏ qua linger) rồi dừng luồng nền."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # --------------------------------------------------------------------------
+    # Phía gửi tin
+    # --------------------------------------------------------------------------
+    def _take_batch(self) -> list:
+        """Lấy tin đầu hàng đợi cùng các tin phía sau có cùng khoá (giữ thứ tự theo người nhận)."""
+        head = self._queue.popleft()
+        batch = [head]
+        acct = head.key[0]
+        rest = deque()
+        blocked = False
+        while self._queue:
+            message = self._queue.popleft()
+            if not blocked and message.key[0] == acct:
+                if message.key == head.key:
+                    batch.append(message)
+                    continue
+                # Tin khác loại cho cùng người nhận: các tin sau nó phải chờ nó gửi xong
+                blocked = True
+            rest.append(message)
+        self._queue = rest
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                wait = self._queue[0].created + self.linger - time.monotonic()
+                if wait > 0 and not self._stopping:
+                    self._cond.wait(wait)
+                    continue
+                batch = self._take_batch()
+            self._deliver(batch)
+
+    def _instance_max_chars(self) -> int:
+        if self.max_chars is None:
+            try:
+                instance = self.client.instance()
+                limit = ((instance.get("configuration") or {}).get("statuses") or {}).get("max_characters") \
+                    or instance.get("max_toot_chars")
+            except Exception as e:
+                print(f"⚠️ Không đọc được giới hạn ký tự của instance: {e}")
+                limit = None
+            self.max_chars = int(limit or DEFAULT_MAX_CHARS)
+        return self.max_chars
+
+    def _deliver(self, batch: list):
+        acct, visibility, in_reply_to_id = batch[0].key
+        prefix = f"@{acct} "
+        limit = max(1, self._instance_max_chars() - len(prefix))
+        # Tin đã đăng dở ở lần trước chỉ gửi tiếp các phần chưa đăng
+        block_parts = [split_block(message.text, limit)[message.sent_parts:] for message in batch]
+        statuses, owners = _pack(prefix, block_parts, limit)
+        remaining = [len(parts) for parts in block_parts]
+        try:
+            with span("bot.dm_deliver", messages=len(batch), statuses=len(statuses)):
+                for text, indices in zip(statuses, owners):
+                    status = self._post(text, visibility, in_reply_to_id)
+                    for index in indices:
+                        message = batch[index]
+                        message.sent_parts += 1
+                        remaining[index] -= 1
+                        if not message.posted or message.posted[-1] is not status:
+                            message.posted.append(status)
+        except Exception as e:
+            self._deliver_failed(batch, remaining, e)
+            return
+        count("bot.dm_messages", len(batch))
+        for message in batch:
+            message.future.set_result(message.posted)
+
+    def _deliver_failed(self, batch: list, remaining: list, error: Exception):
+        acct = batch[0].key[0]
+        retry = []
+        for message, left in zip(batch, remaining):
+            if left == 0:
+                message.future.set_result(message.posted)
+            elif isinstance(error, TRANSIENT_ERRORS) and message.attempts < self.max_retries:
+                message.attempts += 1
+                # Chờ thêm trước khi gửi lại (tính cả linger của hàng đợi)
+                message.created = time.monotonic() + self.base_delay * (2 ** message.attempts)
+                retry.append(message)
+            else:
+                message.future.set_exception(error)
+        print(f"❌ Không gửi được tin nhắn cho @{acct}: {error}"
+              + (f" (sẽ gửi lại {len(retry)} tin chưa đăng)" if retry else ""))
+        if retry:
+            count("bot.dm_requeued", len(retry))
+            with self._cond:
+                # Về đầu hàng đợi để giữ thứ tự tin của người nhận
+                self._queue.extendleft(reversed(retry))
+                self._cond.notify()
+
+    def _pace(self):
+        remaining = getattr(self.client, "ratelimit_remaining", None)
+        reset = getattr(self.client, "ratelimit_reset", None)
+        if remaining is None or reset is None:
+            return
+        wait = reset - time.time()
+        if wait <= 0:
+            return
+        if remaining <= self.reserve:
+            time.sleep(wait)
+        elif remaining < self.pace_below:
+            time.sleep(wait / remaining)
+
+    def _post(self, text: str, visibility: str, in_reply_to_id):
+        idempotency_key = uuid.uuid4().hex
+        attempt = 0
+        while True:
+            self._pace()
+            try:
+                status = self.client.status_post(text, in_reply_to_id=in_reply_to_id, visibility=visibility,
+                                                 idempotency_key=idempotency_key)
+                count("bot.dm_sent")
+                return status
+            except TRANSIENT_ERRORS as e:
+                count("bot.dm_retries")
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.base_delay * (2 ** attempt)
+                delay += random.uniform(0, delay / 2)
+                if isinstance(e, MastodonRatelimitError):
+                    reset = getattr(self.client, "ratelimit_reset", None)
+                    if reset is not None:
+                        delay = max(delay, reset - time.time())
+                time.sleep(delay)
+                attempt += 1
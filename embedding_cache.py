@@ -0,0 +1,193 @@
+# embedding_cache.py
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from instrumentation import count
+
+DEFAULT_DB_PATH = os.path.join(".cache", "embeddings.sqlite3")
+DEFAULT_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# Giới hạn số tham số trong một câu lệnh SQLite (mặc định tối thiểu là 999)
+_SQL_CHUNK = 500
+
+
+def _chunks(items, size=_SQL_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# ==============================================================================
+# CACHE EMBEDDING LƯU TRONG SQLITE (VECTOR FLOAT32 DẠNG BLOB, LOẠI BỎ THEO LRU)
+# ==============================================================================
+class EmbeddingCache:
+    """
+    Cache vector embedding theo (model, loại, sha256 của văn bản).
+    - Vector lưu dạng blob float32 (dim * 4 byte mỗi dòng).
+    - Mỗi lần đọc trúng cập nhật last_used; khi vượt max_entries, các dòng lâu
+      không dùng nhất bị xoá.
+    - "text" và "query" là hai không gian khoá riêng, vì một số model embed
+      truy vấn khác với văn bản.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+
+    @staticmethod
+    def key_for(model: str, text: str, kind: str = "text") -> str:
+        return hashlib.sha256(f"{model}|{kind}|{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: list, kind: str = "text") -> list:
+        """Trả về danh sách vector (list[float]) hoặc None cho từng văn bản chưa có trong cache."""
+        keys = [self.key_for(model, t, kind) for t in texts]
+        found = {}
+        with self._lock:
+            for chunk in _chunks(list(set(keys))):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                for chunk in _chunks(list(found)):
+                    placeholders = ",".join("?" * len(chunk))
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})", [now, *chunk]
+                    )
+            results = [found.get(k) for k in keys]
+            hits = sum(1 for r in results if r is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+        count("cache.embedding.hit", hits)
+        count("cache.embedding.miss", len(results) - hits)
+        return results
+
+    def put_many(self, model: str, texts: list, vectors: list, kind: str = "text"):
+        now = time.time()
+        rows = []
+        for text, vec in zip(texts, vectors):
+            arr = np.asarray(vec, dtype=np.float32).ravel()
+            rows.append((self.key_for(model, text, kind), model, arr.shape[0], arr.tobytes(), now))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute("COMMIT")
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = total - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            count("cache.embedding.evicted", excess)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+
+    def stats(self) -> dict:
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses}
+
+
+# ==============================================================================
+# BỌC MODEL EMBEDDING: CHỈ GỌI API CHO CÁC VĂN BẢN CHƯA CÓ TRONG CACHE
+# ==============================================================================
+class CachedEmbedding:
+    """
+    Bọc một model embedding của LlamaIndex (ví dụ OpenAIEmbedding), cùng giao diện
+    get_text_embedding / get_text_embedding_batch / get_query_embedding, thêm
+    get_query_embedding_batch cho nhiều JD (cùng loại "query" trong cache).
+    Các văn bản chưa có trong cache (đã bỏ trùng) được gom vào một lệnh gọi batch;
+    backend_calls đếm số lệnh gọi xuống model theo từng loại.
+    """
+
+    def __init__(self, embed_model, cache: EmbeddingCache, model_name: str = None):
+        self.embed_model = embed_model
+        self.cache = cache
+        self.model_name = model_name or getattr(embed_model, "model_name", None) or getattr(embed_model, "model", "")
+        self.backend_calls = {"text": 0, "query": 0}
+
+    def _embed(self, texts: list, kind: str, embed_fn) -> list:
+        vectors = self.cache.get_many(self.model_name, texts, kind)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if not missing:
+            return vectors
+        self.backend_calls[kind] += 1
+        count("embed.backend_call", kind=kind)
+        fresh = embed_fn(missing)
+        self.cache.put_many(self.model_name, missing, fresh, kind)
+        by_text = dict(zip(missing, fresh))
+        return [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+
+    def get_text_embedding_batch(self, texts: list, **kwargs) -> list:
+        return self._embed(list(texts), "text",
+                           lambda batch: self.embed_model.get_text_embedding_batch(batch, **kwargs))
+
+    def get_text_embedding(self, text: str) -> list:
+        return self.get_text_embedding_batch([text])[0]
+
+    def _queries_as_texts(self) -> bool:
+        # OpenAIEmbedding dùng cùng một engine cho truy vấn và văn bản (text-embedding-3),
+        # các model khác có thể thêm instruction riêng cho truy vấn
+        model = self.embed_model
+        return (getattr(model, "_query_engine", None) == getattr(model, "_text_engine", None)
+                and getattr(model, "query_instruction", None) == getattr(model, "text_instruction", None))
+
+    def _embed_queries(self, batch: list) -> list:
+        model = self.embed_model
+        if self._queries_as_texts():
+            return model.get_text_embedding_batch(batch)
+
+        async def gather():
+            return await asyncio.gather(*(model.aget_query_embedding(q) for q in batch))
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            if hasattr(model, "aget_query_embedding"):
+                return list(asyncio.run(gather()))
+        # Đang ở trong event loop (không thể asyncio.run) hoặc model không có bản async
+        return [model.get_query_embedding(q) for q in batch]
+
+    def get_query_embedding_batch(self, queries: list) -> list:
+        return self._embed(list(queries), "query", self._embed_queries)
+
+    def get_query_embedding(self, query: str) -> list:
+        return self.get_query_embedding_batch([query])[0]
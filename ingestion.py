@@ -0,0 +1,275 @@
+# ingestion.py
+
+import atexit
+import contextvars
+import os
+import threading
+from collections import namedtuple
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from cv_serializer import estimate_tokens
+from dedup import text_signature
+from instrumentation import count, span
+from parse_cache import file_content_hash, is_empty_parse, parse_texts_cached_batch
+from resumeParser import (
+    GEMINI_BATCH_MAX_RESUMES,
+    GEMINI_BATCH_TOKENS,
+    IMAGE_EXTENSIONS,
+    PDF_EXTENSIONS,
+    extract_text,
+)
+
+SUPPORTED_EXTENSIONS = PDF_EXTENSIONS + IMAGE_EXTENSIONS
+
+# Số tiến trình cho bước trích xuất text (PDF/OCR, tốn CPU) và số luồng cho
+# bước gọi Gemini (chờ mạng, bị giới hạn bởi rate limit của API)
+DEFAULT_CPU_WORKERS = os.cpu_count() or 1
+DEFAULT_LLM_WORKERS = int(os.getenv("INGEST_LLM_WORKERS", "4"))
+# Gom nhiều CV vào một lệnh gọi Gemini tới ngân sách token này (0: mỗi CV một lệnh gọi)
+DEFAULT_BATCH_TOKENS = int(os.getenv("INGEST_BATCH_TOKENS", str(GEMINI_BATCH_TOKENS)))
+
+# Kết quả cho từng file: data là JSON đã validate, error là lỗi nếu có (kể cả khi
+# Gemini không trả về JSON dùng được), duplicate_of là file mới hơn trùng với file
+# này (khi đó file không được parse, data là None)
+IngestResult = namedtuple("IngestResult", ["filename", "data", "error", "from_cache", "duplicate_of"],
+                          defaults=(None,))
+
+
+# Process pool trích xuất text dùng chung giữa các lần nạp (theo số tiến trình):
+# khởi động tiến trình và import PyMuPDF/pytesseract chỉ tốn một lần
+_extract_pools = {}
+_extract_pools_lock = threading.Lock()
+
+
+def extraction_pool(workers: int) -> ProcessPoolExecutor:
+    with _extract_pools_lock:
+        pool = _extract_pools.get(workers)
+        if pool is None:
+            pool = _extract_pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+
+def _drop_extraction_pool(pool):
+    # Một tiến trình con chết làm hỏng cả pool: bỏ nó để lần nạp sau tạo pool mới
+    with _extract_pools_lock:
+        for workers, shared in list(_extract_pools.items()):
+            if shared is pool:
+                del _extract_pools[workers]
+
+
+def shutdown_extraction_pools():
+    with _extract_pools_lock:
+        pools = list(_extract_pools.values())
+        _extract_pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+
+atexit.register(shutdown_extraction_pools)
+
+
+def list_cv_files(folder_path: str):
+    """Danh sách file CV trong thư mục (bỏ qua thư mục con), theo thứ tự tên file."""
+    files = []
+    for filename in sorted(os.listdir(folder_path)):
+        file_path = os.path.join(folder_path, filename)
+        if os.path.isfile(file_path):
+            files.append(filename)
+    return files
+
+
+# ==============================================================================
+# NẠP CV THEO LÔ: TRÍCH XUẤT SONG SONG + GỌI LLM ĐỒNG THỜI CÓ GIỚI HẠN
+# ==============================================================================
+def ingest_folder(folder_path: str, cache=None, cpu_workers: int = DEFAULT_CPU_WORKERS,
+                  llm_workers: int = DEFAULT_LLM_WORKERS, batch_tokens: int = DEFAULT_BATCH_TOKENS,
+                  duplicates=None):
+    """
+    Parse toàn bộ CV trong thư mục:
+    - CV đã có trong cache được trả về ngay, không trích xuất, không gọi Gemini.
+    - Trích xuất text (extract_text_from_pdf / extract_text_from_img) chạy trên
+      process pool dùng chung với tối đa cpu_workers tiến trình (extraction_pool;
+      cpu_workers=0: chạy ngay trong tiến trình hiện tại).
+    - Text trích xuất xong được gom thành lô tới batch_tokens token (tối đa
+      GEMINI_BATCH_MAX_RESUMES CV) rồi đẩy sang thread pool gọi Gemini với tối đa
+      llm_workers yêu cầu đồng thời; mỗi lô là một lệnh gọi extract_with_gemini_batch.
+      batch_tokens=0: mỗi CV một lệnh gọi như trước.
+    - duplicates (dedup.FolderDuplicates): nếu có, chữ ký của text trích xuất được
+      ghi lại; file đã có bản mới hơn với text gần như giống hệt trong thư mục
+      không được gọi Gemini (duplicate_of; chỉ trùng liên hệ thì vẫn parse), file
+      có text (đã chuẩn hoá) giống hệt một CV đã parse dùng lại kết quả parse đó.
+    Lỗi của một file không ảnh hưởng các file khác. Kết quả trả về theo đúng
+    thứ tự list_cv_files, mỗi phần tử là một IngestResult.
+    """
+    return ingest_files(folder_path, list_cv_files(folder_path), cache, cpu_workers=cpu_workers,
+                        llm_workers=llm_workers, batch_tokens=batch_tokens, duplicates=duplicates)
+
+
+def ingest_files(folder_path: str, filenames: list, cache=None, content_hashes: dict = None,
+                 cpu_workers: int = DEFAULT_CPU_WORKERS, llm_workers: int = DEFAULT_LLM_WORKERS,
+                 batch_tokens: int = DEFAULT_BATCH_TOKENS, duplicates=None, extract_pool=None):
+    """
+    Như ingest_folder nhưng chỉ cho các file được chỉ định (ví dụ các file mới
+    hoặc vừa sửa mà cv_watcher phát hiện). content_hashes: filename → sha256 đã
+    tính sẵn, để không phải đọc lại file chỉ để băm. extract_pool: process pool
+    trích xuất text, mặc định là pool dùng chung extraction_pool(cpu_workers).
+    """
+    if extract_pool is None and cpu_workers > 0:
+        extract_pool = extraction_pool(cpu_workers)
+    with span("ingest.folder", cpu_workers=cpu_workers, llm_workers=llm_workers,
+              batch_tokens=batch_tokens) as attrs:
+        results = _ingest_files(folder_path, list(filenames), cache, content_hashes or {},
+                                extract_pool, llm_workers, batch_tokens, duplicates)
+        attrs["files"] = len(results)
+        attrs["duplicates"] = sum(1 for r in results if r.duplicate_of is not None)
+        attrs["cache_hits"] = sum(1 for r in results if r.from_cache)
+        attrs["errors"] = sum(1 for r in results if r.error is not None)
+    count("ingest.errors", attrs["errors"])
+    return results
+
+
+def _ingest_files(folder_path, filenames, cache, content_hashes, extract_pool, llm_workers, batch_tokens,
+                  duplicates=None):
+    results = [None] * len(filenames)
+
+    def superseded(i):
+        # File đã có bản mới hơn (text gần như giống hệt) trong thư mục: không cần parse
+        filename = filenames[i]
+        if duplicates is None or filename not in duplicates.files:
+            return False
+        newer = duplicates.newer_duplicate(filename)
+        if newer is None:
+            return False
+        results[i] = IngestResult(filename, None, None, False, newer)
+        count("ingest.duplicates_skipped")
+        return True
+
+    # --- Lọc các file đã có trong cache ---
+    pending = []
+    for i, filename in enumerate(filenames):
+        file_path = os.path.join(folder_path, filename)
+        try:
+            if os.path.splitext(filename)[1].lower() not in SUPPORTED_EXTENSIONS:
+                raise ValueError(f"Unsupported file format: {os.path.splitext(filename)[1].lower()}")
+            content_hash = content_hashes.get(filename) or file_content_hash(file_path)
+        except Exception as e:
+            results[i] = IngestResult(filename, None, e, False)
+            continue
+        if superseded(i):
+            continue
+        cached = cache.get(content_hash) if cache is not None else None
+        if cached is not None:
+            results[i] = IngestResult(filename, cached, None, True)
+        else:
+            pending.append((i, file_path, content_hash))
+
+    if not pending:
+        return results
+    if duplicates is not None:
+        # File mới nhất trước: bản mới được trích xuất sớm nên bản cũ ít phải chờ (xem held bên dưới)
+        pending.sort(key=lambda p: duplicates.age(filenames[p[0]]) if filenames[p[0]] in duplicates.files
+                     else (0, filenames[p[0]]), reverse=True)
+
+    # --- Trích xuất text song song, gọi LLM ngay khi gom đủ một lô ---
+    with ThreadPoolExecutor(max_workers=max(1, llm_workers)) as llm_pool:
+        llm_futures = {}
+        batch = []
+        batch_used = 0
+
+        def flush_batch():
+            nonlocal batch, batch_used
+            if not batch:
+                return
+            # Chạy trong bản sao context để span của luồng LLM gắn với span ingest.folder
+            ctx = contextvars.copy_context()
+            items = [(raw_text, content_hash) for _, raw_text, content_hash in batch]
+            future = llm_pool.submit(ctx.run, parse_texts_cached_batch, items, cache)
+            llm_futures[future] = [i for i, _, _ in batch]
+            batch, batch_used = [], 0
+
+        def submit_text(i, raw_text, content_hash):
+            filename = filenames[i]
+            if duplicates is not None and filename in duplicates.files:
+                duplicates.add(filename, text_signature(raw_text))
+                if superseded(i):
+                    return
+                # Text giống hệt một CV đã parse (ví dụ xuất lại PDF): dùng lại kết quả
+                for other_hash in duplicates.same_text_hashes(filename):
+                    data = cache.get(other_hash) if cache is not None else None
+                    if data is not None:
+                        cache.put(content_hash, data)
+                        results[i] = IngestResult(filename, data, None, True)
+                        count("ingest.duplicates_reused")
+                        return
+            submit_llm(i, raw_text, content_hash)
+
+        def submit_llm(i, raw_text, content_hash):
+            nonlocal batch_used
+            tokens = estimate_tokens(raw_text)
+            if batch and (batch_used + tokens > batch_tokens or len(batch) >= GEMINI_BATCH_MAX_RESUMES):
+                flush_batch()
+            batch.append((i, raw_text, content_hash))
+            batch_used += tokens
+            if batch_tokens <= 0:
+                flush_batch()
+
+        if extract_pool is None:
+            for i, file_path, content_hash in pending:
+                try:
+                    raw_text = extract_text(file_path)
+                except Exception as e:
+                    results[i] = IngestResult(filenames[i], None, e, False)
+                    continue
+                submit_text(i, raw_text, content_hash)
+        else:
+            # Mỗi file đã chạy trong một tiến trình riêng nên OCR bên trong
+            # không mở thêm process pool nữa
+            extract_one = partial(extract_text, ocr_workers=1)
+            extract_futures = {
+                extract_pool.submit(extract_one, file_path): (i, content_hash)
+                for i, file_path, content_hash in pending
+            }
+            # File thuộc thư mục có theo dõi trùng lặp được xét theo đúng thứ tự mới →
+            # cũ: text trích xuất xong được giữ lại cho tới khi mọi file mới hơn đã ghi
+            # chữ ký, nên bản cũ luôn thấy bản mới và bỏ qua Gemini, bất kể file nào
+            # trích xuất xong trước
+            ordered = [i for i, _, _ in pending if duplicates is not None and filenames[i] in duplicates.files]
+            held = {}
+            cursor = 0
+            for future in as_completed(extract_futures):
+                i, content_hash = extract_futures[future]
+                try:
+                    raw_text = future.result()
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        _drop_extraction_pool(extract_pool)
+                    results[i] = IngestResult(filenames[i], None, e, False)
+                    raw_text = None
+                if duplicates is None or filenames[i] not in duplicates.files:
+                    if raw_text is not None:
+                        submit_text(i, raw_text, content_hash)
+                    continue
+                held[i] = (raw_text, content_hash)
+                while cursor < len(ordered) and ordered[cursor] in held:
+                    raw_text, content_hash = held.pop(ordered[cursor])
+                    if raw_text is not None:
+                        submit_text(ordered[cursor], raw_text, content_hash)
+                    cursor += 1
+        flush_batch()
+
+        for future in as_completed(llm_futures):
+            indices = llm_futures[future]
+            try:
+                for i, data in zip(indices, future.result()):
+                    if is_empty_parse(data):
+                        error = ValueError("Gemini không trả về JSON hợp lệ")
+                        results[i] = IngestResult(filenames[i], None, error, False)
+                    else:
+                        results[i] = IngestResult(filenames[i], data, None, False)
+            except Exception as e:
+                for i in indices:
+                    results[i] = IngestResult(filenames[i], None, e, False)
+
+    return results
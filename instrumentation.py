@@ -0,0 +1,176 @@
+# instrumentation.py
+"""
+Đo thời gian và đếm sự kiện trong quy trình xử lý CV.
+
+    from instrumentation import span, count
+
+    with span("llm.gemini", model=GEMINI_MODEL) as attrs:
+        response = model.generate_content(prompt)
+        attrs["prompt_chars"] = len(prompt)
+    count("cache.parse.hit")
+
+Mỗi span/counter được gửi tới các exporter đã đăng ký (add_exporter). Khi chưa
+có exporter nào, span() và count() gần như không tốn chi phí.
+Đặt biến môi trường RESUME_TRACE_FILE=trace.jsonl để tự ghi ra file JSON-lines.
+"""
+
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_exporters = []
+_span_ids = itertools.count(1)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+# ==============================================================================
+# EXPORTER
+# ==============================================================================
+class Exporter:
+    """Giao diện exporter: nhận từng bản ghi (dict) của span hoặc counter."""
+
+    def export(self, record: dict):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InMemoryExporter(Exporter):
+    """Giữ bản ghi trong bộ nhớ, dùng cho test và benchmark."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def export(self, record: dict):
+        with self._lock:
+            self.records.append(record)
+
+    def spans(self, name: str = None) -> list:
+        return [r for r in self.records if r["type"] == "span" and (name is None or r["name"] == name)]
+
+    def counters(self) -> dict:
+        """Tổng giá trị của từng counter."""
+        totals = {}
+        for r in self.records:
+            if r["type"] == "counter":
+                totals[r["name"]] = totals.get(r["name"], 0) + r["value"]
+        return totals
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+
+class JsonLinesExporter(Exporter):
+    """Ghi mỗi bản ghi thành một dòng JSON (append), an toàn khi nhiều luồng cùng ghi."""
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def add_exporter(exporter: Exporter) -> Exporter:
+    _exporters.append(exporter)
+    return exporter
+
+
+def remove_exporter(exporter: Exporter):
+    if exporter in _exporters:
+        _exporters.remove(exporter)
+
+
+def _emit(record: dict):
+    for exporter in list(_exporters):
+        try:
+            exporter.export(record)
+        except Exception as e:
+            print(f"Lỗi exporter {type(exporter).__name__}: {e}")
+
+
+# ==============================================================================
+# SPAN VÀ COUNTER
+# ==============================================================================
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Đo thời gian một đoạn code. Trả về dict attrs để đoạn code bên trong có thể
+    bổ sung thuộc tính (ví dụ số trang, số token). Span lồng nhau ghi lại parent_id.
+    """
+    if not _exporters:
+        yield attrs
+        return
+    span_id = next(_span_ids)
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    start_wall = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000.0
+        _current_span.reset(token)
+        _emit({
+            "type": "span",
+            "name": name,
+            "span_id": span_id,
+            "parent_id": parent_id,
+            "start": start_wall,
+            "duration_ms": round(duration_ms, 3),
+            "thread": threading.current_thread().name,
+            "attrs": attrs,
+            "error": error,
+        })
+
+
+def count(name: str, value=1, **attrs):
+    """Cộng value vào counter name (số token, số byte, cache hit/miss...)."""
+    if not _exporters or not value:
+        return
+    _emit({
+        "type": "counter",
+        "name": name,
+        "value": value,
+        "span_id": _current_span.get(),
+        "time": time.time(),
+        "attrs": attrs,
+    })
+
+
+def traced(name: str):
+    """Decorator: bọc cả hàm trong một span."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Bật ghi trace ra file bằng biến môi trường, không cần sửa code
+if os.getenv("RESUME_TRACE_FILE"):
+    add_exporter(JsonLinesExporter(os.getenv("RESUME_TRACE_FILE")))
@@ -0,0 +1,154 @@
+# job_queue.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB_PATH = os.path.join(".cache", "jobs.sqlite3")
+
+
+# ==============================================================================
+# HÀNG ĐỢI CÔNG VIỆC LƯU TRONG SQLITE, XỬ LÝ BỞI NHIỀU WORKER
+# ==============================================================================
+class JobQueue:
+    """
+    Hàng đợi công việc chạy trong tiến trình, lưu trạng thái trong SQLite để
+    không mất việc khi bot bị tắt đột ngột.
+    - enqueue() chỉ ghi công việc vào DB rồi trả về ngay.
+    - num_workers luồng lấy việc theo thứ tự vào trước ra trước và gọi handler(payload).
+    - Mỗi job_id chỉ được nhận một lần (chống trùng lặp theo status id).
+    - Khi số việc đang chờ/đang chạy đạt max_pending, việc mới bị từ chối.
+    - Khi khởi động lại, các việc đang chạy dở được đưa về trạng thái chờ.
+    """
+
+    def __init__(self, handler, db_path: str = DEFAULT_DB_PATH, num_workers: int = 2,
+                 max_pending: int = 100, poll_interval: float = 5.0):
+        self.handler = handler
+        self.db_path = db_path
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self._workers = []
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                error TEXT
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created)")
+
+    # --------------------------------------------------------------------------
+    # Phía nhận việc
+    # --------------------------------------------------------------------------
+    def enqueue(self, job_id, payload: dict) -> bool:
+        """Thêm việc vào hàng đợi. Trả về False nếu trùng job_id hoặc hàng đợi đã đầy."""
+        now = time.time()
+        with self._lock:
+            if self._count_active() >= self.max_pending:
+                return False
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (job_id, payload, state, created, updated) "
+                "VALUES (?, ?, 'pending', ?, ?)",
+                (str(job_id), json.dumps(payload, ensure_ascii=False), now, now),
+            )
+            if cur.rowcount == 0:
+                return False
+            self._wakeup.notify()
+        return True
+
+    def has_job(self, job_id) -> bool:
+        """job_id đã từng được xếp hàng (kể cả đã xử lý xong, vẫn còn trong SQLite)."""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM jobs WHERE job_id = ?", (str(job_id),)).fetchone()
+            return row is not None
+
+    def _count_active(self) -> int:
+        row = self._conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE state IN ('pending', 'running')"
+        ).fetchone()
+        return row[0]
+
+    def depth(self) -> int:
+        """Số việc đang chờ hoặc đang chạy."""
+        with self._lock:
+            return self._count_active()
+
+    # --------------------------------------------------------------------------
+    # Phía xử lý việc
+    # --------------------------------------------------------------------------
+    def _claim(self):
+        row = self._conn.execute(
+            "SELECT job_id, payload FROM jobs WHERE state = 'pending' ORDER BY created LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute(
+            "UPDATE jobs SET state = 'running', updated = ? WHERE job_id = ?", (time.time(), row[0])
+        )
+        return row[0], json.loads(row[1])
+
+    def _finish(self, job_id, error=None):
+        state = "failed" if error else "done"
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, updated = ?, error = ? WHERE job_id = ?",
+                (state, time.time(), error, job_id),
+            )
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            with self._lock:
+                job = self._claim()
+                if job is None:
+                    self._wakeup.wait(self.poll_interval)
+                    continue
+            job_id, payload = job
+            try:
+                self.handler(payload)
+            except Exception as e:
+                print(f"❌ Lỗi khi xử lý công việc {job_id}: {e}")
+                self._finish(job_id, error=str(e))
+            else:
+                self._finish(job_id)
+
+    def start(self):
+        # Việc đang chạy dở từ lần chạy trước (bot bị tắt giữa chừng) được làm lại
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET state = 'pending' WHERE state = 'running'")
+        self._stopping.clear()
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self, timeout: float = None):
+        """Dừng nhận việc mới; các việc đang chạy được làm nốt, việc đang chờ giữ lại trong DB."""
+        self._stopping.set()
+        with self._lock:
+            self._wakeup.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def purge_finished(self, older_than_seconds: float = 7 * 24 * 3600) -> int:
+        """Xoá các việc đã xong/thất bại cũ hơn older_than_seconds."""
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM jobs WHERE state IN ('done', 'failed') AND updated < ?",
+                (time.time() - older_than_seconds,),
+            )
+            return cur.rowcount
@@ -0,0 +1,101 @@
+# local_scorer.py
+
+import os
+
+import numpy as np
+
+from skill_index import normalize_skill, total_experience_years
+
+# Số ứng viên lấy từ bước retrieval để chấm điểm cục bộ (0 = tắt tầng sàng lọc)
+CASCADE_POOL_SIZE = int(os.getenv("CASCADE_POOL_SIZE", "200"))
+# Ứng viên có điểm cục bộ dưới ngưỡng tuyệt đối này không được gửi tới LLM (0 = tắt)
+CASCADE_MIN_SCORE = float(os.getenv("CASCADE_MIN_SCORE", "0"))
+# Ứng viên có điểm cục bộ dưới tỉ lệ này so với người cao nhất cũng bị loại (0 = tắt)
+CASCADE_RELATIVE_CUTOFF = float(os.getenv("CASCADE_RELATIVE_CUTOFF", "0.5"))
+# Trọng số các thành phần của điểm cục bộ
+CASCADE_WEIGHT_SIMILARITY = float(os.getenv("CASCADE_WEIGHT_SIMILARITY", "0.5"))
+CASCADE_WEIGHT_SKILLS = float(os.getenv("CASCADE_WEIGHT_SKILLS", "0.35"))
+CASCADE_WEIGHT_YEARS = float(os.getenv("CASCADE_WEIGHT_YEARS", "0.15"))
+
+# Kỹ năng bắt buộc trong JD được tính gấp đôi kỹ năng chỉ được nhắc tới
+REQUIRED_SKILL_WEIGHT = 2.0
+
+
+# ==============================================================================
+# CHẤM ĐIỂM CỤC BỘ (KHÔNG GỌI LLM) TRƯỚC BƯỚC RE-RANK BẰNG GPT-4O
+# ==============================================================================
+class LocalScorer:
+    """
+    Tầng sàng lọc rẻ giữa retrieval và LLM: chấm điểm pool_size ứng viên lấy từ
+    chỉ mục vector, chỉ những người vượt ngưỡng và nằm trong top keep mới được
+    gửi tới gpt-4o. Điểm cục bộ (0..1) là tổng có trọng số của:
+    - similarity: điểm cosine của retrieval (cắt về 0..1, không co giãn theo pool
+      nên ngưỡng tuyệt đối vẫn có nghĩa khi pool nhỏ hay các điểm sát nhau);
+    - skills: tỉ lệ kỹ năng nhắc tới trong JD mà CV có (kỹ năng bắt buộc tính gấp
+      đôi, các tên gọi khác của cùng một kỹ năng chỉ tính một lần);
+    - years: mức đáp ứng số năm kinh nghiệm tối thiểu (tổng experiences[].years).
+    Thành phần không áp dụng được (JD không nhắc kỹ năng / số năm) bị bỏ và các
+    trọng số còn lại được chuẩn hoá lại.
+    """
+
+    def __init__(self, pool_size: int = CASCADE_POOL_SIZE, min_score: float = CASCADE_MIN_SCORE,
+                 relative_cutoff: float = CASCADE_RELATIVE_CUTOFF,
+                 weights: dict = None):
+        self.pool_size = pool_size
+        self.min_score = min_score
+        self.relative_cutoff = relative_cutoff
+        self.weights = weights or {
+            "similarity": CASCADE_WEIGHT_SIMILARITY,
+            "skills": CASCADE_WEIGHT_SKILLS,
+            "years": CASCADE_WEIGHT_YEARS,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.pool_size > 0
+
+    def pool(self, top_k: int) -> int:
+        """Số ứng viên cần lấy từ retrieval để còn top_k ứng viên sau sàng lọc."""
+        return max(top_k, self.pool_size) if self.enabled else top_k
+
+    def score(self, skill_index, jd_text: str, candidates: list):
+        """
+        Điểm cục bộ của các ứng viên (cv_data, vector_score): trả về (scores,
+        components) với scores là mảng (n,) và components là dict tên → mảng (n,).
+        cv_data chỉ cần "skills" và "experiences".
+        """
+        requirements = skill_index.parse_requirements(jd_text)
+        required = set(requirements.required_skills).union(*requirements.any_of_skills)
+        jd_skills = {skill: REQUIRED_SKILL_WEIGHT if skill in required else 1.0
+                     for skill in skill_index.mentioned_skills(jd_text)}
+        jd_skills.update({skill: REQUIRED_SKILL_WEIGHT for skill in required})
+
+        similarity = np.clip(np.array([score for _, score in candidates], dtype=np.float64), 0.0, 1.0)
+        components = {"similarity": similarity}
+
+        if jd_skills:
+            total = sum(jd_skills.values())
+            components["skills"] = np.array([
+                sum(jd_skills.get(skill, 0.0) for skill in {normalize_skill(s) for s in cv.get("skills", [])}) / total
+                for cv, _ in candidates
+            ], dtype=np.float64)
+        if requirements.min_years > 0:
+            years = np.array([total_experience_years(cv) for cv, _ in candidates], dtype=np.float64)
+            components["years"] = np.minimum(years / requirements.min_years, 1.0)
+
+        weights = {name: self.weights.get(name, 0.0) for name in components}
+        total_weight = sum(weights.values()) or 1.0
+        scores = sum(components[name] * (weight / total_weight) for name, weight in weights.items())
+        return np.asarray(scores, dtype=np.float64), components
+
+    def select(self, skill_index, jd_text: str, candidates: list, keep: int) -> list:
+        """
+        Giữ tối đa keep ứng viên có điểm cục bộ cao nhất và vượt các ngưỡng, theo
+        thứ tự điểm cục bộ giảm dần. Phần tử trả về giữ nguyên (cv_data, vector_score).
+        """
+        if not candidates:
+            return []
+        scores, _ = self.score(skill_index, jd_text, candidates)
+        threshold = max(self.min_score, self.relative_cutoff * float(scores.max()))
+        order = np.argsort(-scores, kind="stable")
+        return [candidates[i] for i in order[:keep] if scores[i] >= threshold]
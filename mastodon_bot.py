@@ -3,10 +3,17 @@ import os
 from mastodon import Mastodon, StreamListener
 from dotenv import load_dotenv
 import re
-import time
+import threading
+from collections import OrderedDict
 
-# Import hàm xử lý chính từ file đã tái cấu trúc
-from main_refactored import find_best_candidates
+# Pipeline tìm ứng viên (thư viện nặng chỉ được nạp khi warm_up / JD đầu tiên)
+from pipeline import Pipeline
+# Hàng đợi công việc lưu trong SQLite, xử lý bởi nhiều worker
+from job_queue import JobQueue
+# Gửi DM qua hàng đợi nền: gộp nhiều ứng viên vào một status, tuân thủ giới hạn tốc độ
+from dm_dispatcher import DMDispatcher
+# Đo thời gian xử lý và đếm sự kiện của bot
+from instrumentation import count, span, traced
 
 # --- Cấu hình ---
 load_dotenv()
@@ -16,6 +23,13 @@ MASTODON_ACCESS_TOKEN = os.getenv("MASTODON_ACCESS_TOKEN")
 # Lấy URL instance từ file .env hoặc dùng giá trị mặc định
 MASTODON_API_BASE_URL = os.getenv("MASTODON_API_BASE_URL", "https://mastodonuet.duckdns.org/")
 LISTEN_HASHTAG = "tuyendungAI" # Hashtag để bot lắng nghe
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "2")) # Số JD được xử lý đồng thời
+BOT_MAX_PENDING_JOBS = int(os.getenv("BOT_MAX_PENDING_JOBS", "100")) # Giới hạn độ dài hàng đợi
+# Gửi DM từng ứng viên ngay khi đánh giá xong thay vì chờ cả bảng xếp hạng
+BOT_STREAM_RESULTS = os.getenv("BOT_STREAM_RESULTS", "1") == "1"
+
+# Pipeline dùng chung cho mọi worker: giữ client, chỉ mục và cache giữa các JD
+matcher = Pipeline()
 
 # --- Khởi tạo API ---
 mastodon = Mastodon(
@@ -25,96 +39,260 @@ mastodon = Mastodon(
     api_base_url=MASTODON_API_BASE_URL
 )
 
+# Mọi tin nhắn của bot đi qua dispatcher: worker chỉ xếp tin rồi làm việc tiếp
+dm_dispatcher = DMDispatcher(mastodon)
+
+# --- Xử lý một yêu cầu tuyển dụng (chạy trong worker của hàng đợi) ---
+@traced("bot.job")
+def process_recruitment_job(job):
+    """
+    job: dict gồm status_id, acct (người đăng) và jd_text.
+    Chạy toàn bộ quy trình find_best_candidates rồi gửi kết quả qua DM.
+    """
+    acct = job['acct']
+
+    try:
+        # Gọi hàm xử lý cốt lõi
+        print(f"   > Đang xử lý JD: {job['jd_text'][:100]}...")
+        if BOT_STREAM_RESULTS:
+            stream_ranking_dms(acct, matcher.find_best_candidates_stream(job['jd_text']))
+        else:
+            final_ranking = matcher.find_best_candidates(job['jd_text'])
+            with span("bot.deliver", candidates=len(final_ranking)):
+                send_ranking_dms(acct, final_ranking)
+
+    except Exception as e:
+        print(f"❌ Lỗi trong quá trình xử lý: {e}")
+        dm_dispatcher.send(acct, "Rất tiếc, đã có lỗi xảy ra trong quá trình xử lý. Vui lòng thử lại sau.")
+
+
+# --- Nội dung DM cho một ứng viên ---
+def format_candidate_message(result, label):
+    eval_data = result['detailed_evaluation']
+    return (
+        f"{label}: {result.get('name', 'N/A')}\n"
+        f"Điểm: {eval_data.get('score', 'N/A')}/100\n"
+        f"Đánh giá kinh nghiệm: {eval_data.get('experience_match', 'N/A')}\n\n"
+        f"Lý do: {eval_data.get('rationale', 'N/A')}"
+    )
+
+
+# ===================================================================
+# GỬI KẾT QUẢ QUA DM (DISPATCHER GỘP CÁC ỨNG VIÊN VÀO ÍT STATUS NHẤT CÓ THỂ)
+# ===================================================================
+def send_ranking_dms(acct, final_ranking):
+    """Xếp bảng xếp hạng vào hàng đợi DM cho người đăng JD, mỗi ứng viên một đoạn."""
+    if not final_ranking:
+        # Gửi một DM nếu không tìm thấy ứng viên nào
+        dm_dispatcher.send(acct, "Rất tiếc, không tìm thấy ứng viên phù hợp nào trong cơ sở dữ liệu.")
+    else:
+        dm_dispatcher.send(acct, "✅ Đã xử lý xong! Dưới đây là bảng xếp hạng các ứng viên phù hợp nhất:")
+        for i, result in enumerate(final_ranking):
+            dm_dispatcher.send(acct, format_candidate_message(result, f"🏆 HẠNG {i+1}"))
+            print(f"   > Đã xếp DM cho Hạng {i+1}: {result.get('name')}")
+
+    print(f"✅ Đã xếp toàn bộ kết quả DM cho @{acct} (đang chờ gửi: {dm_dispatcher.pending()})")
+
+
+def stream_ranking_dms(acct, updates):
+    """
+    Gửi DM từng ứng viên ngay khi LLM đánh giá xong (kèm hạng tạm thời), trong
+    khi các ứng viên còn lại vẫn đang được đánh giá; tin nhắn cuối cùng là bảng
+    xếp hạng chính thức. updates: generator từ find_best_candidates_stream.
+    """
+    delivered = 0
+    for update in updates:
+        if update.final:
+            with span("bot.deliver_final", candidates=len(update.ranking)):
+                send_final_ranking_dm(acct, update.ranking, delivered)
+            break
+        with span("bot.deliver", streaming=True, order=delivered + 1):
+            if delivered == 0:
+                dm_dispatcher.send(
+                    acct,
+                    "⏳ Đã có kết quả đầu tiên! Các ứng viên sẽ được gửi ngay khi đánh giá xong, "
+                    "bảng xếp hạng cuối cùng ở tin nhắn sau cùng."
+                )
+            delivered += 1
+            label = f"🔎 Ứng viên #{delivered} (hạng tạm thời {update.provisional_rank})"
+            # Các ứng viên xong gần nhau được dispatcher gộp chung một status
+            dm_dispatcher.send(acct, format_candidate_message(update.result, label))
+            print(f"   > Đã xếp DM ứng viên #{delivered}: {update.result.get('name')}")
+    print(f"✅ Đã xếp toàn bộ kết quả DM cho @{acct} (đang chờ gửi: {dm_dispatcher.pending()})")
+
+
+def send_final_ranking_dm(acct, final_ranking, delivered):
+    """Tin nhắn cuối của chế độ luồng: thứ hạng chính thức của các ứng viên đã gửi."""
+    if not final_ranking:
+        dm_dispatcher.send(acct, "Rất tiếc, không tìm thấy ứng viên phù hợp nào trong cơ sở dữ liệu.")
+        return
+    lines = [f"✅ Đã xử lý xong {delivered} ứng viên! Bảng xếp hạng cuối cùng:"]
+    for i, result in enumerate(final_ranking):
+        lines.append(f"{i+1}. {result.get('name', 'N/A')} — {result['detailed_evaluation'].get('score', 'N/A')}/100")
+    # Bảng dài hơn giới hạn ký tự được dispatcher cắt theo dòng
+    dm_dispatcher.send(acct, "\n".join(lines))
+
+
+# --- Hàng đợi công việc: luồng lắng nghe chỉ xếp việc, các worker chạy song song ---
+job_queue = JobQueue(
+    process_recruitment_job,
+    num_workers=BOT_WORKERS,
+    max_pending=BOT_MAX_PENDING_JOBS
+)
+
+
+# --- Thông tin tài khoản của chính bot (lấy một lần, làm mới khi kết nối lại) ---
+class BotIdentity:
+    """
+    Cache kết quả mastodon.me() cho cả phiên chạy, để không phải gọi API
+    mỗi khi có bài đăng mới trên stream. Gọi invalidate() khi stream bị
+    ngắt; lần truy cập tiếp theo sẽ lấy lại thông tin từ server.
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self._account = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        with span("bot.identity_refresh"):
+            account = self.api.me()
+        with self._lock:
+            self._account = account
+        return account
+
+    def invalidate(self):
+        with self._lock:
+            self._account = None
+
+    def get(self):
+        with self._lock:
+            account = self._account
+        return account if account is not None else self.refresh()
+
+    def is_self(self, account) -> bool:
+        me = self.get()
+        return str(account['id']) == str(me['id'])
+
+
+bot_identity = BotIdentity(mastodon)
+
+
+# --- Bộ lọc bài đăng: loại bỏ sớm, không tốn request mạng hay bước parse nào ---
+class SeenStatuses:
+    """Tập status id đã gặp gần đây, giới hạn kích thước (bỏ id cũ nhất khi đầy)."""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check_and_add(self, status_id) -> bool:
+        """Trả về True nếu status_id chưa từng gặp (và ghi nhận nó)."""
+        key = str(status_id)
+        with self._lock:
+            if key in self._ids:
+                return False
+            self._ids[key] = True
+            if len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+            return True
+
+
+seen_statuses = SeenStatuses()
+
+
+def has_listen_hashtag(status) -> bool:
+    # Kiểm tra xem bài đăng có chứa hashtag không
+    return any(tag['name'].lower() == LISTEN_HASHTAG.lower() for tag in status.get('tags', []))
+
+
+def is_not_own_post(status) -> bool:
+    # Kiểm tra xem bài đăng có phải là của chính bot không để tránh lặp vô hạn
+    return not bot_identity.is_self(status['account'])
+
+
+def is_first_seen(status) -> bool:
+    # Stream có thể gửi lại cùng một bài đăng (ví dụ sau khi kết nối lại)
+    return seen_statuses.check_and_add(status['id'])
+
+
+# Thứ tự từ rẻ đến đắt; is_first_seen đặt cuối để chỉ ghi nhận bài đăng đã qua các bộ lọc khác
+STATUS_FILTERS = [has_listen_hashtag, is_not_own_post, is_first_seen]
+
+
+def passes_filters(status) -> bool:
+    return all(check(status) for check in STATUS_FILTERS)
+
+
 # --- Lớp lắng nghe sự kiện từ Mastodon ---
 class RecruitmentListener(StreamListener):
     def on_update(self, status):
-        # Kiểm tra xem bài đăng có phải là của chính bot không để tránh lặp vô hạn
+        count("bot.statuses_received")
         try:
-            my_username = mastodon.me()['username']
-            if status['account']['username'] == my_username:
+            if not passes_filters(status):
+                count("bot.statuses_filtered")
                 return
         except Exception as e:
             print(f"Lỗi khi lấy thông tin bot: {e}")
             return # Bỏ qua nếu không thể xác thực
 
-        # Kiểm tra xem bài đăng có chứa hashtag không
-        hashtags = [tag['name'] for tag in status['tags']]
-        if LISTEN_HASHTAG.lower() in [h.lower() for h in hashtags]:
-            print(f"🔥 Phát hiện bài đăng tuyển dụng từ @{status['account']['acct']}")
-
-            # Trích xuất nội dung JD (loại bỏ HTML tags và hashtag)
-            jd_text = re.sub(r'<.*?>', '', status['content']).strip()
-            jd_text = jd_text.replace(f"#{LISTEN_HASHTAG}", "").strip()
-
+        print(f"🔥 Phát hiện bài đăng tuyển dụng từ @{status['account']['acct']}")
 
-            # Lấy thông tin người đăng để gửi DM
-            poster_account = status['account']
+        # Trích xuất nội dung JD (loại bỏ HTML tags và hashtag)
+        jd_text = re.sub(r'<.*?>', '', status['content']).strip()
+        jd_text = jd_text.replace(f"#{LISTEN_HASHTAG}", "").strip()
 
-            # Gửi tin nhắn xác nhận
-            mastodon.status_post(
-                f"@{poster_account['acct']} Đã nhận yêu cầu tuyển dụng. Bắt đầu quá trình phân tích và sàng lọc. Vui lòng chờ kết quả trong DM!",
+        # Chỉ đưa việc vào hàng đợi rồi trả về ngay để không chặn luồng lắng nghe
+        acct = status['account']['acct']
+        accepted = job_queue.enqueue(status['id'], {
+            "status_id": status['id'],
+            "acct": acct,
+            "jd_text": jd_text,
+        })
+        count("bot.jobs_enqueued" if accepted else "bot.jobs_rejected")
+        if accepted:
+            print(f"   > Đã xếp hàng xử lý (đang chờ: {job_queue.depth()})")
+            # Xác nhận ngay khi nhận việc, không đợi tới lượt worker
+            # (trả lời bài đăng, visibility mặc định của tài khoản; dispatcher gửi trên luồng nền)
+            dm_dispatcher.send(
+                acct,
+                "Đã nhận yêu cầu tuyển dụng. Bắt đầu quá trình phân tích và sàng lọc. Vui lòng chờ kết quả trong DM!",
+                visibility=None,
+                in_reply_to_id=status['id']
+            )
+        elif job_queue.has_job(status['id']):
+            # Bài đăng phát lại sau khi khởi động lại / kết nối lại stream: đã xác nhận từ trước
+            print(f"   > Bỏ qua: bài đăng đã được xử lý")
+        else:
+            print(f"   > Bỏ qua: hàng đợi đã đầy ({BOT_MAX_PENDING_JOBS} việc)")
+            dm_dispatcher.send(
+                acct,
+                "Hệ thống đang bận xử lý nhiều yêu cầu. Vui lòng đăng lại yêu cầu sau ít phút!",
+                visibility=None,
                 in_reply_to_id=status['id']
             )
 
-            try:
-                # Gọi hàm xử lý cốt lõi
-                print(f"   > Đang xử lý JD: {jd_text[:100]}...")
-                final_ranking = find_best_candidates(jd_text)
-                
-                # ===================================================================
-                # PHẦN SỬA ĐỔI CHÍNH - GỬI NHIỀU DM THAY VÌ MỘT
-                # ===================================================================
-                
-                if not final_ranking:
-                    # Gửi một DM nếu không tìm thấy ứng viên nào
-                    mastodon.status_post(
-                        f"@{poster_account['acct']} Rất tiếc, không tìm thấy ứng viên phù hợp nào trong cơ sở dữ liệu.",
-                        visibility='direct'
-                    )
-                else:
-                    # 1. Gửi tin nhắn giới thiệu đầu tiên
-                    mastodon.status_post(
-                        f"@{poster_account['acct']} ✅ Đã xử lý xong! Dưới đây là bảng xếp hạng các ứng viên phù hợp nhất:",
-                        visibility='direct'
-                    )
-                    time.sleep(1) # Chờ 1 giây để đảm bảo thứ tự tin nhắn
-
-                    # 2. Lặp qua từng ứng viên và gửi một DM riêng cho mỗi người
-                    for i, result in enumerate(final_ranking):
-                        eval_data = result['detailed_evaluation']
-                        
-                        # Tạo nội dung tin nhắn cho CHỈ MỘT ứng viên
-                        # Tin nhắn này sẽ ngắn và không vượt quá giới hạn
-                        single_result_message = (
-                            f"🏆 HẠNG {i+1}: {result.get('name', 'N/A')}\n"
-                            f"Điểm: {eval_data.get('score', 'N/A')}/100\n"
-                            f"Đánh giá kinh nghiệm: {eval_data.get('experience_match', 'N/A')}\n\n"
-                            f"Lý do: {eval_data.get('rationale', 'N/A')}"
-                        )
-                        
-                        # Gửi DM cho ứng viên này
-                        mastodon.status_post(
-                            f"@{poster_account['acct']} {single_result_message}",
-                            visibility='direct' # Quan trọng: chỉ gửi cho người nhận!
-                        )
-                        print(f"   > Đã gửi DM cho Hạng {i+1}: {result.get('name')}")
-                        time.sleep(1) # Chờ giữa các tin nhắn để tránh bị coi là spam
-
-                print(f"✅ Đã gửi toàn bộ kết quả DM cho @{poster_account['acct']}")
-
-            except Exception as e:
-                print(f"❌ Lỗi trong quá trình xử lý: {e}")
-                mastodon.status_post(
-                    f"@{poster_account['acct']} Rất tiếc, đã có lỗi xảy ra trong quá trình xử lý. Vui lòng thử lại sau.",
-                    visibility='direct'
-                )
+    def on_abort(self, err):
+        # Stream bị ngắt và sẽ kết nối lại: làm mới thông tin tài khoản ở lần dùng tới
+        print(f"⚠️ Mất kết nối stream: {err}")
+        bot_identity.invalidate()
 
 # --- Chạy bot ---
 if __name__ == "__main__":
     try:
-        my_info = mastodon.me()
+        my_info = bot_identity.refresh()
         print(f"🤖 Bot tuyển dụng '{my_info['display_name']}' (@{my_info['username']}) đang chạy...")
         print(f"   > Lắng nghe hashtag #{LISTEN_HASHTAG} trên instance {MASTODON_API_BASE_URL}")
+        # Nạp trước thư viện, chỉ mục và client để JD đầu tiên không phải chờ khởi tạo
+        matcher.warm_up()
+        # Theo dõi thư mục CV: CV mới chép vào tìm được sau vài giây, JD không phải quét lại thư mục
+        matcher.watch()
+        # Luồng gửi DM chạy trước các worker để kết quả đầu tiên không phải chờ
+        dm_dispatcher.start()
+        # Khởi động các worker (các việc còn dở từ lần chạy trước sẽ được làm tiếp)
+        job_queue.start()
+        print(f"   > {BOT_WORKERS} worker đang chờ việc (còn {job_queue.depth()} việc trong hàng đợi)")
         # Lắng nghe các bài đăng công khai có chứa hashtag
         mastodon.stream_hashtag(LISTEN_HASHTAG, RecruitmentListener(), reconnect_async=True)
     except Exception as e:
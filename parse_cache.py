@@ -0,0 +1,206 @@
+# parse_cache.py
+
+import hashlib
+import json
+import os
+import threading
+
+from instrumentation import count, span
+from resumeParser import (
+    PARSER_VERSION,
+    extract_text_from_bytes,
+    extract_with_gemini,
+    extract_with_gemini_batch,
+    validate_json,
+)
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "parsed_cv")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+# ---------- Content hashing ----------
+def file_content_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ---------- On-disk cache of validated resume JSON ----------
+class ParseCache:
+    """Persistent cache of validate_json output, keyed by file content + parser version.
+
+    Entries are plain JSON files sharded by key prefix. Reads bump the entry's
+    mtime so size-based eviction drops the least recently used entries first.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, version=PARSER_VERSION):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size_bytes = None
+        self._lock = threading.Lock()
+
+    def key_for(self, content_hash):
+        return hashlib.sha256(f"{content_hash}|{self.version}".encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _iter_entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if name.endswith(".json"):
+                    yield os.path.join(shard_dir, name)
+
+    def get(self, content_hash):
+        path = self._entry_path(self.key_for(content_hash))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            count("cache.parse.miss")
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        count("cache.parse.hit")
+        return data
+
+    def put(self, content_hash, data):
+        path = self._entry_path(self.key_for(content_hash))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size_bytes is None:
+                self._size_bytes = sum(os.path.getsize(p) for p in self._iter_entries())
+            else:
+                self._size_bytes += len(payload) - old_size
+            if self._size_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Called with the lock held: drop least recently used entries until
+        # the cache fits in max_bytes again.
+        entries = []
+        for p in self._iter_entries():
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+            count("cache.parse.evictions")
+        self._size_bytes = total
+
+    def invalidate(self, content_hash=None, path=None):
+        """Drop the entry for one content hash (or the current content of a file)."""
+        if content_hash is None:
+            if path is None:
+                raise ValueError("invalidate() needs a content_hash or a path")
+            content_hash = file_content_hash(path)
+        entry = self._entry_path(self.key_for(content_hash))
+        try:
+            size = os.path.getsize(entry)
+            os.remove(entry)
+        except OSError:
+            return False
+        with self._lock:
+            if self._size_bytes is not None:
+                self._size_bytes -= size
+        return True
+
+    def clear(self):
+        with self._lock:
+            for p in list(self._iter_entries()):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            self._size_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# ---------- Cached wrappers around the parser ----------
+def is_empty_parse(data):
+    """True for the validate_json({}) shape returned when Gemini gave no usable JSON."""
+    return not data or data == validate_json({})
+
+
+def parse_text_cached(raw_text, content_hash, cache=None):
+    llm_data = extract_with_gemini(raw_text)
+    with span("validate_json"):
+        final_data = validate_json(llm_data)
+    # An empty LLM result means Gemini failed to return valid JSON; retry next time.
+    if cache is not None and llm_data:
+        cache.put(content_hash, final_data)
+    return final_data
+
+
+def parse_texts_cached_batch(items, cache=None):
+    """Batched parse_text_cached: items is a list of (raw_text, content_hash)."""
+    if len(items) == 1:
+        return [parse_text_cached(items[0][0], items[0][1], cache)]
+    parsed = extract_with_gemini_batch([raw_text for raw_text, _ in items])
+    results = []
+    for (_, content_hash), data in zip(items, parsed):
+        if data is None:
+            # Same shape as a failed single-resume parse; not cached so it is retried
+            results.append(validate_json({}))
+            continue
+        if cache is not None:
+            cache.put(content_hash, data)
+        results.append(data)
+    return results
+
+
+def parse_resume_cached(file_path, cache=None):
+    # Read the file once: the same bytes are hashed and handed to the extractor
+    with open(file_path, "rb") as f:
+        data = f.read()
+    count("parse.bytes_read", len(data))
+    content_hash = hashlib.sha256(data).hexdigest()
+    if cache is not None:
+        cached = cache.get(content_hash)
+        if cached is not None:
+            return cached
+    raw_text = extract_text_from_bytes(data, os.path.splitext(file_path)[1])
+    return parse_text_cached(raw_text, content_hash, cache)
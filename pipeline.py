@@ -0,0 +1,849 @@
+# pipeline.py
+"""
+Đối tượng Pipeline dùng lâu dài cho quy trình parse → embed → retrieve → rerank.
+
+    from pipeline import Pipeline
+
+    matcher = Pipeline()
+    matcher.warm_up()                      # tuỳ chọn: nạp trước mọi thứ
+    ranking = matcher.find_best_candidates(jd_text)
+
+Pipeline giữ các client HTTP (OpenAI embedding, AsyncOpenAI trên một event loop
+nền), chỉ mục vector, search engine và các cache giữa các lần gọi. Các thư viện
+nặng (llama_index, openai, google.generativeai, PyMuPDF, pytesseract) chỉ được
+import ở lần dùng đầu tiên, nên import module này rất nhanh.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+
+from instrumentation import count, span, traced
+
+# Thư mục chứa CV ứng viên
+CV_FOLDER = "cv_folder"
+
+# Model embedding dùng cho cả CV và JD
+EMBED_MODEL = "text-embedding-3-small"
+
+# Backend tìm kiếm mặc định, đổi bằng biến môi trường SEARCH_BACKEND.
+# "numpy" và "llamaindex" dùng chung chỉ mục một vector mỗi CV; "multivector"
+# (bật bằng SEARCH_BACKEND=multivector) dùng chỉ mục nhiều vector (mỗi mục của CV một vector)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "numpy")
+MULTI_VECTOR_BACKEND = "multivector"
+
+# Thư mục gốc của các cache và chỉ mục lưu trên đĩa
+CACHE_DIR = ".cache"
+
+# Các trường create_embedding_content_from_json cần (không phải giải nén highlights)
+EMBEDDING_FIELDS = ("name", "summary", "experiences", "skills")
+
+# Độ dài tối đa (ký tự) của một đoạn embedding và số đoạn tối đa của một CV
+EMBED_CHUNK_CHARS = int(os.getenv("EMBED_CHUNK_CHARS", "1000"))
+EMBED_MAX_CHUNKS = int(os.getenv("EMBED_MAX_CHUNKS", "24"))
+
+
+# ==============================================================================
+# HÀM HỖ TRỢ: TẠO NỘI DUNG VĂN BẢN ĐỂ EMBEDDING TỪ JSON
+# ==============================================================================
+def create_embedding_content_from_json(cv_data: dict) -> str:
+    """
+    Tạo một chuỗi văn bản giàu thông tin từ CV JSON để có kết quả embedding tốt nhất.
+    Hàm này tổng hợp các thông tin quan trọng nhất vào một chuỗi duy nhất.
+    """
+    parts = []
+    if cv_data.get("name"):
+        parts.append(f"Name: {cv_data['name']}")
+    if cv_data.get("summary"):
+        parts.append(f"Summary: {cv_data['summary']}")
+
+    # Tổng hợp kinh nghiệm làm việc
+    exp_parts = []
+    for exp in cv_data.get("experiences", []):
+        role = exp.get('role', '')
+        org = exp.get('organization', '')
+        if role and org:
+            exp_parts.append(f"{role} at {org}")
+    if exp_parts:
+        parts.append("Experience: " + ", ".join(exp_parts))
+
+    # Nối các kỹ năng
+    if cv_data.get("skills"):
+        parts.append("Skills: " + ", ".join(cv_data.get("skills", [])))
+
+    return "\n".join(parts)
+
+
+def _entry_chunks(header: str, highlights: list, max_chars: int) -> list:
+    # Mỗi đoạn lặp lại tiêu đề của mục để vector vẫn mang ngữ cảnh vai trò/tổ chức
+    chunks, current = [], header
+    for highlight in highlights or []:
+        line = f"- {highlight}"
+        if current != header and len(current) + 1 + len(line) > max_chars:
+            chunks.append(current)
+            current = header
+        current += "\n" + line
+    chunks.append(current)
+    return chunks
+
+
+def _joined(label: str, entries: list, keys: tuple) -> str:
+    items = []
+    for entry in entries or []:
+        head, *rest = [str(entry.get(key) or "") for key in keys]
+        details = ", ".join(v for v in rest if v)
+        if head or details:
+            items.append(f"{head} ({details})" if details else head)
+    return f"{label}: " + "; ".join(items) if items else ""
+
+
+def create_embedding_chunks_from_json(cv_data: dict, max_chars: int = EMBED_CHUNK_CHARS,
+                                      max_chunks: int = EMBED_MAX_CHUNKS) -> list:
+    """
+    Chia CV thành các đoạn văn bản để embed riêng (chỉ mục nhiều vector): đoạn
+    tổng quan (như create_embedding_content_from_json, thêm ngôn ngữ), mỗi kinh
+    nghiệm / dự án / hoạt động một hoặc vài đoạn kèm highlights, học vấn, chứng
+    chỉ, giải thưởng và công bố. Đoạn trùng nhau bị bỏ, tối đa max_chunks đoạn.
+    """
+    profile = create_embedding_content_from_json(cv_data)
+    if cv_data.get("languages"):
+        profile += ("\n" if profile else "") + "Languages: " + ", ".join(cv_data["languages"])
+    chunks = [profile]
+
+    for exp in cv_data.get("experiences", []):
+        header = "Experience: " + " at ".join(v for v in (exp.get("role"), exp.get("organization")) if v)
+        if exp.get("years"):
+            header += f" ({exp['years']:g} years)"
+        chunks += _entry_chunks(header, exp.get("highlights"), max_chars)
+    for project in cv_data.get("projects", []):
+        chunks += _entry_chunks(f"Project: {project.get('role', '')}", project.get("highlights"), max_chars)
+
+    chunks.append(_joined("Education", cv_data.get("education"), ("degree", "school", "year")))
+    chunks.append(_joined("Certifications", (cv_data.get("certifications") or []) + (cv_data.get("licenses") or []),
+                          ("name", "issuer", "year")))
+    chunks.append(_joined("Awards", cv_data.get("awards"), ("title", "issuer", "year")))
+    chunks.append(_joined("Publications", cv_data.get("publications"), ("title", "journal", "year")))
+
+    for activity in cv_data.get("activities", []):
+        header = "Activity: " + " at ".join(v for v in (activity.get("role"), activity.get("organization")) if v)
+        chunks += _entry_chunks(header, activity.get("highlights"), max_chars)
+
+    return [chunk for chunk in dict.fromkeys(chunks) if chunk.strip()][:max_chunks]
+
+
+# ==============================================================================
+# PIPELINE: GIỮ CLIENT, CHỈ MỤC VÀ CACHE GIỮA CÁC LẦN GỌI
+# ==============================================================================
+class Pipeline:
+    """
+    Dịch vụ tìm ứng viên cho JD, tạo một lần và dùng lại cho mọi JD.
+    - cv_folder, embed_model_name, backend, cache_dir: cấu hình mặc định.
+    - embed_model / chat_client: truyền vào để thay client thật (ví dụ trong
+      benchmark); mặc định tạo OpenAIEmbedding / AsyncOpenAI ở lần dùng đầu.
+    Mọi thành phần được tạo lười (lazy) và an toàn khi nhiều luồng cùng gọi.
+    Pipeline chỉ cập nhật chỉ mục của backend mặc định: chunk_store (nhiều
+    vector mỗi CV) với "multivector", vector_store (một vector mỗi CV) với
+    các backend còn lại.
+    """
+
+    def __init__(self, cv_folder: str = CV_FOLDER, embed_model_name: str = EMBED_MODEL,
+                 backend: str = None, cache_dir: str = CACHE_DIR, embed_model=None, chat_client=None):
+        self.cv_folder = cv_folder
+        self.embed_model_name = embed_model_name
+        self.backend = backend or SEARCH_BACKEND
+        self.multi_vector = self.backend == MULTI_VECTOR_BACKEND
+        self.cache_dir = cache_dir
+        self._components = {}
+        if embed_model is not None:
+            self._components["raw_embed_model"] = embed_model
+        if chat_client is not None:
+            self._components["chat_client"] = chat_client
+        self._lock = threading.RLock()
+        self._loop = None
+        self._loop_thread = None
+
+    # --------------------------------------------------------------------------
+    # Thành phần tạo lười
+    # --------------------------------------------------------------------------
+    def _get(self, name, factory):
+        component = self._components.get(name)
+        if component is None:
+            with self._lock:
+                component = self._components.get(name)
+                if component is None:
+                    with span("pipeline.load", component=name):
+                        component = factory()
+                    self._components[name] = component
+        return component
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    @property
+    def parse_cache(self):
+        def create():
+            # Kéo theo resumeParser (Gemini, PyMuPDF, pytesseract)
+            from parse_cache import ParseCache
+            return ParseCache(self._path("parsed_cv"))
+        return self._get("parse_cache", create)
+
+    @property
+    def vector_store(self):
+        def create():
+            from vector_store import VectorStore
+            return VectorStore(self._path("vector_index"), model=self.embed_model_name)
+        return self._get("vector_store", create)
+
+    @property
+    def chunk_store(self):
+        """Chỉ mục nhiều vector: mỗi đoạn của CV (create_embedding_chunks_from_json) một hàng."""
+        def create():
+            from vector_store import VectorStore
+            return VectorStore(self._path("chunk_index"), model=self.embed_model_name)
+        return self._get("chunk_store", create)
+
+    @property
+    def index_store(self):
+        """Chỉ mục được cập nhật khi thư mục CV thay đổi (theo backend mặc định)."""
+        return self.chunk_store if self.multi_vector else self.vector_store
+
+    @property
+    def local_scorer(self):
+        """Tầng sàng lọc cục bộ trước LLM (local_scorer.py), cấu hình qua biến môi trường CASCADE_*."""
+        def create():
+            from local_scorer import LocalScorer
+            return LocalScorer()
+        return self._get("local_scorer", create)
+
+    @property
+    def embedding_cache(self):
+        def create():
+            from embedding_cache import EmbeddingCache
+            return EmbeddingCache(self._path("embeddings.sqlite3"))
+        return self._get("embedding_cache", create)
+
+    @property
+    def rerank_cache(self):
+        def create():
+            from rerank_cache import RerankCache
+            return RerankCache(self._path("rerank.sqlite3"))
+        return self._get("rerank_cache", create)
+
+    @property
+    def embed_model(self):
+        """Model embedding (giữ client HTTP giữa các lần gọi), bọc bởi cache embedding."""
+        def create_raw():
+            from llama_index.embeddings.openai import OpenAIEmbedding
+            return OpenAIEmbedding(model=self.embed_model_name)
+
+        def create():
+            from embedding_cache import CachedEmbedding
+            raw = self._get("raw_embed_model", create_raw)
+            return CachedEmbedding(raw, self.embedding_cache, self.embed_model_name)
+        return self._get("embed_model", create)
+
+    @property
+    def chat_client(self):
+        """AsyncOpenAI dùng chung, chỉ dùng trên event loop nền của Pipeline."""
+        def create():
+            from openai import AsyncOpenAI
+            return AsyncOpenAI()
+        return self._get("chat_client", create)
+
+    def search_engine(self, backend: str = None):
+        """Search engine trên index_store, tạo một lần cho mỗi backend."""
+        backend = backend or self.backend
+        if (backend == MULTI_VECTOR_BACKEND) != self.multi_vector:
+            raise ValueError(f"Backend {backend} dùng chỉ mục khác với backend mặc định {self.backend}, "
+                             f"chỉ mục đó không được cập nhật")
+
+        def create():
+            from search_engine import make_search_engine
+            return make_search_engine(backend, self.index_store)
+        return self._get(f"search_engine.{backend}", create)
+
+    # --------------------------------------------------------------------------
+    # Event loop nền cho các lệnh gọi LLM bất đồng bộ
+    # --------------------------------------------------------------------------
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever, name="pipeline-loop", daemon=True
+                )
+                self._loop_thread.start()
+            return self._loop
+
+    def submit(self, coro) -> Future:
+        """
+        Chạy coroutine trên event loop nền (client HTTP được giữ và dùng lại giữa
+        các JD). Context của bên gọi được giữ để span lồng đúng chỗ.
+        """
+        loop = self._ensure_loop()
+        ctx = contextvars.copy_context()
+        future = Future()
+
+        def start():
+            task = loop.create_task(coro, context=ctx)
+
+            def done(t):
+                if t.cancelled():
+                    future.cancel()
+                elif t.exception() is not None:
+                    future.set_exception(t.exception())
+                else:
+                    future.set_result(t.result())
+            task.add_done_callback(done)
+
+        loop.call_soon_threadsafe(start)
+        return future
+
+    def _rerank(self, jd_text, retrieved):
+        from reranker import rerank_candidates_async
+        return self.submit(rerank_candidates_async(
+            jd_text, retrieved, client=self.chat_client, cache=self.rerank_cache
+        )).result()
+
+    # --------------------------------------------------------------------------
+    # Khởi động / tắt
+    # --------------------------------------------------------------------------
+    def warm_up(self, connect: bool = False):
+        """
+        Import các thư viện nặng và tạo trước mọi thành phần (cache, chỉ mục, search
+        engine, client, event loop) để JD đầu tiên không phải chịu chi phí khởi tạo.
+        connect=True: embed thử một truy vấn để mở sẵn kết nối HTTP tới OpenAI.
+        """
+        with span("pipeline.warm_up"):
+            import ingestion  # noqa: F401  (resumeParser, PyMuPDF, pytesseract, Gemini)
+            import reranker  # noqa: F401  (openai)
+            self.parse_cache
+            self.rerank_cache
+            self.local_scorer
+            self.chat_client
+            self._ensure_loop()
+            len(self.search_engine())
+            embed_model = self.embed_model
+            if connect:
+                embed_model.get_query_embedding("warm up")
+        return self
+
+    def close(self):
+        """Dừng các watcher, đóng client bất đồng bộ và dừng event loop nền."""
+        for name, component in list(self._components.items()):
+            if name.startswith("catalog.") and component.watcher is not None:
+                component.watcher.stop()
+                component.watcher = None
+        with self._lock:
+            loop, self._loop = self._loop, None
+            client = self._components.pop("chat_client", None)
+        if loop is None:
+            return
+        if client is not None and hasattr(client, "close"):
+            asyncio.run_coroutine_threadsafe(client.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        self._loop_thread.join()
+        loop.close()
+
+    # ==========================================================================
+    # BƯỚC 1: PARSE TẤT CẢ CV TRONG THƯ MỤC VÀ TẠO DATABASE
+    # ==========================================================================
+    def create_cv_database(self, folder_path: str = None, use_cache: bool = True,
+                           cpu_workers: int = None, llm_workers: int = None):
+        """
+        Quét một thư mục, parse tất cả các file CV (PDF, ảnh) bằng resumeParser
+        và trả về một danh sách các đối tượng JSON chứa thông tin CV.
+        Các CV đã parse trước đó (cùng nội dung file, cùng phiên bản prompt/schema)
+        được lấy từ cache thay vì gọi lại Gemini. use_cache=False để tắt cache.
+        Việc trích xuất text chạy song song trên cpu_workers tiến trình, việc gọi
+        Gemini chạy đồng thời tối đa llm_workers yêu cầu (xem ingestion.py).
+        Mỗi nhóm CV trùng lặp (dedup.py) chỉ giữ bản mới nhất; bản cũ hơn có text
+        gần như giống hệt không được gửi tới Gemini.
+        """
+        from ingestion import DEFAULT_CPU_WORKERS, DEFAULT_LLM_WORKERS, ingest_files, list_cv_files
+        from parse_cache import file_content_hash
+
+        folder_path = folder_path or self.cv_folder
+        cache = self.parse_cache if use_cache else None
+        print("--- BƯỚC 1: Đang parse các CV từ thư mục... ---")
+        database = []
+        # Kiểm tra xem thư mục có tồn tại không
+        if not os.path.exists(folder_path):
+            print(f"Lỗi: Thư mục '{folder_path}' không tồn tại.")
+            return []
+
+        filenames = list_cv_files(folder_path)
+        hashes, duplicates = {}, None
+        index = self.catalog(folder_path).duplicates
+        if index is not None:
+            files = {}
+            for filename in filenames:
+                file_path = os.path.join(folder_path, filename)
+                try:
+                    files[filename] = (file_content_hash(file_path), os.stat(file_path).st_mtime_ns)
+                except OSError:
+                    continue
+            hashes = {filename: content_hash for filename, (content_hash, _) in files.items()}
+            duplicates = index.view(files)
+
+        # Parse cả thư mục theo lô; kết quả giữ đúng thứ tự file, lỗi tách riêng từng file
+        results = ingest_files(
+            folder_path, filenames, cache, hashes,
+            cpu_workers=DEFAULT_CPU_WORKERS if cpu_workers is None else cpu_workers,
+            llm_workers=DEFAULT_LLM_WORKERS if llm_workers is None else llm_workers,
+            duplicates=duplicates,
+        )
+        representatives = {}
+        if duplicates is not None:
+            # Tên sau khi parse chặn việc gộp nhầm hai người dùng chung số điện thoại, email...
+            for result in results:
+                if result.data is not None:
+                    index.set_name(hashes[result.filename], result.data.get('name', ''))
+            representatives = duplicates.representatives()
+        for result in results:
+            if result.error is not None:
+                print(f"  > Lỗi khi xử lý file {result.filename}: {result.error}")
+                continue
+            if result.duplicate_of is not None or representatives.get(result.filename, result.filename) != result.filename:
+                print(f"  > Bỏ qua {result.filename}: trùng với bản mới hơn "
+                      f"{result.duplicate_of or representatives[result.filename]}")
+                continue
+            parsed_data = result.data
+            # Thêm một ID duy nhất cho mỗi CV, lấy từ tên file
+            parsed_data['id'] = os.path.splitext(result.filename)[0]
+            database.append(parsed_data)
+            source = " (cache)" if result.from_cache else ""
+            print(f"  > Xử lý thành công CV của: {parsed_data.get('name', 'N/A')}{source}")
+        if index is not None:
+            index.save(set(hashes.values()))
+        if cache is not None:
+            stats = cache.stats()
+            print(f"  > Cache parse: {stats['hits']} hit / {stats['misses']} miss")
+        print(f"--- HOÀN THÀNH BƯỚC 1: Đã parse được {len(database)} CV ---\n")
+        return database
+
+    # ==========================================================================
+    # BƯỚC 1 (TĂNG DẦN): CHỈ XỬ LÝ CÁC FILE MỚI / ĐÃ SỬA / ĐÃ XOÁ
+    # ==========================================================================
+    def catalog(self, folder_path: str = None):
+        """Danh mục CV đã parse của một thư mục, kèm manifest lưu trong cache_dir."""
+        folder_path = folder_path or self.cv_folder
+        key = os.path.abspath(folder_path)
+
+        def create():
+            from cv_record_store import CVRecordStore
+            from cv_watcher import CVCatalog, Manifest
+            from dedup import DEDUP_ENABLED, DuplicateIndex
+            name = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+            duplicates = DuplicateIndex(self._path(os.path.join("duplicates", name + ".json"))) if DEDUP_ENABLED else None
+            return CVCatalog(folder_path, Manifest(self._path(os.path.join("manifests", name + ".json"))),
+                             CVRecordStore(self._path(os.path.join("records", name + ".npz"))), duplicates)
+        return self._get(f"catalog.{key}", create)
+
+    def _restore_catalog(self, catalog):
+        """
+        Lần đầu: đối chiếu kho CV đã lưu với manifest. CV thiếu trong kho được nạp
+        lại từ cache parse (không gọi Gemini); CV không có trong manifest bị xoá.
+        """
+        records = catalog.records
+        known_ids = set()
+        for filename, state in list(catalog.manifest.files.items()):
+            cv_id = os.path.splitext(filename)[0]
+            known_ids.add(cv_id)
+            if cv_id in records:
+                continue
+            data = self.parse_cache.get(state.content_hash)
+            if data is None:
+                # Không còn trong cache (hoặc lần trước lỗi): coi như file mới để parse lại
+                del catalog.manifest.files[filename]
+                continue
+            records.put(cv_id, data)
+        for cv_id in records.ids():
+            if cv_id not in known_ids:
+                records.delete(cv_id)
+
+    def refresh(self, folder_path: str = None):
+        """
+        Đưa các thay đổi của thư mục CV vào danh mục CV và chỉ mục vector:
+        chỉ parse file mới/đã sửa, chỉ embed CV có nội dung thay đổi, xoá CV của
+        file đã xoá, và mỗi nhóm CV trùng lặp chỉ giữ bản mới nhất. Trả về
+        FolderChanges, hoặc None nếu thư mục không tồn tại.
+        """
+        catalog = self.catalog(folder_path)
+        with catalog.lock, span("pipeline.refresh") as attrs:
+            if not os.path.isdir(catalog.folder_path):
+                print(f"Lỗi: Thư mục '{catalog.folder_path}' không tồn tại.")
+                return None
+            first = not catalog.loaded
+            if first:
+                self._restore_catalog(catalog)
+            changes, states = catalog.manifest.scan(catalog.folder_path)
+            attrs.update({"added": len(changes.added), "modified": len(changes.modified),
+                          "deleted": len(changes.deleted)})
+            if not first and not any(changes):
+                return changes
+
+            print(f"--- BƯỚC 1: Cập nhật CV từ thư mục: +{len(changes.added)} mới, "
+                  f"~{len(changes.modified)} sửa, -{len(changes.deleted)} xoá ---")
+            changed_ids, removed_ids = [], []
+            for filename in changes.deleted:
+                removed_ids.append(os.path.splitext(filename)[0])
+                catalog.records.delete(removed_ids[-1])
+            duplicates = None
+            if catalog.duplicates is not None:
+                duplicates = catalog.duplicates.view(
+                    {filename: (state.content_hash, state.mtime_ns) for filename, state in states.items()})
+            to_parse = changes.added + changes.modified
+            skipped = set()
+            if to_parse:
+                skipped = self._ingest_into_catalog(catalog, to_parse, states, duplicates, changed_ids, removed_ids)
+            if duplicates is not None:
+                self._collapse_duplicates(catalog, duplicates, states, skipped, changed_ids, removed_ids)
+
+            snapshot = catalog.rebuild()
+            if first:
+                # Đối chiếu toàn bộ chỉ mục một lần (CV cũ không còn trong thư mục bị xoá)
+                if self.multi_vector:
+                    self.sync_vector_store(list(catalog.records.scan(highlights=True)))
+                else:
+                    self.sync_vector_store(list(catalog.records.scan(EMBEDDING_FIELDS)))
+            else:
+                changed = [catalog.records.load(cv_id, highlights=self.multi_vector)
+                           for cv_id in changed_ids if cv_id in snapshot.ids]
+                removed = {cv_id for cv_id in removed_ids if cv_id not in snapshot.ids}
+                with span("pipeline.embed_sync") as sync_attrs:
+                    vector_changes = self.index_store.update(
+                        [item for cv in changed for item in self._index_items(cv)],
+                        self.embed_model.get_text_embedding_batch,
+                        deleted=self._index_ids_of(removed | set(changed_ids)),
+                    )
+                    sync_attrs.update(vector_changes)
+                count("embed.documents", vector_changes['added'] + vector_changes['updated'])
+            # Lưu kho CV trước manifest: nếu dừng giữa chừng, lần sau chỉ parse lại phần thiếu
+            catalog.records.save()
+            if catalog.duplicates is not None:
+                catalog.duplicates.save({state.content_hash for state in states.values()})
+            catalog.manifest.files = states
+            catalog.manifest.save()
+            catalog.loaded = True
+            print(f"--- HOÀN THÀNH BƯỚC 1: Có {len(snapshot.ids)} CV ---\n")
+            return changes
+
+    def _ingest_into_catalog(self, catalog, filenames, states, duplicates, changed_ids, removed_ids):
+        """
+        Parse các file và ghi vào kho CV. Trả về tập file bị bỏ qua vì đã có bản
+        mới hơn trùng với nó trong thư mục (không gọi Gemini). File lỗi (kể cả
+        Gemini không trả về JSON) bị bỏ khỏi states để lần quét sau parse lại.
+        """
+        from ingestion import ingest_files
+
+        skipped = set()
+        hashes = {filename: states[filename].content_hash for filename in filenames}
+        for result in ingest_files(catalog.folder_path, filenames, self.parse_cache, hashes, duplicates=duplicates):
+            cv_id = os.path.splitext(result.filename)[0]
+            if result.error is not None or result.duplicate_of is not None:
+                if result.error is not None:
+                    # Bỏ khỏi manifest để lần quét sau thử lại (ví dụ Gemini lỗi tạm thời)
+                    print(f"  > Lỗi khi xử lý file {result.filename}: {result.error}")
+                    states.pop(result.filename, None)
+                else:
+                    print(f"  > Bỏ qua {result.filename}: trùng với bản mới hơn {result.duplicate_of}")
+                    skipped.add(result.filename)
+                if catalog.records.delete(cv_id):
+                    removed_ids.append(cv_id)
+                continue
+            parsed_data = result.data
+            parsed_data['id'] = cv_id
+            catalog.records.put(cv_id, parsed_data)
+            changed_ids.append(cv_id)
+            if duplicates is not None:
+                catalog.duplicates.set_name(hashes[result.filename], parsed_data.get('name', ''))
+            source = " (cache)" if result.from_cache else ""
+            print(f"  > Xử lý thành công CV của: {parsed_data.get('name', 'N/A')}{source}")
+        return skipped
+
+    def _collapse_duplicates(self, catalog, duplicates, states, skipped, changed_ids, removed_ids):
+        """
+        Mỗi nhóm CV trùng nhau chỉ giữ bản mới nhất trong kho CV (và chỉ mục vector),
+        để các bản cũ không chiếm chỗ trong top-k. File trước đây bị gộp hoặc vừa bị
+        bỏ qua mà nay là bản mới nhất của nhóm (ví dụ bản mới hơn vừa bị xoá, hoặc
+        hoá ra là người khác sau khi parse) được parse lại.
+        """
+        with span("pipeline.dedup") as attrs:
+            representatives = duplicates.representatives()
+            collapsed = {filename for filename, rep in representatives.items() if rep != filename}
+            for filename in sorted(collapsed):
+                cv_id = os.path.splitext(filename)[0]
+                if catalog.records.delete(cv_id):
+                    removed_ids.append(cv_id)
+                    print(f"  > Gộp {filename} vào bản mới hơn {representatives[filename]}")
+            revived = sorted(filename for filename in (catalog.duplicates.collapsed | skipped) - collapsed
+                             if filename in states and os.path.splitext(filename)[0] not in catalog.records)
+            catalog.duplicates.collapsed = collapsed
+            if revived:
+                self._ingest_into_catalog(catalog, revived, states, duplicates, changed_ids, removed_ids)
+            attrs.update({"collapsed": len(collapsed), "revived": len(revived)})
+        count("dedup.collapsed", len(collapsed))
+
+    def load_cvs(self, folder_path: str = None):
+        """
+        Trạng thái hiện tại (CatalogSnapshot) của thư mục CV. Nếu thư mục đang được
+        watch() theo dõi thì trả về ngay; nếu không thì quét tìm thay đổi trước.
+        """
+        catalog = self.catalog(folder_path)
+        if catalog.watcher is None or not catalog.loaded:
+            self.refresh(folder_path)
+        return catalog.snapshot
+
+    def watch(self, folder_path: str = None, interval: float = None):
+        """
+        Theo dõi thư mục CV trên một luồng nền: CV mới chép vào được parse, embed
+        và tìm được sau vài giây, còn truy vấn không phải quét thư mục nữa.
+        """
+        from cv_watcher import DEFAULT_POLL_INTERVAL, FolderWatcher
+
+        catalog = self.catalog(folder_path)
+        if not catalog.loaded:
+            self.refresh(folder_path)
+        with self._lock:
+            if catalog.watcher is None:
+                catalog.watcher = FolderWatcher(
+                    lambda: self.refresh(folder_path),
+                    DEFAULT_POLL_INTERVAL if interval is None else interval,
+                ).start()
+        return catalog.watcher
+
+    # ==========================================================================
+    # BƯỚC 2: CẬP NHẬT CHỈ MỤC, LỌC VÀ TRUY XUẤT ỨNG VIÊN
+    # ==========================================================================
+    def _index_items(self, cv_data: dict) -> list:
+        """Các (id, văn bản) của một CV trong index_store: một đoạn mỗi mục, hoặc một văn bản."""
+        if self.multi_vector:
+            from search_engine import chunk_id
+            return [(chunk_id(cv_data["id"], i), text)
+                    for i, text in enumerate(create_embedding_chunks_from_json(cv_data))]
+        return [(cv_data["id"], create_embedding_content_from_json(cv_data))]
+
+    def _index_ids_of(self, cv_ids: set) -> list:
+        """Id trong index_store của các CV cv_ids (các đoạn của chúng với chỉ mục nhiều vector)."""
+        if not self.multi_vector:
+            return list(cv_ids)
+        from search_engine import chunk_owner
+        return [item_id for item_id in self.index_store.ids if chunk_owner(item_id) in cv_ids]
+
+    def sync_vector_store(self, cv_database: list):
+        """
+        Chỉ embed lại những CV (hoặc đoạn CV) mới hoặc có nội dung thay đổi kể từ
+        lần chạy trước, đồng thời xoá khỏi chỉ mục những CV không còn trong thư mục.
+        Với chỉ mục nhiều vector, cv_database cần có highlights.
+        """
+        with span("pipeline.embed_sync") as attrs:
+            changes = self.index_store.sync(
+                [item for cv in cv_database for item in self._index_items(cv)],
+                self.embed_model.get_text_embedding_batch,
+            )
+            attrs.update(changes)
+        count("embed.documents", changes['added'] + changes['updated'])
+        print(f"  > Chỉ mục: +{changes['added']} mới, ~{changes['updated']} cập nhật, -{changes['deleted']} xoá")
+        return changes
+
+    @staticmethod
+    def prefilter_candidates(skill_index, job_description_text: str):
+        """
+        Lọc trước theo yêu cầu cứng của JD (ví dụ "Ít nhất 4 năm kinh nghiệm Python").
+        Trả về tập id CV đạt yêu cầu, hoặc None nếu JD không có yêu cầu cứng.
+        """
+        with span("pipeline.prefilter") as attrs:
+            requirements = skill_index.parse_requirements(job_description_text)
+            allowed_ids = skill_index.filter(requirements)
+            attrs["passed"] = len(skill_index) if allowed_ids is None else len(allowed_ids)
+        if allowed_ids is not None:
+            print(f"  > Lọc theo yêu cầu cứng ({requirements.min_years:g}+ năm, "
+                  f"kỹ năng: {', '.join(sorted(requirements.required_skills)) or 'không'}): "
+                  f"còn {len(allowed_ids)}/{len(skill_index)} CV")
+        return allowed_ids
+
+    def retrieve_candidates(self, job_description_text: str, top_k: int = 3, cv_folder: str = None,
+                            prefilter: bool = True, backend: str = None):
+        """
+        Parse thư mục CV, cập nhật chỉ mục vector và trả về tối đa top_k ứng viên
+        dạng danh sách (cv_data, initial_score) cho bước re-rank: lấy một pool lớn
+        hơn từ chỉ mục rồi giữ những người qua được tầng sàng lọc cục bộ.
+        Tham số như find_best_candidates.
+        """
+        # --- Bước 1: Cập nhật CV đã thay đổi trong thư mục (hoặc đọc trạng thái của watcher) ---
+        with span("pipeline.parse") as attrs:
+            snapshot = self.load_cvs(cv_folder)
+            attrs["cvs"] = len(snapshot.ids)
+        if not snapshot.ids:
+            print("Không có CV nào trong cơ sở dữ liệu để xử lý. Dừng lại.")
+            return []
+
+        # ======================================================================
+        # BƯỚC 2: FILTER & RETRIEVAL (Chỉ mục vector lưu trên đĩa)
+        # ======================================================================
+        print("--- BƯỚC 2: Đang truy xuất ứng viên (Retrieval) ---")
+        allowed_ids = None
+        if prefilter:
+            allowed_ids = self.prefilter_candidates(snapshot.skill_index, job_description_text)
+
+        # Tìm kiếm các ứng viên phù hợp nhất (top_k) trực tiếp trên chỉ mục đã lưu
+        with span("pipeline.embed_query"):
+            query_vector = self.embed_model.get_query_embedding(job_description_text)
+        count("embed.queries")
+        engine = self.search_engine(backend)
+        pool = self.local_scorer.pool(top_k)
+        with span("pipeline.retrieve", top_k=pool, backend=engine.name) as attrs:
+            hits = engine.search(query_vector, top_k=pool, allowed_ids=allowed_ids)
+            hits = self._relax_prefilter(engine, query_vector, hits, allowed_ids, top_k, pool)
+            attrs["retrieved"] = len(hits)
+        retrieved = self._load_hits(snapshot, self._cascade(snapshot, job_description_text, hits, top_k))
+
+        print(f"--- HOÀN THÀNH BƯỚC 2: Đã tìm thấy {len(retrieved)} ứng viên tiềm năng ---\n")
+        return retrieved
+
+    @staticmethod
+    def _relax_prefilter(engine, query_vector, hits: list, allowed_ids, top_k: int, pool: int) -> list:
+        """
+        Khi quá ít CV đạt yêu cầu cứng (ít hơn top_k), bổ sung các ứng viên gần nhất
+        không qua bộ lọc vào sau những người đạt yêu cầu, để JD có yêu cầu quá chặt
+        (hoặc bị hiểu sai) vẫn trả về đủ ứng viên.
+        """
+        if allowed_ids is None or len(hits) >= top_k:
+            return hits
+        seen = {cv_id for cv_id, _ in hits}
+        extra = [(cv_id, score) for cv_id, score in engine.search(query_vector, top_k=pool) if cv_id not in seen]
+        if extra:
+            print(f"  > Chỉ {len(hits)} CV đạt yêu cầu cứng, bổ sung ứng viên không qua bộ lọc")
+        return hits + extra[:pool - len(hits)]
+
+    def _cascade(self, snapshot, jd_text: str, hits: list, top_k: int) -> list:
+        """
+        Tầng sàng lọc rẻ trước LLM: chấm điểm cục bộ (độ khớp kỹ năng, số năm kinh
+        nghiệm, điểm vector) cho cả pool và chỉ giữ tối đa top_k (cv_id, score)
+        vượt ngưỡng. Chỉ đọc các trường có cấu trúc của CV (không giải nén highlights).
+        """
+        scorer = self.local_scorer
+        if not scorer.enabled or len(hits) <= top_k:
+            return hits[:top_k]
+        with span("pipeline.cascade", pool=len(hits)) as attrs:
+            candidates = [(cv, score) for cv, score in
+                          ((snapshot.records.load(cv_id, highlights=False), score) for cv_id, score in hits)
+                          if cv is not None]
+            survivors = scorer.select(snapshot.skill_index, jd_text, candidates, top_k)
+            attrs["survivors"] = len(survivors)
+        count("cascade.filtered", len(candidates) - len(survivors))
+        print(f"  > Sàng lọc cục bộ: {len(survivors)}/{len(candidates)} ứng viên được gửi tới LLM")
+        return [(cv["id"], score) for cv, score in survivors]
+
+    @staticmethod
+    def _load_hits(snapshot, hits):
+        """(cv_id, score) → (cv_data, score), đọc CV đầy đủ từ kho CV chỉ cho các id tìm được."""
+        retrieved = []
+        for cv_id, score in hits:
+            cv_data = snapshot.records.load(cv_id) if cv_id in snapshot.ids else None
+            if cv_data is not None:
+                retrieved.append((cv_data, score))
+        return retrieved
+
+    # ==========================================================================
+    # TOÀN BỘ QUY TRÌNH RAG
+    # ==========================================================================
+    @traced("find_best_candidates")
+    def find_best_candidates(self, job_description_text: str, top_k: int = 3, cv_folder: str = None,
+                             prefilter: bool = True, backend: str = None):
+        """
+        Nhận một JD, thực hiện toàn bộ quy trình RAG và trả về danh sách các ứng
+        viên đã được đánh giá và xếp hạng theo "score" giảm dần.
+        top_k: số ứng viên tối đa được LLM đánh giá chi tiết (chọn bởi tầng sàng lọc
+        cục bộ từ CASCADE_POOL_SIZE ứng viên gần nhất của bước retrieval).
+        cv_folder: thư mục chứa CV (mặc định self.cv_folder).
+        prefilter: loại trước các CV không đạt yêu cầu cứng của JD (số năm kinh
+        nghiệm, kỹ năng/ngôn ngữ bắt buộc) rồi mới tính điểm vector; nếu còn ít hơn
+        top_k CV thì bổ sung thêm ứng viên không qua bộ lọc.
+        backend: backend tìm top-k, mặc định self.backend. "numpy" và "llamaindex"
+        dùng được thay cho nhau; "multivector" chỉ dùng được khi Pipeline được tạo
+        với backend "multivector" (chỉ mục nhiều vector được cập nhật thay cho chỉ
+        mục một vector), và ngược lại.
+        """
+        retrieved = self.retrieve_candidates(job_description_text, top_k, cv_folder, prefilter, backend)
+        if not retrieved:
+            return []
+
+        # ======================================================================
+        # BƯỚC 3: LLM RE-RANKER / MATCHING AGENT (Phân tích sâu)
+        # ======================================================================
+        print("--- BƯỚC 3: Đang đánh giá chi tiết từng ứng viên bằng LLM (GPT-4o) ---")
+
+        # Các ứng viên được đánh giá đồng thời (giới hạn số yêu cầu song song và tốc độ
+        # gọi API, tự thử lại khi gặp lỗi tạm thời), kết quả đã sắp xếp theo điểm LLM
+        with span("pipeline.rerank", candidates=len(retrieved)):
+            sorted_results = self._rerank(job_description_text, retrieved)
+
+        print("--- HOÀN THÀNH BƯỚC 3 ---\n")
+        return sorted_results
+
+    def find_best_candidates_stream(self, job_description_text: str, top_k: int = 3, cv_folder: str = None,
+                                    prefilter: bool = True, backend: str = None):
+        """
+        Phiên bản dạng luồng của find_best_candidates (cùng tham số): generator trả về
+        RankingUpdate ngay khi từng ứng viên được LLM đánh giá xong, kèm hạng tạm
+        thời. Cập nhật cuối cùng có final=True và mang bảng xếp hạng hoàn chỉnh.
+        """
+        from reranker import iter_ranking_updates
+
+        with span("find_best_candidates_stream"):
+            retrieved = self.retrieve_candidates(job_description_text, top_k, cv_folder, prefilter, backend)
+            print("--- BƯỚC 3: Đang đánh giá chi tiết từng ứng viên bằng LLM (GPT-4o), trả kết quả dần ---")
+            with span("pipeline.rerank", candidates=len(retrieved), streaming=True):
+                yield from iter_ranking_updates(
+                    job_description_text, retrieved, runner=self.submit,
+                    client=self.chat_client, cache=self.rerank_cache,
+                )
+            print("--- HOÀN THÀNH BƯỚC 3 ---\n")
+
+    @traced("find_best_candidates_batch")
+    def find_best_candidates_batch(self, job_description_texts: list, top_k: int = 3, cv_folder: str = None,
+                                   prefilter: bool = True, backend: str = None):
+        """
+        Xếp hạng ứng viên cho nhiều JD trong một lượt: parse và cập nhật chỉ mục
+        một lần, embed tất cả JD như find_best_candidates (embedding truy vấn, dùng
+        chung cache), tìm top-k cho mọi JD bằng một phép nhân ma trận. Trả về danh sách kết quả theo đúng thứ tự các JD.
+        """
+        with span("pipeline.parse") as attrs:
+            snapshot = self.load_cvs(cv_folder)
+            attrs["cvs"] = len(snapshot.ids)
+        if not snapshot.ids or not job_description_texts:
+            print("Không có CV nào trong cơ sở dữ liệu để xử lý. Dừng lại.")
+            return [[] for _ in job_description_texts]
+
+        print(f"--- BƯỚC 2: Đang truy xuất ứng viên cho {len(job_description_texts)} JD (Retrieval) ---")
+        allowed_ids_list = None
+        if prefilter:
+            allowed_ids_list = [self.prefilter_candidates(snapshot.skill_index, jd) for jd in job_description_texts]
+
+        with span("pipeline.embed_query", queries=len(job_description_texts)):
+            query_vectors = self.embed_model.get_query_embedding_batch(job_description_texts)
+        count("embed.queries", len(job_description_texts))
+        engine = self.search_engine(backend)
+        pool = self.local_scorer.pool(top_k)
+        with span("pipeline.retrieve", top_k=pool, backend=engine.name, queries=len(query_vectors)):
+            hits_per_jd = engine.search_batch(query_vectors, top_k=pool, allowed_ids_list=allowed_ids_list)
+            if allowed_ids_list is not None:
+                hits_per_jd = [
+                    self._relax_prefilter(engine, query_vector, hits, allowed_ids, top_k, pool)
+                    for query_vector, hits, allowed_ids in zip(query_vectors, hits_per_jd, allowed_ids_list)
+                ]
+        print("--- HOÀN THÀNH BƯỚC 2 ---\n")
+
+        print("--- BƯỚC 3: Đang đánh giá chi tiết từng ứng viên bằng LLM (GPT-4o) ---")
+        results = []
+        for jd, hits in zip(job_description_texts, hits_per_jd):
+            retrieved = self._load_hits(snapshot, self._cascade(snapshot, jd, hits, top_k))
+            with span("pipeline.rerank", candidates=len(retrieved)):
+                results.append(self._rerank(jd, retrieved))
+        print("--- HOÀN THÀNH BƯỚC 3 ---\n")
+        return results
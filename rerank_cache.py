@@ -0,0 +1,129 @@
+# rerank_cache.py
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from instrumentation import count
+from reranker import PROMPT_VERSION
+
+DEFAULT_DB_PATH = os.path.join(".cache", "rerank.sqlite3")
+DEFAULT_TTL = float(os.getenv("RERANK_CACHE_TTL", str(7 * 24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("RERANK_CACHE_MAX_ENTRIES", "20000"))
+
+URL_PATTERN = re.compile(r"https?://\S+")
+
+
+def jd_fingerprint(jd_text: str) -> str:
+    """
+    Dấu vân tay của JD sau khi chuẩn hoá: Unicode NFKC, chữ thường, bỏ URL,
+    gộp khoảng trắng. Đăng lại JD hoặc chỉ sửa xuống dòng/viết hoa vẫn trùng khoá.
+    """
+    text = unicodedata.normalize("NFKC", jd_text).lower()
+    text = URL_PATTERN.sub(" ", text)
+    text = " ".join(text.split())
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cv_fingerprint(cv_data: dict) -> str:
+    """Dấu vân tay nội dung CV đã parse (chính là phần được gửi cho LLM)."""
+    payload = json.dumps(cv_data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ==============================================================================
+# CACHE KẾT QUẢ ĐÁNH GIÁ CỦA LLM (SQLITE, CÓ TTL VÀ GIỚI HẠN SỐ DÒNG)
+# ==============================================================================
+class RerankCache:
+    """
+    Lưu detailed_evaluation theo (JD đã chuẩn hoá, nội dung CV, phiên bản prompt).
+    - Bản ghi quá ttl giây coi như hết hạn và bị xoá khi dọn dẹp.
+    - Khi vượt max_entries, các bản ghi lâu không dùng nhất bị xoá.
+    Đổi SYSTEM_PROMPT, USER_PROMPT_TEMPLATE hoặc model thì PROMPT_VERSION đổi,
+    các kết quả cũ tự động không còn được dùng.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, version: str = PROMPT_VERSION):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS evaluations (
+                key TEXT PRIMARY KEY,
+                evaluation TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS evaluations_lru ON evaluations (last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS evaluations_created ON evaluations (created)")
+
+    def key_for(self, jd_text: str, cv_data: dict) -> str:
+        raw = f"{jd_fingerprint(jd_text)}|{cv_fingerprint(cv_data)}|{self.version}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, jd_text: str, cv_data: dict):
+        """Trả về detailed_evaluation đã lưu, hoặc None nếu chưa có / đã hết hạn."""
+        key = self.key_for(jd_text, cv_data)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT evaluation FROM evaluations WHERE key = ? AND created >= ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE evaluations SET last_used = ? WHERE key = ?", (now, key))
+                self.hits += 1
+            else:
+                self.misses += 1
+        if row is None:
+            count("cache.rerank.miss")
+            return None
+        count("cache.rerank.hit")
+        return json.loads(row[0])
+
+    def put(self, jd_text: str, cv_data: dict, evaluation: dict):
+        key = self.key_for(jd_text, cv_data)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO evaluations (key, evaluation, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(evaluation, ensure_ascii=False), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM evaluations WHERE created < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+        excess = total - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM evaluations WHERE key IN "
+                "(SELECT key FROM evaluations ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM evaluations")
+
+    def stats(self) -> dict:
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,300 @@
+# reranker.py
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import namedtuple
+
+import openai
+from openai import AsyncOpenAI
+
+from cv_serializer import DEFAULT_HIGHLIGHT_TOKENS, SERIALIZER_VERSION, estimate_tokens, serialize_cv
+from instrumentation import count, span
+
+RERANK_MODEL = "gpt-4o"  # Sử dụng model mạnh nhất để có kết quả phân tích tốt
+
+# Giới hạn mặc định, có thể chỉnh qua biến môi trường
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("RERANK_MAX_CONCURRENCY", "8"))
+DEFAULT_REQUESTS_PER_SECOND = float(os.getenv("RERANK_REQUESTS_PER_SECOND", "5"))
+DEFAULT_TIMEOUT = float(os.getenv("RERANK_TIMEOUT", "60"))
+DEFAULT_MAX_RETRIES = int(os.getenv("RERANK_MAX_RETRIES", "4"))
+
+# Prompt hệ thống để hướng dẫn LLM hoạt động như một nhà tuyển dụng
+SYSTEM_PROMPT = """
+    Bạn là một chuyên gia tuyển dụng kỹ thuật (Tech Recruiter) rất kinh nghiệm và tỉ mỉ.
+    Nhiệm vụ của bạn là đánh giá một CV của ứng viên dựa trên một Bản mô tả công việc (JD) được cung cấp.
+    Hãy phân tích sâu và trả về kết quả đánh giá DUY NHẤT dưới dạng một đối tượng JSON.
+
+    Đối tượng JSON phải có các trường sau:
+    - "score": một con số từ 0 đến 100, thể hiện mức độ phù hợp tổng thể.
+    - "skills_checklist": một đối tượng chứa hai danh sách: "matched_skills" và "missing_skills".
+    - "experience_match": một chuỗi ngắn để đánh giá kinh nghiệm (ví dụ: "Rất phù hợp", "Phù hợp", "Không đủ kinh nghiệm").
+    - "risk_points": một danh sách các điểm rủi ro hoặc không phù hợp cần lưu ý.
+    - "rationale": một đoạn văn ngắn (2-3 câu) giải thích lý do cho điểm số của bạn.
+    """
+# Mẫu prompt cho người dùng, sẽ được điền JD và CV vào
+USER_PROMPT_TEMPLATE = """
+    Dưới đây là Bản mô tả công việc (JD) và CV của ứng viên. Vui lòng đánh giá.
+
+    --- JD ---
+    {jd_text}
+
+    --- CV ---
+    {cv_text}
+    """
+
+# Phiên bản prompt: đổi model, prompt hoặc cách serialize CV thì kết quả đánh giá
+# đã cache không còn dùng được
+PROMPT_VERSION = hashlib.sha256(
+    "\x00".join([RERANK_MODEL, SYSTEM_PROMPT, USER_PROMPT_TEMPLATE,
+                  str(SERIALIZER_VERSION), str(DEFAULT_HIGHLIGHT_TOKENS)]).encode("utf-8")
+).hexdigest()[:16]
+
+# Các lỗi tạm thời đáng để thử lại
+TRANSIENT_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+# ==============================================================================
+# GIỚI HẠN TỐC ĐỘ GỌI API (TOKEN BUCKET)
+# ==============================================================================
+class TokenBucket:
+    """
+    Bộ giới hạn tốc độ kiểu token bucket: nạp lại `rate` token mỗi giây,
+    tích luỹ tối đa `capacity` token (cho phép bùng nổ ngắn).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+# ==============================================================================
+# ĐÁNH GIÁ MỘT ỨNG VIÊN (CÓ RETRY VÀ TIMEOUT)
+# ==============================================================================
+def build_user_prompt(jd_text: str, cv_data: dict) -> str:
+    # Chuyển CV thành JSON gọn: bỏ trường rỗng, phần tử trùng, cắt highlights theo
+    # ngân sách token (xem cv_serializer.py)
+    cv_text_for_llm = serialize_cv(cv_data)
+    return USER_PROMPT_TEMPLATE.format(jd_text=jd_text, cv_text=cv_text_for_llm)
+
+
+async def evaluate_candidate(client, jd_text: str, cv_data: dict, bucket: TokenBucket = None,
+                             timeout: float = DEFAULT_TIMEOUT, max_retries: int = DEFAULT_MAX_RETRIES,
+                             base_delay: float = 1.0) -> dict:
+    """
+    Gửi một CV + JD tới LLM và trả về JSON đánh giá.
+    Lỗi tạm thời (rate limit, timeout, lỗi mạng, lỗi 5xx) được thử lại với
+    thời gian chờ tăng theo cấp số nhân (kèm jitter); các lỗi khác ném ra ngay.
+    """
+    user_prompt = build_user_prompt(jd_text, cv_data)
+    attempt = 0
+    while True:
+        if bucket is not None:
+            await bucket.acquire()
+        try:
+            with span("llm.rerank", model=RERANK_MODEL, attempt=attempt, prompt_chars=len(user_prompt),
+                      prompt_tokens_est=estimate_tokens(SYSTEM_PROMPT + user_prompt)):
+                response = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=RERANK_MODEL,
+                        messages=[
+                            {"role": "system", "content": SYSTEM_PROMPT},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        response_format={"type": "json_object"} # Yêu cầu trả về định dạng JSON
+                    ),
+                    timeout=timeout,
+                )
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                count("llm.rerank.prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+                count("llm.rerank.output_tokens", getattr(usage, "completion_tokens", 0) or 0)
+            # Parse kết quả JSON từ phản hồi của API
+            return json.loads(response.choices[0].message.content)
+        except TRANSIENT_ERRORS:
+            count("llm.rerank.retries")
+            if attempt >= max_retries:
+                raise
+            delay = base_delay * (2 ** attempt)
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            attempt += 1
+
+
+# ==============================================================================
+# RE-RANK ĐỒNG THỜI TOÀN BỘ ỨNG VIÊN
+# ==============================================================================
+def sort_evaluations(evaluation_results: list) -> list:
+    # Sắp xếp danh sách ứng viên dựa trên điểm số ("score") từ LLM theo thứ tự giảm dần
+    return sorted(
+        evaluation_results,
+        key=lambda x: x.get('detailed_evaluation', {}).get('score', 0),
+        reverse=True
+    )
+
+
+async def iter_rerank_async(jd_text: str, candidates: list, client=None,
+                            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                            requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+                            timeout: float = DEFAULT_TIMEOUT,
+                            max_retries: int = DEFAULT_MAX_RETRIES, cache=None):
+    """
+    Đánh giá đồng thời các ứng viên, trả về (async generator) từng kết quả ngay
+    khi ứng viên đó được đánh giá xong, theo thứ tự hoàn thành.
+    candidates: danh sách (cv_data, initial_score) lấy từ bước retrieval.
+    cache: RerankCache (rerank_cache.py) hoặc None; ứng viên đã được đánh giá với
+    cùng JD, cùng nội dung CV và cùng phiên bản prompt không gọi lại LLM.
+    Ứng viên bị lỗi sau khi đã thử lại được bỏ qua.
+    """
+    own_client = client is None
+    if own_client:
+        client = AsyncOpenAI()
+    bucket = TokenBucket(requests_per_second, capacity=max_concurrency)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(cv_data, initial_score):
+        cv_name = cv_data.get('name', 'N/A')
+        # RerankCache là SQLite đồng bộ: đọc/ghi trên luồng phụ để không chặn event loop
+        result_json = await asyncio.to_thread(cache.get, jd_text, cv_data) if cache is not None else None
+        if result_json is not None:
+            print(f"  > Dùng kết quả đánh giá đã lưu cho {cv_name}")
+            return {"name": cv_name, "initial_score": initial_score, "detailed_evaluation": result_json}
+        async with semaphore:
+            print(f"  > Đang đánh giá ứng viên: {cv_name}...")
+            try:
+                result_json = await evaluate_candidate(
+                    client, jd_text, cv_data, bucket, timeout=timeout, max_retries=max_retries
+                )
+            except Exception as e:
+                print(f"  > Lỗi khi đánh giá ứng viên {cv_name}: {e}")
+                return None
+        if cache is not None:
+            await asyncio.to_thread(cache.put, jd_text, cv_data, result_json)
+        print(f"  > Đánh giá hoàn tất cho {cv_name}!")
+        return {
+            "name": cv_name,
+            "initial_score": initial_score, # Điểm tương đồng vector ban đầu
+            "detailed_evaluation": result_json # Kết quả đánh giá sâu từ LLM
+        }
+
+    tasks = [asyncio.ensure_future(run_one(cv, score)) for cv, score in candidates]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result is not None:
+                yield result
+    finally:
+        # Bên gọi dừng sớm: huỷ các đánh giá còn dở
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if own_client:
+            await client.close()
+
+
+async def rerank_candidates_async(jd_text: str, candidates: list, **kwargs) -> list:
+    """
+    Đánh giá đồng thời các ứng viên (tham số như iter_rerank_async).
+    Trả về danh sách evaluation_results đã sắp xếp theo điểm LLM giảm dần.
+    """
+    results = [result async for result in iter_rerank_async(jd_text, candidates, **kwargs)]
+    return sort_evaluations(results)
+
+
+def rerank_candidates(jd_text: str, candidates: list, **kwargs) -> list:
+    """Phiên bản đồng bộ của rerank_candidates_async, dùng trong find_best_candidates."""
+    return asyncio.run(rerank_candidates_async(jd_text, candidates, **kwargs))
+
+
+# ==============================================================================
+# RE-RANK DẠNG LUỒNG: NHẬN TỪNG KẾT QUẢ NGAY KHI XONG
+# ==============================================================================
+# Một cập nhật trong quá trình re-rank:
+# - result: kết quả vừa đánh giá xong (None ở cập nhật cuối)
+# - provisional_rank: hạng tạm thời (tính từ 1) của result trong số các kết quả đã có
+# - ranking: bảng xếp hạng tạm thời (cuối cùng khi final=True)
+RankingUpdate = namedtuple("RankingUpdate", ["result", "provisional_rank", "ranking", "final"])
+
+
+def iter_rerank(jd_text: str, candidates: list, runner=None, **kwargs):
+    """
+    Generator đồng bộ trên iter_rerank_async. Việc đánh giá chạy trên một event
+    loop nền, nên các ứng viên còn lại vẫn tiếp tục được đánh giá trong khi bên
+    gọi đang xử lý (ví dụ gửi DM) kết quả trước đó.
+    runner: hàm nhận một coroutine và cho nó chạy trên event loop có sẵn (ví dụ
+    Pipeline.submit); mặc định mở một luồng mới với asyncio.run.
+    """
+    results = queue.Queue()
+    stop = threading.Event()
+
+    async def produce():
+        evaluations = iter_rerank_async(jd_text, candidates, **kwargs)
+        try:
+            async for result in evaluations:
+                if stop.is_set():
+                    break
+                results.put(("result", result))
+        except BaseException as e:
+            results.put(("error", e))
+        finally:
+            # Đóng ngay để huỷ các đánh giá còn dở khi bên gọi dừng sớm
+            await evaluations.aclose()
+            results.put(("done", None))
+
+    if runner is not None:
+        runner(produce())
+    else:
+        # Chạy trong bản sao context để span llm.rerank gắn với span của bên gọi
+        ctx = contextvars.copy_context()
+        threading.Thread(target=ctx.run, args=(asyncio.run, produce()), name="rerank-stream", daemon=True).start()
+    try:
+        while True:
+            kind, item = results.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def iter_ranking_updates(jd_text: str, candidates: list, **kwargs):
+    """
+    Như iter_rerank nhưng kèm thứ hạng tạm thời sau mỗi kết quả; cập nhật cuối
+    cùng (final=True) mang bảng xếp hạng hoàn chỉnh, giống rerank_candidates.
+    """
+    ranking = []
+    for result in iter_rerank(jd_text, candidates, **kwargs):
+        ranking = sort_evaluations(ranking + [result])
+        rank = next(i for i, r in enumerate(ranking) if r is result) + 1
+        yield RankingUpdate(result, rank, ranking, False)
+    yield RankingUpdate(None, None, ranking, True)
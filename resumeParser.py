@@ -1,13 +1,23 @@
 import google.generativeai as gemini
 import fitz
 import pytesseract
-from PIL import Image
+from PIL import Image, ImageOps
 from dotenv import load_dotenv
+import atexit
+import functools
+import hashlib
+import io
 import json
 import os
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
+from cv_serializer import compact_text, estimate_tokens
+from instrumentation import count, span
+
 # ---------- Setup Gemini ----------
 load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
@@ -15,76 +25,163 @@ gemini.configure(api_key=api_key)
 
 
 # ---------- STEP 1: Extract text ----------
-def extract_text_from_pdf(path):
-    doc = fitz.open(path)
-    text = ""
-    for page in doc:
-        text += page.get_text("text") + "\n"
+# Character budget for the extracted resume text (~4 chars per prompt token).
+# Long portfolios are cut off here instead of being paid for in prompt tokens.
+# Set RESUME_MAX_CHARS=0 to disable truncation.
+MAX_RESUME_CHARS = int(os.getenv("RESUME_MAX_CHARS", "24000"))
+
+
+# Pages whose text layer has fewer characters than this are treated as scanned
+# and sent to OCR. Only those pages are rasterized.
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "40"))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2200"))
+OCR_BINARIZE_THRESHOLD = 160
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0")) or (os.cpu_count() or 1)
+# Rough text yield of one scanned page, used to stop rasterizing once the budget is met
+OCR_PAGE_CHAR_ESTIMATE = 2500
+
+
+def _open_pdf(source):
+    # Accept either a path or the raw file bytes (no temp file needed)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=bytes(source), filetype="pdf")
+    return fitz.open(source)
+
+
+def iter_pdf_pages(source, ocr_min_chars=OCR_MIN_PAGE_CHARS):
+    # Yields (text, scan) per page. scan is a grayscale PNG of the page when its
+    # text layer is missing or too thin to be usable, otherwise None.
+    with _open_pdf(source) as doc:
+        for page in doc:
+            text = page.get_text("text")
+            scan = None
+            if ocr_min_chars and len(text.strip()) < ocr_min_chars:
+                scan = page.get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY).tobytes("png")
+            yield text, scan
+
+
+def preprocess_for_ocr(img):
+    # Grayscale, cap the resolution, stretch contrast and binarize: Tesseract is
+    # both faster and more accurate on clean black-on-white input.
+    img = ImageOps.grayscale(img)
+    longest = max(img.size)
+    if longest > OCR_MAX_SIDE:
+        scale = OCR_MAX_SIDE / longest
+        img = img.resize((round(img.width * scale), round(img.height * scale)), Image.LANCZOS)
+    img = ImageOps.autocontrast(img)
+    return img.point(lambda p: 255 if p > OCR_BINARIZE_THRESHOLD else 0, mode="1")
+
+
+def ocr_image(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return pytesseract.image_to_string(preprocess_for_ocr(Image.open(source)))
+
+
+# One OCR process pool per worker count, shared by every scanned PDF instead of
+# paying for process start-up on each call; shut down at interpreter exit.
+_ocr_pools = {}
+_ocr_pools_lock = threading.Lock()
+
+
+def _ocr_pool(workers):
+    with _ocr_pools_lock:
+        pool = _ocr_pools.get(workers)
+        if pool is None:
+            pool = _ocr_pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+
+def shutdown_ocr_pools():
+    with _ocr_pools_lock:
+        pools = list(_ocr_pools.values())
+        _ocr_pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+
+atexit.register(shutdown_ocr_pools)
+
+
+def ocr_images(images, workers=OCR_WORKERS):
+    if workers <= 1 or len(images) <= 1:
+        return [ocr_image(img) for img in images]
+    pool = _ocr_pool(workers)
+    try:
+        return list(pool.map(ocr_image, images))
+    except BrokenProcessPool:
+        # A crashed worker breaks the pool for good: drop it so the next call starts a fresh one
+        with _ocr_pools_lock:
+            if _ocr_pools.get(workers) is pool:
+                del _ocr_pools[workers]
+        raise
+
+
+def extract_text_from_pdf(source, max_chars=MAX_RESUME_CHARS, ocr_workers=OCR_WORKERS):
+    with span("extract.pdf") as attrs:
+        text = _extract_text_from_pdf(source, max_chars, ocr_workers, attrs)
+        attrs["chars"] = len(text)
+    count("extract.chars", len(text))
     return text
 
 
-def extract_text_from_img(path):
-    img = Image.open(path)
-    return pytesseract.image_to_string(img)
+def _extract_text_from_pdf(source, max_chars, ocr_workers, attrs):
+    parts = []  # page text, or an index into scans for pages waiting on OCR
+    scans = []
+    total = 0
+    pages = iter_pdf_pages(source)
+    try:
+        for text, scan in pages:
+            if scan is not None:
+                parts.append(len(scans))
+                scans.append(scan)
+                total += OCR_PAGE_CHAR_ESTIMATE
+            else:
+                parts.append(text + "\n")
+                total += len(text) + 1
+            if max_chars and total >= max_chars:
+                break
+    finally:
+        # Stop reading the remaining pages and close the document right away
+        pages.close()
+    attrs["pages"] = len(parts)
+    attrs["ocr_pages"] = len(scans)
+
+    if scans:
+        with span("extract.ocr", pages=len(scans), workers=ocr_workers):
+            ocr_texts = ocr_images(scans, workers=ocr_workers)
+        count("extract.ocr_pages", len(scans))
+        parts = [ocr_texts[p] + "\n" if isinstance(p, int) else p for p in parts]
+    text = "".join(parts)
+    return text[:max_chars] if max_chars else text
+
+
+def extract_text_from_img(source, max_chars=MAX_RESUME_CHARS):
+    with span("extract.ocr", pages=1, workers=1):
+        text = ocr_image(source)
+    count("extract.ocr_pages", 1)
+    count("extract.chars", len(text))
+    return text[:max_chars] if max_chars else text
 
 
 # ---------- STEP 2: Use LLM to Extract info ----------
-def extract_with_gemini(text):
-    prompt = f'''
+GEMINI_MODEL = "gemini-2.5-flash"
+
+_PROMPT_PREAMBLE = '''
 You are a STRICT resume parser.
-Your job is to extract ONLY information that is explicitly written in the resume text. 
+Your job is to extract ONLY information that is explicitly written in the resume text.
 Do NOT infer, guess, or add any information that is not present.
 
-Return a valid JSON with EXACTLY these keys (no extra keys, no missing keys):
-
-{{
-  "name": "",
-  "summary": "",
-  "education": [
-    {{"degree": "", "school": "", "gpa": "", "year": ""}}
-  ],
-  "experiences": [
-    {{
-      "role": "",
-      "organization": "",
-      "start_date": "",
-      "end_date": "",
-      "years": 0.0,
-      "location": "",
-      "highlights": []
-    }}
-  ],
-  "projects": [
-    {{
-      "role": "",
-      "highlights": []
-    }}
-  ],
-  "skills": [],
-  "languages": [],
-  "certifications": [
-    {{"name": "", "issuer": "", "year": ""}}
-  ],
-  "awards": [
-    {{"title": "", "issuer": "", "year": ""}}
-  ],
-  "activities": [
-    {{
-      "role": "",
-      "organization": "",
-      "start_date": "",
-      "end_date": "",
-      "years": 0.0,
-      "highlights": []
-    }}
-  ],
-  "publications": [
-    {{"title": "", "journal": "", "year": "", "doi": ""}}
-  ],
-  "licenses": [
-    {{"name": "", "issuer": "", "year": ""}}
-  ]
-}}
+'''
+
+_SCHEMA_AND_RULES = '''Return a valid JSON with EXACTLY these keys (no extra keys, no missing keys):
+{{"name":"","summary":"","education":[{{"degree":"","school":"","gpa":"","year":""}}],
+"experiences":[{{"role":"","organization":"","start_date":"","end_date":"","years":0.0,"location":"","highlights":[]}}],
+"projects":[{{"role":"","highlights":[]}}],"skills":[],"languages":[],
+"certifications":[{{"name":"","issuer":"","year":""}}],"awards":[{{"title":"","issuer":"","year":""}}],
+"activities":[{{"role":"","organization":"","start_date":"","end_date":"","years":0.0,"highlights":[]}}],
+"publications":[{{"title":"","journal":"","year":"","doi":""}}],"licenses":[{{"name":"","issuer":"","year":""}}]}}
 
 Strict rules you MUST follow:
 1. Output must be strictly valid JSON. No extra commentary, no markdown code fences.
@@ -113,12 +210,42 @@ Strict rules you MUST follow:
 12. "certifications", "awards", "activities", "publications", "licenses": extract if present.
 13. Remove duplicates across fields.
 14. All extracted text must be in English.
+'''
 
+EXTRACTION_PROMPT = _PROMPT_PREAMBLE + _SCHEMA_AND_RULES + '''
 Resume text:
 {text}
 '''
-    model = gemini.GenerativeModel("gemini-2.5-flash")
-    response = model.generate_content(prompt)
+
+# Several resumes per request: the instructions are sent once instead of once per CV
+BATCH_EXTRACTION_PROMPT = _PROMPT_PREAMBLE + '''This request contains several resumes. Each one starts with a line
+"### RESUME <id>" and ends with a line "### END RESUME <id>".
+Parse every resume independently and never mix information between resumes.
+Return a JSON array with exactly one object per resume, in input order.
+Each object has one extra key "id" (the resume id as a string) plus the keys below.
+
+''' + _SCHEMA_AND_RULES + '''
+Resumes:
+{resumes}
+'''
+
+# Bump when validate_json's output shape changes; together with the prompt,
+# model and extraction settings it identifies which parser produced a cached result.
+SCHEMA_VERSION = 1
+PARSER_VERSION = hashlib.sha256(
+    f"{GEMINI_MODEL}|{SCHEMA_VERSION}|{MAX_RESUME_CHARS}|{OCR_MIN_PAGE_CHARS}|{OCR_DPI}|"
+    f"{OCR_MAX_SIDE}|{OCR_BINARIZE_THRESHOLD}|{EXTRACTION_PROMPT}|{BATCH_EXTRACTION_PROMPT}".encode("utf-8")
+).hexdigest()[:16]
+
+
+def _generate(prompt, span_name, **attrs):
+    model = gemini.GenerativeModel(GEMINI_MODEL)
+    with span(span_name, model=GEMINI_MODEL, prompt_chars=len(prompt), **attrs):
+        response = model.generate_content(prompt)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        count("llm.gemini.prompt_tokens", getattr(usage, "prompt_token_count", 0) or 0)
+        count("llm.gemini.output_tokens", getattr(usage, "candidates_token_count", 0) or 0)
 
     raw_output = ""
     try:
@@ -130,114 +257,188 @@ Resume text:
     if raw_output.startswith("```"):
         raw_output = raw_output.strip("`")
         raw_output = raw_output.replace("json", "", 1).strip()
+    return raw_output
+
 
+def _parse_json_output(raw_output, default):
     try:
         return json.loads(raw_output)
     except Exception as e:
         print("JSON parse error:", e)
         print("Raw output:", raw_output[:300])
-        return {}
+        count("llm.gemini.json_errors")
+        return default
+
+
+def extract_with_gemini(text):
+    # Collapsing PDF layout whitespace cuts prompt tokens without losing content
+    prompt = EXTRACTION_PROMPT.format(text=compact_text(text))
+    return _parse_json_output(_generate(prompt, "llm.gemini"), {})
 
 
 # ---------- STEP 3a: Filter highlights ----------
+HIGHLIGHT_STRIP_CHARS = "•- \n\t"
+HIGHLIGHT_MIN_WORDS = 3
+HIGHLIGHT_MAX_WORDS = 18
+_HIGHLIGHT_CLAUSE_SPLIT = re.compile(r",| and ")
+
+
+def _clean_highlight(item):
+    return (item if type(item) is str else str(item)).strip(HIGHLIGHT_STRIP_CHARS).strip()
+
+
 def filter_highlights(raw_list):
     filtered = []
-    action_verbs = [
-        "developed", "designed", "implemented", "led", "analyzed",
-        "created", "managed", "optimized", "conducted", "built",
-        "researched", "improved", "organized", "presented", "trained"
-    ]
     for item in raw_list:
-        text = str(item).strip("•- \n\t").strip()
+        text = _clean_highlight(item)
         if not text:
             continue
-        if len(text.split()) < 3:
+        if len(text.split()) < HIGHLIGHT_MIN_WORDS:
             continue
-        if text.split()[0].lower() in action_verbs:
-            filtered.append(text)
-        else:
-            filtered.append(text)
+        filtered.append(text)
     return list(dict.fromkeys(filtered))
 
 
 # ---------- STEP 3b: Refine highlights ----------
-def refine_highlights(highlights, max_words=18):
-    refined = []
-    for hl in highlights:
-        text = str(hl).strip("•- \n\t").strip()
-        if not text:
-            continue
-        words = text.split()
-        if len(words) > max_words:
-            parts = re.split(r',| and ', text)
-            parts = [p.strip() for p in parts if len(p.strip().split()) >= 3]
-            for p in parts:
-                refined.append(p)
-        else:
-            refined.append(text)
-    normalized = []
-    for item in refined:
+def _refine_one(text, max_words, out):
+    # Appends the finished highlight(s) for one filtered item to out
+    text = _clean_highlight(text)
+    if not text:
+        return
+    if len(text.split()) > max_words:
+        parts = [p.strip() for p in _HIGHLIGHT_CLAUSE_SPLIT.split(text)]
+        parts = [p for p in parts if len(p.split()) >= HIGHLIGHT_MIN_WORDS]
+    else:
+        parts = [text]
+    for item in parts:
         item = item.strip()
         if not item:
             continue
-        item = item[0].upper() + item[1:] if item else item
+        item = item[0].upper() + item[1:]
         if not item.endswith('.'):
             item += '.'
-        normalized.append(item)
-    unique = list(dict.fromkeys(normalized))
-    return unique
+        out.append(item)
 
 
-# ---------- STEP 3c: Compute years ----------
-def compute_years(start_date: str, end_date: str) -> float:
-    if not start_date:
-        return 0.0
+def refine_highlights(highlights, max_words=HIGHLIGHT_MAX_WORDS):
+    refined = []
+    for hl in highlights:
+        _refine_one(hl, max_words, refined)
+    return list(dict.fromkeys(refined))
+
 
-    def parse_date(d):
-        if not d: return None
-        d = d.strip().lower()
-        if d in ["present", "hiện tại", "current", "now"]:
-            return datetime.today()
-        for fmt in ("%Y-%m", "%Y"):
-            try:
-                return datetime.strptime(d, fmt)
-            except:
+def normalize_highlights(raw_list, max_words=HIGHLIGHT_MAX_WORDS):
+    """refine_highlights(filter_highlights(raw_list)) in one pass over the items."""
+    seen, refined = set(), []
+    for item in raw_list:
+        text = _clean_highlight(item)
+        if not text or text in seen:
+            continue
+        n_words = len(text.split())
+        if n_words < HIGHLIGHT_MIN_WORDS:
+            continue
+        seen.add(text)
+        if text[0] in HIGHLIGHT_STRIP_CHARS or text[-1] in HIGHLIGHT_STRIP_CHARS:
+            # refine_highlights strips again, which can expose more bullet characters
+            text = _clean_highlight(text)
+            if not text:
                 continue
+            n_words = len(text.split())
+        if n_words > max_words:
+            parts = [p for p in (p.strip() for p in _HIGHLIGHT_CLAUSE_SPLIT.split(text))
+                     if len(p.split()) >= HIGHLIGHT_MIN_WORDS]
+        else:
+            parts = (text,)
+        for part in parts:
+            part = part[0].upper() + part[1:]
+            refined.append(part if part.endswith('.') else part + '.')
+    return list(dict.fromkeys(refined))
+
+
+# ---------- STEP 3c: Compute years ----------
+PRESENT_WORDS = frozenset(["present", "hiện tại", "current", "now"])
+DATE_FORMATS = ("%Y-%m", "%Y")
+_PRESENT = "present"
+
+
+def _parse_month(d):
+    # (year, month), _PRESENT for an ongoing role, or None if the date is not understood
+    d = d.strip().lower()
+    if d in PRESENT_WORDS:
+        return _PRESENT
+    for fmt in DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(d, fmt)
+        except ValueError:
+            continue
+        return parsed.year, parsed.month
+    return None
+
+
+# LLM output repeats the same few hundred date strings; "present" is resolved
+# against today's date at call time, so only the parse itself is cached.
+_parse_month_cached = functools.lru_cache(maxsize=8192)(_parse_month)
+
+
+def _month_of(d, today):
+    if not d:
         return None
+    month = _parse_month_cached(d) if isinstance(d, str) else _parse_month(d)
+    return (today.year, today.month) if month == _PRESENT else month
 
-    start = parse_date(start_date)
-    end = parse_date(end_date) or datetime.today()
-    if not start: return 0.0
 
-    diff_years = (end.year - start.year) + (end.month - start.month) / 12
+def compute_years(start_date: str, end_date: str, today=None) -> float:
+    if not start_date:
+        return 0.0
+    today = today or datetime.today()
+    start = _month_of(start_date, today)
+    end = _month_of(end_date, today) or (today.year, today.month)
+    if not start:
+        return 0.0
+
+    diff_years = (end[0] - start[0]) + (end[1] - start[1]) / 12
     return round(diff_years, 2)
 
 
 # ---------- STEP 4: Validate JSON ----------
-def validate_json(data):
-    if not isinstance(data, dict):
-        return {}
-
-    schema = {
-        "name": "",
-        "summary": "",
-        "education": [{"degree": "", "school": "", "gpa": "", "year": ""}],
-        "experiences": [{"role": "", "organization": "", "years": 0.0, "location": "", "highlights": []}],
-        "projects": [{"role": "", "highlights": []}],
-        "skills": [],
-        "languages": [],
-        "certifications": [{"name": "", "issuer": "", "year": ""}],
-        "awards": [{"title": "", "issuer": "", "year": ""}],
-        "activities": [{"role": "", "organization": "", "years": 0.0, "highlights": []}],
-        "publications": [{"title": "", "journal": "", "year": "", "doi": ""}],
-        "licenses": [{"name": "", "issuer": "", "year": ""}]
-    }
-
-    clean_data = {k: data.get(k, v) for k, v in schema.items()}
-
-    # --- normalize education ---
+GPA_PATTERN = re.compile(r"^\d+(\.\d+)?(/\d+(\.\d+)?)?$")
+
+# Output shape. Sections listed in ENTRY_FIELDS are rebuilt entry by entry; the
+# other keys are copied from the LLM output or filled with these defaults.
+SCHEMA = {
+    "name": "",
+    "summary": "",
+    "education": [{"degree": "", "school": "", "gpa": "", "year": ""}],
+    "experiences": [{"role": "", "organization": "", "years": 0.0, "location": "", "highlights": []}],
+    "projects": [{"role": "", "highlights": []}],
+    "skills": [],
+    "languages": [],
+    "certifications": [{"name": "", "issuer": "", "year": ""}],
+    "awards": [{"title": "", "issuer": "", "year": ""}],
+    "activities": [{"role": "", "organization": "", "years": 0.0, "highlights": []}],
+    "publications": [{"title": "", "journal": "", "year": "", "doi": ""}],
+    "licenses": [{"name": "", "issuer": "", "year": ""}]
+}
+# "years" is computed from start_date/end_date, "highlights" goes through normalize_highlights
+ENTRY_FIELDS = {
+    "experiences": ("role", "organization", "years", "location", "highlights"),
+    "projects": ("role", "highlights"),
+    "activities": ("role", "organization", "years", "highlights"),
+}
+# An entry is kept only if one of these is non-empty
+ENTRY_REQUIRED_ANY = ("role", "organization", "highlights")
+LIST_FIELDS = ("skills", "languages")
+
+
+def _fresh(default):
+    # Independent copy of a schema default (a string or a list of flat dicts),
+    # so callers can mutate the result
+    return [dict(entry) for entry in default] if isinstance(default, list) else default
+
+
+def _normalize_education(entries):
     fixed_edu = []
-    for edu in clean_data.get("education", []):
+    for edu in entries:
         if isinstance(edu, dict):
             fixed = {
                 "degree": edu.get("degree", ""),
@@ -245,79 +446,170 @@ def validate_json(data):
                 "gpa": edu.get("gpa", ""),
                 "year": edu.get("year", "")
             }
-            if fixed["gpa"] and not re.match(r"^\d+(\.\d+)?(/\d+(\.\d+)?)?$", str(fixed["gpa"])):
+            if fixed["gpa"] and not GPA_PATTERN.match(str(fixed["gpa"])):
                 fixed["gpa"] = ""
             fixed_edu.append(fixed)
-    clean_data["education"] = fixed_edu if fixed_edu else schema["education"]
+    return fixed_edu or _fresh(SCHEMA["education"])
 
-    # --- normalize experiences ---
-    fixed_exps = []
-    for exp in data.get("experiences", []):
-        if isinstance(exp, dict):
-            years_val = compute_years(exp.get("start_date", ""), exp.get("end_date", ""))
-            fixed = {
-                "role": exp.get("role", ""),
-                "organization": exp.get("organization", ""),
-                "years": years_val,
-                "location": exp.get("location", ""),
-                "highlights": refine_highlights(filter_highlights(exp.get("highlights", [])))
-            }
-            if fixed["role"] or fixed["organization"] or fixed["highlights"]:
-                fixed_exps.append(fixed)
-    clean_data["experiences"] = fixed_exps if fixed_exps else []
-
-    # --- normalize projects ---
-    fixed_projs = []
-    for proj in data.get("projects", []):
-        if isinstance(proj, dict):
-            fixed = {
-                "role": proj.get("role", ""),
-                "highlights": refine_highlights(filter_highlights(proj.get("highlights", [])))
-            }
-            if fixed["role"] or fixed["highlights"]:
-                fixed_projs.append(fixed)
-    clean_data["projects"] = fixed_projs if fixed_projs else []
-
-    # --- normalize activities ---
-    fixed_acts = []
-    for act in data.get("activities", []):
-        if isinstance(act, dict):
-            years_val = compute_years(act.get("start_date", ""), act.get("end_date", ""))
-            fixed = {
-                "role": act.get("role", ""),
-                "organization": act.get("organization", ""),
-                "years": years_val,
-                "highlights": refine_highlights(filter_highlights(act.get("highlights", [])))
-            }
-            if fixed["role"] or fixed["organization"] or fixed["highlights"]:
-                fixed_acts.append(fixed)
-    clean_data["activities"] = fixed_acts if fixed_acts else []
-
-    # --- normalize skills & languages ---
-    for key in ["skills", "languages"]:
-        val = clean_data.get(key, [])
-        if isinstance(val, str):
-            clean_data[key] = [s.strip() for s in val.split(",") if s.strip()]
-        elif isinstance(val, list):
-            clean_data[key] = [str(s).strip() for s in val if str(s).strip()]
-        else:
-            clean_data[key] = []
 
+def _normalize_entries(entries, fields, today):
+    fixed_entries = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        fixed = {}
+        for field in fields:
+            if field == "years":
+                fixed[field] = compute_years(entry.get("start_date", ""), entry.get("end_date", ""), today)
+            elif field == "highlights":
+                fixed[field] = normalize_highlights(entry.get("highlights", []))
+            else:
+                fixed[field] = entry.get(field, "")
+        if any(fixed.get(field) for field in ENTRY_REQUIRED_ANY):
+            fixed_entries.append(fixed)
+    return fixed_entries
+
+
+def _normalize_list(val):
+    if isinstance(val, str):
+        return [s.strip() for s in val.split(",") if s.strip()]
+    if isinstance(val, list):
+        return [text for text in (str(s).strip() for s in val) if text]
+    return []
+
+
+def _validate(data, today):
+    if not isinstance(data, dict):
+        return {}
+    clean_data = {}
+    for key, default in SCHEMA.items():
+        if key == "education":
+            clean_data[key] = _normalize_education(data.get(key, SCHEMA[key]))
+        elif key in ENTRY_FIELDS:
+            clean_data[key] = _normalize_entries(data.get(key, []), ENTRY_FIELDS[key], today)
+        elif key in LIST_FIELDS:
+            clean_data[key] = _normalize_list(data.get(key, []))
+        elif key in data:
+            clean_data[key] = data[key]
+        else:
+            clean_data[key] = _fresh(default)
     return clean_data
 
 
+def validate_json(data):
+    return _validate(data, datetime.today())
+
+
+def validate_json_batch(items):
+    """validate_json for many LLM outputs, e.g. re-normalizing a whole corpus.
+
+    Date strings are parsed once per distinct value and "present" resolves to the
+    same day for the whole batch.
+    """
+    today = datetime.today()
+    return [_validate(data, today) for data in items]
+
+
+# ---------- STEP 5: Batched extraction (several resumes per Gemini call) ----------
+GEMINI_BATCH_TOKENS = int(os.getenv("GEMINI_BATCH_TOKENS", "16000"))
+# Bounded separately because every resume in a batch adds its JSON to the output
+GEMINI_BATCH_MAX_RESUMES = int(os.getenv("GEMINI_BATCH_MAX_RESUMES", "8"))
+
+
+def pack_batches(texts, token_budget=GEMINI_BATCH_TOKENS, max_items=GEMINI_BATCH_MAX_RESUMES):
+    """Greedily group text indices so each group's estimated tokens stay within token_budget.
+
+    A text larger than the budget on its own still gets a batch of one.
+    """
+    batches, current, used = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (used + tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _is_resume_entry(entry):
+    return isinstance(entry, dict) and any(key in entry for key in ("name", "experiences", "skills"))
+
+
+def extract_with_gemini_batch(texts):
+    """Parse several resume texts in a single Gemini call.
+
+    Returns one validate_json result per input text, in order. Entries missing from
+    the response or not shaped like a resume are retried with extract_with_gemini;
+    if that also fails the entry is None.
+    """
+    texts = [compact_text(t) for t in texts]
+    if not texts:
+        return []
+    ids = [str(i + 1) for i in range(len(texts))]
+    resumes = "\n".join(
+        f"### RESUME {rid}\n{text}\n### END RESUME {rid}" for rid, text in zip(ids, texts)
+    )
+    prompt = BATCH_EXTRACTION_PROMPT.format(resumes=resumes)
+    parsed = _parse_json_output(_generate(prompt, "llm.gemini.batch", resumes=len(texts)), [])
+    if isinstance(parsed, dict):
+        parsed = [parsed]
+    by_id = {}
+    if isinstance(parsed, list):
+        # Entries without an id can only be matched by position when none are missing
+        positional = len(parsed) == len(ids)
+        for position, entry in enumerate(parsed):
+            if not isinstance(entry, dict):
+                continue
+            if "id" in entry:
+                by_id.setdefault(str(entry["id"]), entry)
+            elif positional:
+                by_id.setdefault(ids[position], entry)
+
+    entries = []
+    for rid, text in zip(ids, texts):
+        entry = by_id.get(rid)
+        if not _is_resume_entry(entry):
+            count("llm.gemini.batch_fallbacks")
+            entry = extract_with_gemini(text)
+        entries.append(entry or None)
+    with span("validate_json", resumes=len(entries)):
+        validated = iter(validate_json_batch([entry for entry in entries if entry is not None]))
+    return [next(validated) if entry is not None else None for entry in entries]
+
+
 # ---------- Wrapper ----------
-def parse_resume(file_path: str):
+PDF_EXTENSIONS = (".pdf",)
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def extract_text_from_bytes(data: bytes, ext: str, ocr_workers=OCR_WORKERS):
+    ext = ext.lower()
+    if ext in PDF_EXTENSIONS:
+        return extract_text_from_pdf(data, ocr_workers=ocr_workers)
+    elif ext in IMAGE_EXTENSIONS:
+        return extract_text_from_img(data)
+    else:
+        raise ValueError(f"Unsupported file format: {ext}")
+
+
+def extract_text(file_path: str, ocr_workers=OCR_WORKERS):
     ext = os.path.splitext(file_path)[1].lower()
-    if ext == ".pdf":
-        raw_text = extract_text_from_pdf(file_path)
-    elif ext in [".png", ".jpg", ".jpeg"]:
-        raw_text = extract_text_from_img(file_path)
+    if ext in PDF_EXTENSIONS:
+        return extract_text_from_pdf(file_path, ocr_workers=ocr_workers)
+    elif ext in IMAGE_EXTENSIONS:
+        return extract_text_from_img(file_path)
     else:
         raise ValueError(f"Unsupported file format: {ext}")
 
-    llm_data = extract_with_gemini(raw_text)
-    final_data = validate_json(llm_data)
+
+def parse_resume(file_path: str):
+    with span("parse_resume", file=os.path.basename(file_path)):
+        raw_text = extract_text(file_path)
+        llm_data = extract_with_gemini(raw_text)
+        final_data = validate_json(llm_data)
     return final_data
 
 
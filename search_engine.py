@@ -0,0 +1,396 @@
+# search_engine.py
+
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+
+def _normalize_rows(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores, k):
+    """Chỉ số top-k của mảng điểm 1 chiều, giảm dần: argpartition O(n) rồi chỉ sắp xếp k phần tử."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(scores.shape[0])
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+# Trạng thái chỉ mục mà search engine tìm trên đó, được thay cả khối khi VectorStore
+# thay đổi: các truy vấn đang chạy vẫn dùng bản cũ. Không sao chép ma trận: VectorStore
+# chỉ nối thêm hàng, các hàng đã chụp không bao giờ bị ghi đè (xem VectorStore.view)
+# - version: store.version lúc chụp
+# - ids: id theo hàng (chỉ đọc các hàng < số hàng của matrix)
+# - row_of: id → hàng còn sống
+# - matrix: ma trận embedding (rows, dim), kể cả hàng đã xoá
+# - dead: chỉ số các hàng đã xoá (bị gán điểm -inf)
+IndexSnapshot = namedtuple("IndexSnapshot", ["version", "ids", "row_of", "matrix", "dead"])
+# Thêm cho chỉ mục nhiều vector: cv_ids / cv_row_of của ứng viên (cv_row_of có thể chứa
+# ứng viên mới hơn snapshot, chỉ dùng các chỉ số < số hàng của layout), layout (số CV,
+# số đoạn nhiều nhất) chỉ số hàng đoạn còn sống của mỗi CV, live_cvs: số CV còn đoạn
+MultiVectorSnapshot = namedtuple("MultiVectorSnapshot",
+                                 IndexSnapshot._fields + ("cv_ids", "cv_row_of", "layout", "live_cvs"))
+
+
+def _grow(array, rows: int, fill=0):
+    """Mảng mới đủ rows hàng (gấp đôi dung lượng), giữ nguyên dữ liệu cũ; mảng cũ không bị sửa."""
+    if array.shape[0] >= rows:
+        return array
+    grown = np.full((max(rows, array.shape[0] * 2, 64),) + array.shape[1:], fill, dtype=array.dtype)
+    grown[:array.shape[0]] = array
+    return grown
+
+
+# ==============================================================================
+# BACKEND NUMPY: TÌM KIẾM CHÍNH XÁC BẰNG MỘT PHÉP NHÂN MA TRẬN
+# ==============================================================================
+class ExactSearchEngine:
+    """
+    Tìm top-k chính xác (brute-force) trên ma trận embedding của VectorStore.
+    Khi VectorStore thay đổi (so sánh store.version), chụp một IndexSnapshot từ
+    store.view(): VectorStore chỉ nối thêm hàng nên snapshot dùng thẳng view của
+    ma trận memory-mapped, các lần cập nhật trên luồng khác không ảnh hưởng tới
+    truy vấn đang chạy. Hàng đã xoá vẫn được nhân nhưng bị gán điểm -inf.
+    - float32: nhân trực tiếp trên ma trận memory-mapped, không sao chép.
+    - float16: giữ một bản nửa kích thước trong RAM, mỗi lần chỉ chuyển các hàng
+      mới nối thêm; điểm vẫn được tính bằng float32 theo từng khối block_rows hàng.
+    """
+
+    name = "numpy"
+
+    def __init__(self, store, dtype=np.float32, block_rows: int = 65536):
+        self.store = store
+        self.dtype = np.dtype(dtype)
+        self.block_rows = block_rows
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        # Bản float16 (chỉ dùng khi dtype khác float32): generation của store, số hàng đã chuyển
+        self._half = None
+        self._half_generation = None
+        self._half_rows = 0
+
+    def _refresh(self):
+        """Snapshot ứng với phiên bản hiện tại của VectorStore (chụp lại nếu đã cũ)."""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self.store.version:
+            return snapshot
+        with self._refresh_lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == self.store.version:
+                return snapshot
+            view = self.store.view()
+            snapshot = self._make_snapshot(view, self._matrix(view))
+            self._snapshot = snapshot
+            return snapshot
+
+    def _matrix(self, view):
+        if self.dtype == np.float32:
+            return view.matrix
+        if self._half_generation != view.generation or self._half_rows > view.rows:
+            self._half = np.zeros((0, view.matrix.shape[1]), dtype=self.dtype)
+            self._half_generation, self._half_rows = view.generation, 0
+        # Chỉ chuyển các hàng mới; mảng cũ (đang được snapshot cũ dùng) không bị sửa ở các hàng đã có
+        self._half = _grow(self._half, view.rows)
+        for start in range(self._half_rows, view.rows, self.block_rows):
+            stop = min(start + self.block_rows, view.rows)
+            self._half[start:stop] = view.matrix[start:stop]
+        self._half_rows = view.rows
+        return self._half[:view.rows]
+
+    def _make_snapshot(self, view, matrix):
+        return IndexSnapshot(view.version, view.row_ids, view.row_of, matrix, np.flatnonzero(~view.alive))
+
+    def __len__(self):
+        return len(self._refresh().row_of)
+
+    def _scores(self, snapshot, queries, rows=None):
+        """Điểm cosine (m, n) của m truy vấn đã chuẩn hoá với các hàng rows (mặc định: tất cả, hàng đã xoá là -inf)."""
+        matrix = snapshot.matrix if rows is None else snapshot.matrix[rows]
+        if matrix.dtype == np.float32:
+            scores = queries @ matrix.T
+        else:
+            scores = np.empty((queries.shape[0], matrix.shape[0]), dtype=np.float32)
+            for start in range(0, matrix.shape[0], self.block_rows):
+                block = matrix[start:start + self.block_rows].astype(np.float32)
+                scores[:, start:start + block.shape[0]] = queries @ block.T
+        if rows is None and snapshot.dead.size:
+            scores[:, snapshot.dead] = -np.inf
+        return scores
+
+    def search(self, query_vector, top_k: int = 3, allowed_ids=None):
+        """Top-k (cv_id, score) cho một truy vấn. allowed_ids: chỉ tính điểm trên tập này."""
+        snapshot = self._refresh()
+        if not snapshot.row_of:
+            return []
+        q = _normalize_rows(query_vector)
+        if allowed_ids is None:
+            scores = self._scores(snapshot, q)[0]
+            return [(snapshot.ids[i], float(scores[i])) for i in _top_k(scores, top_k) if np.isfinite(scores[i])]
+        rows = np.fromiter((snapshot.row_of[i] for i in allowed_ids if i in snapshot.row_of), dtype=np.int64)
+        if rows.size == 0:
+            return []
+        scores = self._scores(snapshot, q, rows)[0]
+        return [(snapshot.ids[rows[i]], float(scores[i])) for i in _top_k(scores, top_k)]
+
+    def search_batch(self, query_vectors, top_k: int = 3, allowed_ids_list=None):
+        """
+        Top-k cho nhiều truy vấn (nhiều JD) trong một lần nhân ma trận.
+        allowed_ids_list: danh sách (mỗi truy vấn một phần tử) tập id được phép hoặc None.
+        """
+        snapshot = self._refresh()
+        queries = _normalize_rows(query_vectors)
+        if not snapshot.row_of:
+            return [[] for _ in range(queries.shape[0])]
+        scores = self._scores(snapshot, queries)
+        if allowed_ids_list is not None:
+            for qi, allowed_ids in enumerate(allowed_ids_list):
+                if allowed_ids is None:
+                    continue
+                mask = np.ones(scores.shape[1], dtype=bool)
+                rows = [snapshot.row_of[i] for i in allowed_ids if i in snapshot.row_of]
+                mask[rows] = False
+                scores[qi, mask] = -np.inf
+
+        k = min(top_k, scores.shape[1])
+        if k < scores.shape[1]:
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind="stable")
+        top_rows = np.take_along_axis(part, order, axis=1)
+        top_scores = np.take_along_axis(part_scores, order, axis=1)
+
+        results = []
+        for rows, row_scores in zip(top_rows, top_scores):
+            results.append([(snapshot.ids[r], float(s)) for r, s in zip(rows, row_scores) if np.isfinite(s)])
+        return results
+
+
+# ==============================================================================
+# BACKEND NHIỀU VECTOR: MỖI CV NHIỀU ĐOẠN, GỘP ĐIỂM THEO ỨNG VIÊN
+# ==============================================================================
+# Id của một đoạn trong chỉ mục nhiều vector: "<cv_id>#<số thứ tự đoạn>"
+CHUNK_ID_SEPARATOR = "#"
+MULTI_VECTOR_AGGREGATE = os.getenv("MULTI_VECTOR_AGGREGATE", "max")
+MULTI_VECTOR_TOP_N = int(os.getenv("MULTI_VECTOR_TOP_N", "3"))
+
+
+def chunk_id(cv_id: str, index: int) -> str:
+    return f"{cv_id}{CHUNK_ID_SEPARATOR}{index}"
+
+
+def chunk_owner(chunk_id: str) -> str:
+    """cv_id của một đoạn (cv_id có thể chứa "#", số thứ tự đoạn thì không)."""
+    return chunk_id.rsplit(CHUNK_ID_SEPARATOR, 1)[0]
+
+
+class MultiVectorSearchEngine(ExactSearchEngine):
+    """
+    Tìm top-k ứng viên trên chỉ mục nhiều vector (mỗi mục/đoạn highlights của
+    CV một vector, id dạng chunk_id()). Điểm của một ứng viên gộp từ điểm các
+    đoạn của họ:
+    - "max": điểm của đoạn khớp nhất;
+    - "mean_top": trung bình top_n đoạn khớp nhất (CV ít đoạn hơn thì lấy hết).
+    Các đoạn còn sống được xếp sẵn thành bảng (số CV, số đoạn nhiều nhất) chỉ số
+    hàng, nên việc gộp cho một hay nhiều truy vấn chỉ là một phép gather +
+    max/partition. CV sở hữu mỗi hàng được tính một lần khi hàng được nối thêm;
+    mỗi snapshot chỉ dựng lại bảng từ mảng số nguyên đó (không sao chép ma trận).
+    """
+
+    name = "multivector"
+
+    def __init__(self, store, dtype=np.float32, block_rows: int = 65536,
+                 aggregate: str = MULTI_VECTOR_AGGREGATE, top_n: int = MULTI_VECTOR_TOP_N):
+        if aggregate not in ("max", "mean_top"):
+            raise ValueError(f"Cách gộp điểm không hợp lệ: {aggregate} (hỗ trợ: max, mean_top)")
+        super().__init__(store, dtype=dtype, block_rows=block_rows)
+        self.aggregate = aggregate
+        self.top_n = max(1, top_n)
+        # CV sở hữu từng hàng (-1: hàng đã xoá từ trước khi nạp), theo generation của store
+        self._owner = np.zeros(0, dtype=np.int64)
+        self._owner_rows = 0
+        self._owner_generation = None
+        self._cv_ids = []
+        self._cv_row_of = {}
+
+    def _owners(self, view):
+        if self._owner_generation != view.generation or self._owner_rows > view.rows:
+            # File vector được ghi lại: số hàng cũ mất nghĩa, tạo cấu trúc mới (snapshot cũ giữ bản cũ)
+            self._owner = np.zeros(0, dtype=np.int64)
+            self._owner_rows, self._owner_generation = 0, view.generation
+            self._cv_ids, self._cv_row_of = [], {}
+        self._owner = _grow(self._owner, view.rows, fill=-1)
+        for row in range(self._owner_rows, view.rows):
+            item_id = view.row_ids[row]
+            if item_id is None:
+                self._owner[row] = -1
+                continue
+            cv_id = chunk_owner(item_id)
+            c = self._cv_row_of.get(cv_id)
+            if c is None:
+                c = self._cv_row_of[cv_id] = len(self._cv_ids)
+                self._cv_ids.append(cv_id)
+            self._owner[row] = c
+        self._owner_rows = view.rows
+        return self._owner[:view.rows]
+
+    def _make_snapshot(self, view, matrix):
+        # Nhóm các hàng còn sống theo CV: layout[c, j] là hàng của đoạn thứ j của CV c,
+        # ô thừa trỏ tới cột -inf thêm vào cuối mảng điểm
+        base = super()._make_snapshot(view, matrix)
+        live = np.flatnonzero(view.alive)
+        owner = self._owners(view)[live]
+        n_cv = len(self._cv_ids)
+        order = np.argsort(owner, kind="stable")
+        sizes = np.bincount(owner, minlength=n_cv)
+        width = max(int(sizes.max()), 1) if sizes.size else 1
+        layout = np.full((n_cv, width), view.rows, dtype=np.int64)
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1])) if sizes.size else sizes
+        slot = np.arange(len(live)) - np.repeat(starts, sizes)
+        layout[owner[order], slot] = live[order]
+        return MultiVectorSnapshot(*base, self._cv_ids, self._cv_row_of, layout, int(np.count_nonzero(sizes)))
+
+    def __len__(self):
+        return self._refresh().live_cvs
+
+    def _aggregate(self, snapshot, scores, cvs=None):
+        """Điểm chunk (m, n_chunks) → điểm ứng viên (m, n_cv) cho các CV cvs (mặc định tất cả)."""
+        padded = np.concatenate([scores, np.full((scores.shape[0], 1), -np.inf, dtype=scores.dtype)], axis=1)
+        layout = snapshot.layout if cvs is None else snapshot.layout[cvs]
+        grouped = padded[:, layout]
+        if self.aggregate == "max" or grouped.shape[2] == 1:
+            return grouped.max(axis=2)
+        n = min(self.top_n, grouped.shape[2])
+        if n < grouped.shape[2]:
+            grouped = -np.partition(-grouped, n - 1, axis=2)[:, :, :n]
+        finite = np.isfinite(grouped)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(finite, grouped, 0).sum(axis=2) / finite.sum(axis=2)
+        return np.where(finite.any(axis=2), mean, -np.inf)
+
+    @staticmethod
+    def _allowed_rows(snapshot, allowed_ids):
+        n_cv = snapshot.layout.shape[0]
+        rows = (snapshot.cv_row_of.get(i) for i in allowed_ids)
+        return np.fromiter((c for c in rows if c is not None and c < n_cv), dtype=np.int64)
+
+    def search(self, query_vector, top_k: int = 3, allowed_ids=None):
+        """Top-k (cv_id, score) cho một truy vấn. allowed_ids: chỉ xét các CV trong tập này."""
+        return self.search_batch([query_vector], top_k, None if allowed_ids is None else [allowed_ids])[0]
+
+    def search_batch(self, query_vectors, top_k: int = 3, allowed_ids_list=None):
+        """Top-k ứng viên cho nhiều truy vấn: một phép nhân ma trận, gộp điểm vector hoá."""
+        snapshot = self._refresh()
+        queries = _normalize_rows(query_vectors)
+        if not snapshot.live_cvs:
+            return [[] for _ in range(queries.shape[0])]
+        cv_scores = self._aggregate(snapshot, self._scores(snapshot, queries))
+        results = []
+        for qi in range(queries.shape[0]):
+            scores = cv_scores[qi]
+            allowed_ids = allowed_ids_list[qi] if allowed_ids_list is not None else None
+            if allowed_ids is not None:
+                rows = self._allowed_rows(snapshot, allowed_ids)
+                results.append([(snapshot.cv_ids[rows[i]], float(scores[rows[i]]))
+                                for i in _top_k(scores[rows], top_k) if np.isfinite(scores[rows[i]])])
+                continue
+            results.append([(snapshot.cv_ids[i], float(scores[i]))
+                            for i in _top_k(scores, top_k) if np.isfinite(scores[i])])
+        return results
+
+
+# ==============================================================================
+# BACKEND LLAMAINDEX: GIỮ LẠI ĐƯỜNG CŨ, DÙNG VECTOR ĐÃ LƯU (KHÔNG EMBED LẠI)
+# ==============================================================================
+class LlamaIndexSearchEngine:
+    """
+    Dựng VectorStoreIndex của LlamaIndex từ các vector đã lưu trong VectorStore
+    (không gọi lại API embedding). Khi VectorStore thay đổi chỉ thêm node cho các
+    hàng mới và xoá node của các hàng vừa bị xoá; chỉ dựng lại toàn bộ khi file
+    vector được ghi lại (compact).
+    """
+
+    name = "llamaindex"
+
+    def __init__(self, store):
+        self.store = store
+        self._version = None
+        self._index = None
+        self._generation = None
+        self._rows = 0
+        self._alive = np.zeros(0, dtype=bool)
+        # Chỉ mục LlamaIndex bị sửa tại chỗ: không tìm kiếm trong lúc đang cập nhật
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _nodes(view, rows):
+        from llama_index.core.schema import TextNode
+
+        return [TextNode(id_=view.row_ids[row], text=view.row_ids[row],
+                         embedding=np.asarray(view.matrix[row], dtype=np.float32).tolist()) for row in rows]
+
+    def _refresh(self):
+        if self._version == self.store.version and self._index is not None:
+            return
+        from llama_index.core import VectorStoreIndex
+        from llama_index.core.embeddings import MockEmbedding
+
+        view = self.store.view()
+        if self._index is None or self._generation != view.generation or self._rows > view.rows:
+            # Các node đã có embedding nên MockEmbedding không bao giờ được gọi
+            self._index = VectorStoreIndex(self._nodes(view, np.flatnonzero(view.alive)),
+                                           embed_model=MockEmbedding(embed_dim=self.store.dim or 1))
+        else:
+            removed = np.flatnonzero(self._alive & ~view.alive[:self._rows])
+            if removed.size:
+                self._index.delete_nodes([view.row_ids[row] for row in removed], delete_from_docstore=True)
+            added = self._rows + np.flatnonzero(view.alive[self._rows:])
+            if added.size:
+                self._index.insert_nodes(self._nodes(view, added))
+        self._generation, self._rows, self._alive = view.generation, view.rows, view.alive
+        self._version = view.version
+
+    def search(self, query_vector, top_k: int = 3, allowed_ids=None):
+        from llama_index.core import QueryBundle
+
+        with self._lock:
+            self._refresh()
+            if not len(self.store):
+                return []
+            node_ids = list(allowed_ids) if allowed_ids is not None else None
+            if node_ids is not None and not node_ids:
+                return []
+            retriever = self._index.as_retriever(similarity_top_k=top_k, node_ids=node_ids)
+            query = QueryBundle(query_str="", embedding=_normalize_rows(query_vector)[0].tolist())
+            return [(node.node.node_id, node.get_score()) for node in retriever.retrieve(query)]
+
+    def search_batch(self, query_vectors, top_k: int = 3, allowed_ids_list=None):
+        allowed_ids_list = allowed_ids_list or [None] * len(query_vectors)
+        return [self.search(q, top_k, allowed) for q, allowed in zip(query_vectors, allowed_ids_list)]
+
+
+SEARCH_BACKENDS = {
+    ExactSearchEngine.name: ExactSearchEngine,
+    LlamaIndexSearchEngine.name: LlamaIndexSearchEngine,
+    MultiVectorSearchEngine.name: MultiVectorSearchEngine,
+}
+
+
+def make_search_engine(backend: str, store, **kwargs):
+    """Tạo search engine theo tên backend ("numpy", "llamaindex" hoặc "multivector")."""
+    try:
+        engine_cls = SEARCH_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Backend tìm kiếm không hợp lệ: {backend} (hỗ trợ: {', '.join(SEARCH_BACKENDS)})")
+    return engine_cls(store, **kwargs)
@@ -0,0 +1,212 @@
+# skill_index.py
+
+import bisect
+import re
+from collections import namedtuple
+
+# Một số cách viết khác nhau của cùng một kỹ năng
+SKILL_ALIASES = {
+    "nodejs": "node.js",
+    "node": "node.js",
+    "reactjs": "react.js",
+    "react": "react.js",
+    "nextjs": "next.js",
+    "expressjs": "express.js",
+    "express": "express.js",
+    "vuejs": "vue.js",
+    "js": "javascript",
+    "ts": "typescript",
+    "golang": "go",
+    "postgres": "postgresql",
+    "k8s": "kubernetes",
+    "amazon web services": "aws",
+    "rest api": "restful api",
+    "restful apis": "restful api",
+    "rest apis": "restful api",
+}
+
+# Tên ngôn ngữ tiếng Việt → tên chuẩn (CV đã được parse sang tiếng Anh)
+LANGUAGE_ALIASES = {
+    "tiếng anh": "english",
+    "tiếng nhật": "japanese",
+    "tiếng hàn": "korean",
+    "tiếng trung": "chinese",
+    "tiếng pháp": "french",
+    "tiếng đức": "german",
+    "tiếng việt": "vietnamese",
+}
+
+YEARS_PATTERN = re.compile(
+    r"(?:≥|>=|at least|minimum|min\.?|ít nhất|tối thiểu|trên|hơn)?\s*"
+    r"(\d+(?:[.,]\d+)?)\s*\+?\s*(?:years?|yrs?|năm)\b",
+    re.IGNORECASE,
+)
+# Số năm chỉ là yêu cầu kinh nghiệm khi cùng dòng có từ khoá này ("hơn 10 năm phát triển" của công ty thì không)
+EXPERIENCE_PATTERN = re.compile(r"kinh nghiệm|experience|\bexp\b", re.IGNORECASE)
+REQUIRED_MARKERS = ("bắt buộc", "required", "must have", "must-have", "mandatory")
+
+# Yêu cầu cứng trích từ JD:
+# - min_years: số năm kinh nghiệm tối thiểu (0 nếu không có)
+# - required_skills: các kỹ năng bắt buộc phải có
+# - any_of_skills: danh sách các nhóm kỹ năng liệt kê cùng nhau, mỗi nhóm cần ít nhất một kỹ năng
+# - required_languages: ngoại ngữ bắt buộc
+Requirements = namedtuple("Requirements", ["min_years", "required_skills", "any_of_skills", "required_languages"])
+
+
+def normalize_skill(skill: str) -> str:
+    term = re.sub(r"\s+", " ", str(skill).strip().lower())
+    return SKILL_ALIASES.get(term, term)
+
+
+def normalize_language(language: str) -> str:
+    # "English - C1" / "English (IELTS 7.0)" → "english"
+    term = re.split(r"\s[-–:(]|\(", str(language).strip().lower(), maxsplit=1)[0].strip()
+    return LANGUAGE_ALIASES.get(term, term)
+
+
+def total_experience_years(cv_data: dict) -> float:
+    total = 0.0
+    for exp in cv_data.get("experiences", []):
+        try:
+            total += float(exp.get("years", 0.0) or 0.0)
+        except (TypeError, ValueError):
+            continue
+    return round(total, 2)
+
+
+def _term_pattern(terms):
+    # Khớp nguyên từ, kể cả kỹ năng có ký tự đặc biệt như "c++", "c#", "node.js"
+    alternation = "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True))
+    return re.compile(rf"(?<![\w+#.])(?:{alternation})(?![\w+#])", re.IGNORECASE)
+
+
+# ==============================================================================
+# CHỈ MỤC NGƯỢC KỸ NĂNG / NGÔN NGỮ + MẢNG SỐ NĂM KINH NGHIỆM ĐÃ SẮP XẾP
+# ==============================================================================
+class SkillIndex:
+    """
+    Chỉ mục trong bộ nhớ trên các trường có cấu trúc do validate_json sinh ra:
+    - skill → tập id CV, language → tập id CV (đã chuẩn hoá)
+    - mảng tổng số năm kinh nghiệm đã sắp xếp, tra cứu "≥ N năm" bằng bisect
+    Dùng để loại các CV không đạt yêu cầu cứng của JD trước khi tính vector.
+    """
+
+    def __init__(self, cv_database=()):
+        self.skills = {}
+        self.languages = {}
+        self._years = []
+        self._year_ids = []
+        self._skill_pattern = None
+        self._alias_pattern = None
+        self._language_pattern = None
+        self.build(cv_database)
+
+    def build(self, cv_database):
+        self.skills.clear()
+        self.languages.clear()
+        pairs = []
+        for cv in cv_database:
+            cv_id = cv["id"]
+            for skill in cv.get("skills", []):
+                self.skills.setdefault(normalize_skill(skill), set()).add(cv_id)
+            for language in cv.get("languages", []):
+                self.languages.setdefault(normalize_language(language), set()).add(cv_id)
+            pairs.append((total_experience_years(cv), cv_id))
+        pairs.sort()
+        self._years = [years for years, _ in pairs]
+        self._year_ids = [cv_id for _, cv_id in pairs]
+        self._skill_pattern = _term_pattern(self.skills) if self.skills else None
+        self._alias_pattern = _term_pattern(SKILL_ALIASES)
+        self._language_pattern = _term_pattern(set(self.languages) | set(LANGUAGE_ALIASES)) if self.languages else None
+
+    def __len__(self):
+        return len(self._year_ids)
+
+    # --------------------------------------------------------------------------
+    # Tra cứu
+    # --------------------------------------------------------------------------
+    def with_skill(self, skill: str) -> set:
+        return self.skills.get(normalize_skill(skill), set())
+
+    def with_language(self, language: str) -> set:
+        return self.languages.get(normalize_language(language), set())
+
+    def with_min_years(self, min_years: float) -> set:
+        start = bisect.bisect_left(self._years, min_years)
+        return set(self._year_ids[start:])
+
+    # --------------------------------------------------------------------------
+    # Yêu cầu cứng từ JD
+    # --------------------------------------------------------------------------
+    def _skills_in(self, text: str) -> list:
+        found = []
+        for pattern in (self._skill_pattern, self._alias_pattern):
+            if pattern is None:
+                continue
+            for match in pattern.finditer(text):
+                skill = normalize_skill(match.group(0))
+                if skill in self.skills and skill not in found:
+                    found.append(skill)
+        return found
+
+    def mentioned_skills(self, text: str) -> set:
+        """Các kỹ năng (đã chuẩn hoá, có trong chỉ mục) được nhắc tới trong text, bắt buộc hay không."""
+        return set(self._skills_in(text))
+
+    def parse_requirements(self, jd_text: str) -> Requirements:
+        """
+        Trích yêu cầu cứng từ JD, theo từng dòng/câu:
+        - Dòng có số năm kèm từ "kinh nghiệm"/"experience" ("≥4 years experience
+          in Python", "Ít nhất 4 năm kinh nghiệm với Python") đặt min_years và coi
+          các kỹ năng trong dòng đó là yêu cầu.
+        - Dòng có từ khoá bắt buộc ("bắt buộc", "required", "must have") cũng vậy.
+        - Dòng yêu cầu chỉ có một kỹ năng thì kỹ năng đó bắt buộc; nhiều kỹ năng liệt
+          kê cùng nhau ("3+ năm kinh nghiệm với Python, Docker, AWS") thành một nhóm
+          chỉ cần một, vì JD thường liệt kê công nghệ chứ không đòi đủ tất cả.
+        Kỹ năng chỉ được nhắc tới (không bắt buộc) không dùng để lọc mà chỉ dùng để
+        chấm điểm. Vì CV chỉ có tổng số năm kinh nghiệm, "4 năm kinh nghiệm Python"
+        được hiểu là có Python và ≥ 4 năm.
+        """
+        min_years = 0.0
+        required, any_of, languages = set(), [], set()
+        for line in re.split(r"[\n;]|(?<=[.!?])\s", jd_text):
+            lowered = line.lower()
+            years_match = YEARS_PATTERN.search(lowered) if EXPERIENCE_PATTERN.search(lowered) else None
+            is_hard = years_match is not None or any(m in lowered for m in REQUIRED_MARKERS)
+            if not is_hard:
+                continue
+            if years_match:
+                min_years = max(min_years, float(years_match.group(1).replace(",", ".")))
+            skills = self._skills_in(line)
+            if len(skills) > 1:
+                any_of.append(set(skills))
+            else:
+                required.update(skills)
+            if self._language_pattern is not None:
+                for match in self._language_pattern.finditer(line):
+                    languages.add(normalize_language(match.group(0)))
+        return Requirements(min_years, required, any_of, languages)
+
+    def filter(self, requirements: Requirements):
+        """
+        Tập id CV đạt mọi yêu cầu cứng, hoặc None nếu JD không có yêu cầu cứng nào
+        (khi đó không lọc). Các tập được giao nhau từ nhỏ đến lớn.
+        """
+        candidate_sets = []
+        if requirements.min_years > 0:
+            candidate_sets.append(self.with_min_years(requirements.min_years))
+        for skill in requirements.required_skills:
+            candidate_sets.append(self.with_skill(skill))
+        for group in requirements.any_of_skills:
+            candidate_sets.append(set().union(*(self.with_skill(s) for s in group)))
+        for language in requirements.required_languages:
+            candidate_sets.append(self.with_language(language))
+        if not candidate_sets:
+            return None
+        candidate_sets.sort(key=len)
+        result = set(candidate_sets[0])
+        for ids in candidate_sets[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
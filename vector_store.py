@@ -0,0 +1,297 @@
+# vector_store.py
+
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from search_engine import ExactSearchEngine
+
+DEFAULT_STORE_DIR = os.path.join(".cache", "vector_index")
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.json"
+# Tỉ lệ hàng đã xoá (tombstone) tối đa trước khi ghi lại file vector chỉ với hàng còn sống
+COMPACT_RATIO = 0.25
+
+# Ảnh chụp trạng thái chỉ mục cho search engine, lấy dưới khoá mà không sao chép ma trận:
+# - generation: tăng khi file vector được ghi lại (compact / dựng lại), số hàng cũ mất nghĩa
+# - version: store.version lúc chụp
+# - rows: số hàng đã dùng (kể cả hàng đã xoá); các hàng < rows không bao giờ bị ghi đè
+# - matrix: view (rows, dim) của ma trận memory-mapped
+# - row_ids: id theo hàng (list chỉ được nối thêm, chỉ đọc tới rows)
+# - alive: mảng bool (rows,) đánh dấu hàng còn sống
+# - row_of: id → hàng còn sống
+StoreView = namedtuple("StoreView", ["generation", "version", "rows", "matrix", "row_ids", "alive", "row_of"])
+
+
+def text_fingerprint(text: str, model: str) -> str:
+    """Dấu vân tay của nội dung embedding: đổi text hoặc đổi model thì phải embed lại."""
+    return hashlib.sha256(f"{model}|{text}".encode("utf-8")).hexdigest()
+
+
+# ==============================================================================
+# CHỈ MỤC VECTOR LƯU TRÊN ĐĨA (MEMORY-MAPPED FLOAT32 + FILE METADATA)
+# ==============================================================================
+class VectorStore:
+    """
+    Lưu embedding (đã chuẩn hoá L2) của các CV trong một ma trận float32
+    memory-mapped, kèm file meta.json chứa id, fingerprint và thông tin model.
+    Mỗi lần sync chỉ embed lại những CV có nội dung thay đổi, xoá những CV
+    không còn trong thư mục, và trả lời truy vấn top-k trực tiếp từ ma trận.
+    Ma trận chỉ được nối thêm: xoá hay embed lại một CV chỉ đánh dấu hàng cũ là
+    đã xoá (tombstone) và thêm hàng mới, nên search engine tìm trên view() mà
+    không cần sao chép ma trận. Khi hàng đã xoá vượt COMPACT_RATIO, các hàng còn
+    sống được ghi sang file mới (các view cũ vẫn đọc file cũ).
+    """
+
+    def __init__(self, store_dir: str = DEFAULT_STORE_DIR, model: str = ""):
+        self.store_dir = store_dir
+        self.model = model
+        self.dim = 0
+        self._row_ids = []
+        self._fingerprints = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._rows = 0
+        self._row_of = {}
+        self._vectors = None
+        self._vectors_file = VECTORS_FILE
+        # Tăng mỗi khi ma trận thay đổi, để search engine biết cần nạp lại
+        self.version = 0
+        self.generation = 0
+        self._engine = None
+        # Nhiều worker của bot có thể sync/query cùng lúc
+        self._lock = threading.RLock()
+        self._load()
+
+    # --------------------------------------------------------------------------
+    # Đọc / ghi trạng thái
+    # --------------------------------------------------------------------------
+    def _path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def _load(self):
+        try:
+            with open(self._path(META_FILE), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        # Model embedding khác thì vector cũ không dùng được nữa
+        if self.model and meta.get("model") != self.model:
+            return
+        self.model = meta.get("model", self.model)
+        self.dim = meta.get("dim", 0)
+        self.generation = meta.get("generation", 0)
+        self._vectors_file = meta.get("vectors_file", VECTORS_FILE)
+        # Hàng đã xoá được lưu với id null
+        row_ids = meta.get("ids", [])
+        fingerprints = meta.get("fingerprints", [])
+        if row_ids and self.dim:
+            vectors_path = self._path(self._vectors_file)
+            capacity = os.path.getsize(vectors_path) // (4 * self.dim) if os.path.exists(vectors_path) else 0
+            if capacity < len(row_ids):
+                # File vector bị mất hoặc bị cắt cụt (ví dụ crash giữa chừng): dựng lại từ đầu
+                return
+            self._vectors = np.memmap(self._path(self._vectors_file), dtype=np.float32,
+                                      mode="r+", shape=(capacity, self.dim))
+            self._alive = np.zeros(capacity, dtype=bool)
+        self._row_ids, self._fingerprints = row_ids, fingerprints
+        self._rows = len(row_ids)
+        for row, cv_id in enumerate(row_ids):
+            if cv_id is not None:
+                self._alive[row] = True
+                self._row_of[cv_id] = row
+
+    def _save_meta(self):
+        if self._vectors is not None:
+            self._vectors.flush()
+        meta = {
+            "model": self.model,
+            "dim": self.dim,
+            "generation": self.generation,
+            "vectors_file": self._vectors_file,
+            "ids": [cv_id if alive else None for cv_id, alive in zip(self._row_ids, self._alive[:self._rows])],
+            "fingerprints": self._fingerprints,
+        }
+        tmp_path = self._path(META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(META_FILE))
+
+    def _ensure_capacity(self, rows: int):
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, 64)
+        os.makedirs(self.store_dir, exist_ok=True)
+        if self._vectors is not None:
+            self._vectors.flush()
+        with open(self._path(self._vectors_file), "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        # Các view đang dùng giữ memmap cũ (vẫn trỏ tới phần đầu của cùng file)
+        self._vectors = np.memmap(self._path(self._vectors_file), dtype=np.float32,
+                                  mode="r+", shape=(new_capacity, self.dim))
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:self._rows] = self._alive[:self._rows]
+        self._alive = alive
+
+    def compact(self):
+        """Ghi các hàng còn sống sang file vector mới (file cũ được giữ tới khi không còn view nào đọc)."""
+        with self._lock:
+            live = np.flatnonzero(self._alive[:self._rows])
+            old_file = self._vectors_file
+            self.generation += 1
+            self._vectors_file = f"vectors-{self.generation}.f32"
+            capacity = max(len(live), 64)
+            with open(self._path(self._vectors_file), "wb") as f:
+                f.truncate(capacity * self.dim * 4)
+            vectors = np.memmap(self._path(self._vectors_file), dtype=np.float32,
+                                mode="r+", shape=(capacity, self.dim))
+            for start in range(0, len(live), 65536):
+                rows = live[start:start + 65536]
+                vectors[start:start + len(rows)] = self._vectors[rows]
+            self._row_ids = [self._row_ids[row] for row in live]
+            self._fingerprints = [self._fingerprints[row] for row in live]
+            self._rows = len(live)
+            self._alive = np.zeros(capacity, dtype=bool)
+            self._alive[:self._rows] = True
+            self._row_of = {cv_id: row for row, cv_id in enumerate(self._row_ids)}
+            self._vectors = vectors
+            self.version += 1
+            self._save_meta()
+            try:
+                os.remove(self._path(old_file))
+            except OSError:
+                # Ví dụ Windows không cho xoá file còn đang được map; lần compact sau bỏ qua nó
+                pass
+
+    # --------------------------------------------------------------------------
+    # Thêm / thay thế / xoá
+    # --------------------------------------------------------------------------
+    @property
+    def ids(self):
+        """Id của các CV đang có trong chỉ mục."""
+        return list(self._row_of)
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def __contains__(self, cv_id):
+        return cv_id in self._row_of
+
+    def fingerprint(self, cv_id: str):
+        row = self._row_of.get(cv_id)
+        return None if row is None else self._fingerprints[row]
+
+    def upsert(self, cv_id: str, vector, fingerprint: str = ""):
+        vec = np.asarray(vector, dtype=np.float32).ravel()
+        if not self.dim:
+            self.dim = vec.shape[0]
+        if vec.shape[0] != self.dim:
+            raise ValueError(f"Vector có {vec.shape[0]} chiều, chỉ mục yêu cầu {self.dim}")
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec = vec / norm
+        # Không ghi đè hàng cũ (có thể đang được tìm kiếm): xoá rồi nối hàng mới
+        self._tombstone(cv_id)
+        row = self._rows
+        self._ensure_capacity(row + 1)
+        self._vectors[row] = vec
+        self._row_ids.append(cv_id)
+        self._fingerprints.append(fingerprint)
+        self._alive[row] = True
+        self._row_of[cv_id] = row
+        self._rows += 1
+        self.version += 1
+
+    def _tombstone(self, cv_id: str) -> bool:
+        row = self._row_of.pop(cv_id, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        return True
+
+    def delete(self, cv_id: str) -> bool:
+        if not self._tombstone(cv_id):
+            return False
+        self.version += 1
+        return True
+
+    def sync(self, items, embed_batch_fn) -> dict:
+        """
+        Đồng bộ chỉ mục với tập CV hiện tại.
+        items: danh sách (cv_id, embedding_text).
+        embed_batch_fn: hàm nhận list[str] và trả về list vector tương ứng.
+        Chỉ những CV mới hoặc có nội dung thay đổi mới được embed lại.
+        """
+        with self._lock:
+            return self._sync(items, embed_batch_fn)
+
+    def update(self, items, embed_batch_fn, deleted=()) -> dict:
+        """
+        Cập nhật tăng dần (dùng với cv_watcher): embed lại các CV trong items
+        (cv_id, embedding_text) có nội dung thay đổi và xoá các id trong deleted.
+        Những CV không được nhắc tới giữ nguyên, kể cả khi không có trong items.
+        """
+        with self._lock:
+            return self._update(items, embed_batch_fn, deleted)
+
+    def _sync(self, items, embed_batch_fn) -> dict:
+        items = list(items)
+        current = {cv_id for cv_id, _ in items}
+        removed = [cv_id for cv_id in self._row_of if cv_id not in current]
+        return self._update(items, embed_batch_fn, removed)
+
+    def _update(self, items, embed_batch_fn, deleted) -> dict:
+        current = {}
+        for cv_id, text in items:
+            current[cv_id] = (text, text_fingerprint(text, self.model))
+
+        removed = [cv_id for cv_id in deleted if cv_id not in current and self.delete(cv_id)]
+
+        pending = [(cv_id, text, fp) for cv_id, (text, fp) in current.items() if self.fingerprint(cv_id) != fp]
+
+        added = sum(1 for cv_id, _, _ in pending if cv_id not in self._row_of)
+        if pending:
+            vectors = embed_batch_fn([text for _, text, _ in pending])
+            for (cv_id, _, fp), vec in zip(pending, vectors):
+                self.upsert(cv_id, vec, fp)
+
+        if pending or removed:
+            if self._rows - len(self._row_of) > COMPACT_RATIO * max(1, self._rows):
+                self.compact()
+            else:
+                self._save_meta()
+        return {"added": added, "updated": len(pending) - added, "deleted": len(removed)}
+
+    # --------------------------------------------------------------------------
+    # Truy vấn
+    # --------------------------------------------------------------------------
+    def view(self) -> StoreView:
+        """Ảnh chụp trạng thái hiện tại (StoreView) mà không sao chép ma trận."""
+        with self._lock:
+            if self._vectors is None:
+                matrix = np.zeros((0, self.dim), dtype=np.float32)
+            else:
+                matrix = self._vectors[:self._rows]
+            return StoreView(self.generation, self.version, self._rows, matrix, self._row_ids,
+                             self._alive[:self._rows].copy(), dict(self._row_of))
+
+    def matrix(self):
+        """Ma trận embedding (n, dim) của các CV đang có, theo thứ tự ids (bản sao; tìm kiếm thì dùng view())."""
+        with self._lock:
+            if self._vectors is None or not self._row_of:
+                return np.zeros((0, self.dim), dtype=np.float32)
+            return self._vectors[np.fromiter(self._row_of.values(), dtype=np.int64, count=len(self._row_of))]
+
+    def query(self, query_vector, top_k: int = 3, allowed_ids=None):
+        """
+        Trả về danh sách (cv_id, cosine_score) của top-k CV gần nhất.
+        allowed_ids: nếu có, chỉ tính điểm cho các CV trong tập này (kết quả pre-filter).
+        """
+        with self._lock:
+            if self._engine is None:
+                self._engine = ExactSearchEngine(self)
+        return self._engine.search(query_vector, top_k, allowed_ids)